@@ -0,0 +1,755 @@
+import os
+import sys
+import time
+import datetime as dt
+import multiprocessing
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+import pandas as pd
+
+from package.profiling_functions import process_memory
+
+
+# Процессы замеров запускаются через spawn: память процесса не включает данные текущего процесса
+CONTEXT = multiprocessing.get_context('spawn')
+
+
+# Колонки синтетических датасетов: генератор значений колонки по генератору случайных чисел и количеству строк.
+# Строковые значения выбираются из небольших словарей, поэтому строки в колонках переиспользуются
+def _choice(values):
+    values = np.array(values, dtype=object)
+    return lambda rng, n_rows: values[rng.integers(0, len(values), n_rows)]
+
+
+DATES = list(pd.date_range('2021-05-19', '2021-12-31').strftime('%Y-%m-%d'))
+COLUMNS = {
+           'utm_source': _choice(['ZpYIoDJMcFzVoPFsHGJL', 'QxAxdyPLuQMEcrdZWdWb', 'fDLlAcSmythWSCVMvqvL',
+                                  'MvfHsxITijuriZxsqZqt', 'kjsLglQLzykiRbcDiGcD']),
+           'utm_medium': _choice(['banner', 'cpc', 'organic', 'referral', '(none)', 'cpm']),
+           'device_category': _choice(['mobile', 'desktop', 'tablet']),
+           'geo_city': _choice(['Moscow', 'Saint Petersburg', 'Khimki', 'Kazan', 'Yekaterinburg', '(not set)']),
+           'visit_date': _choice(DATES),
+           # Время визита в ga_sessions.csv записано без долей секунды
+           'visit_time': _choice([f'{s // 3600:02d}:{s % 3600 // 60:02d}:{s % 60:02d}' for s in range(0, 86400, 7)]),
+           # Числа и строки, как client_id в ga_sessions.csv
+           'client_id': lambda rng, n_rows: np.where(rng.random(n_rows) < 0.5, rng.random(n_rows) * 1e9,
+                                                     rng.integers(0, 10 ** 9, n_rows).astype(str)).astype(object),
+           'hit_date': _choice(DATES),
+           # Время события - число наносекунд от начала визита (с дробной частью)
+           'hit_time': lambda rng, n_rows: rng.integers(0, 999_999_999, n_rows) + rng.random(n_rows),
+           'event_action': _choice(['view', 'click', 'sub_car_claim_click'])
+          }
+
+# Наборы колонок синтетических датасетов с долей пропусков в каждой колонке
+SESSIONS = {col: 0 for col in ['utm_source', 'utm_medium', 'device_category', 'geo_city', 'visit_date', 'visit_time']}
+# Объединённый датасет визитов и событий с пропусками во всех сочетаниях, которые разбирают функции
+# формирования даты и времени событий
+HITS = {'visit_date': 0.1, 'visit_time': 0.05, 'hit_date': 0.05, 'hit_time': 0.1}
+
+
+### Формирование синтетического датасета для замеров
+def sample(n_rows, columns=SESSIONS, seed=42):
+    """
+    Функция формирует синтетический датасет из колонок COLUMNS с заданной долей пропусков в каждой колонке
+
+        Параметры:
+            n_rows (int): количество строк датасета
+            columns (dict): доля пропусков для каждой колонки датасета (SESSIONS, HITS)
+            seed (int): зерно генератора случайных чисел
+        Выходные параметры (DataFrame)
+
+    """
+    rng = np.random.default_rng(seed)
+    df = pd.DataFrame({col: COLUMNS[col](rng, n_rows) for col in columns})
+    for col, share in columns.items():
+        if share:
+            df.loc[rng.random(n_rows) < share, col] = None
+    return df
+
+
+### Замер времени выполнения функции
+def timed(func, *args, **kwargs):
+    """
+    Функция выполняет func и замеряет время выполнения
+
+        Параметры:
+            func (function): замеряемая функция
+            args, kwargs: аргументы функции
+        Выходные параметры:
+            result: результат функции
+            seconds (float): время выполнения (сек.)
+
+    """
+    start = time.perf_counter()
+    result = func(*args, **kwargs)
+    return result, time.perf_counter() - start
+
+
+### Вывод таблицы замеров
+class Report:
+    """
+    Класс выводит заголовок таблицы замеров при создании и строку таблицы на каждый замер
+
+        Параметры:
+            columns (list): список кортежей (заголовок колонки, ширина колонки, формат значения);
+                            пропущенное значение (None) выводится как '-'
+
+    """
+
+    def __init__(self, columns):
+        self.columns = columns
+        header = ''.join(f'{title:<{width}}' for title, width, _ in columns).rstrip()
+        print(f'  {header}')
+        print('-' * (len(header) + 4))
+
+    def row(self, *values):
+        print('  ' + ''.join(f'{"-" if value is None else fmt.format(value):<{width}}'
+                             for value, (_, width, fmt) in zip(values, self.columns)).rstrip())
+
+
+# Запуск функции в процессах spawn: каждый процесс получает очередь последним аргументом
+# и записывает в неё один результат
+def _spawn(target, *args, n_workers=1):
+    queue = CONTEXT.Queue()
+    workers = [CONTEXT.Process(target=target, args=(*args, queue)) for _ in range(n_workers)]
+    for worker in workers:
+        worker.start()
+    results = [queue.get() for _ in workers]
+    for worker in workers:
+        worker.join()
+    return results
+
+
+### Эталонная (построчная) реализация формирования фичей из pipeline.py
+def generate_basic_features_reference(df):
+    """
+    Функция повторяет исходную построчную реализацию generate_basic_features и используется для сравнения результатов
+
+        Параметры:
+            df (DataFrame): датасет визитов
+        Выходные параметры (DataFrame)
+
+    """
+    if 'is_organic' not in df.columns:
+        df['is_organic'] = [*map(lambda x: True if x in ['organic', 'referral', '(none)'] else False,
+                                 df['utm_medium'].values)]
+    if 'is_mobile' not in df.columns:
+        df['is_mobile'] = [*map(lambda x: True if x in ['mobile'] else False,
+                                df['device_category'].values)]
+    if 'is_represented' not in df.columns:
+        df['is_represented'] = [*map(lambda x: True if x in ['Moscow', 'Saint Petersburg', 'Balashikha',
+                                                             'Khimki', 'Odintsovo', 'Vidnoye', 'Mytishchi',
+                                                             'Zheleznodorozhny', 'Domodedovo', 'Korolyov'] else False,
+                                     df['geo_city'].values)]
+    if 'is_social' not in df.columns:
+        df['is_social'] = [*map(lambda x: True if x in ['QxAxdyPLuQMEcrdZWdWb', 'MvfHsxITijuriZxsqZqt',
+                                                        'ISrKoXQCxqqYvAZICvjs', 'IZEXUFLARCUMynmHNBGo',
+                                                        'PlbkrSYoHuZBWfYjYnfw', 'gVRrcxiDQubJiljoTbGm'] else False,
+                                df['utm_source'].values)]
+
+    for col in ['is_organic', 'is_mobile', 'is_represented', 'is_social']:
+        df[col] = df[col].astype(int)
+
+    df['visit_year'] = df['visit_date'].apply(lambda x: dt.datetime.strptime(x, '%Y-%m-%d').year)
+    df['visit_month'] = df['visit_date'].apply(lambda x: dt.datetime.strptime(x, '%Y-%m-%d').month)
+    df['visit_day'] = df['visit_date'].apply(lambda x: dt.datetime.strptime(x, '%Y-%m-%d').day)
+    df['visit_weekday'] = df['visit_date'].apply(lambda x: dt.datetime.strptime(x, '%Y-%m-%d').weekday())
+    df['visit_hour'] = df['visit_time'].apply(lambda x: dt.datetime.strptime(x, '%H:%M:%S.%f').hour)
+
+    return df
+
+
+### Эталонные (построчные) реализации формирования даты и времени из prn.py
+def create_date_time_visit_reference(date, time):
+    """
+    Функция повторяет исходную построчную create_date_time_visit и используется для сравнения результатов
+
+        Параметры:
+            date (str): дата визита
+            time (str): время визита
+        Выходные параметры (str, None)
+
+    """
+    if pd.notna(date) and pd.notna(time):
+        return str(date) + ' ' + str(time)
+    elif pd.notna(date):
+        return str(date) + str(' 00:00:00')
+    else:
+        return None
+
+
+def create_date_time_ns_reference(date_time, date, ns):
+    """
+    Функция повторяет исходную построчную create_date_time_ns и используется для сравнения результатов
+
+        Параметры:
+            date_time (str): дата и время визита
+            date (str): дата события
+            ns (str): время (в наносекундах)
+        Выходные параметры (str, None)
+
+    """
+    if pd.notna(date_time) and pd.notna(ns):
+        return str(date_time) + f'{int(ns) / 1000000000:.9f}'[1:]
+    elif pd.notna(date_time):
+        return str(date_time) + '.000000000'
+    elif pd.isna(date_time) and pd.notna(date) and pd.notna(ns):
+        return str(date) + f' 00:00:0{int(ns) / 1000000000:.9f}'
+    elif pd.isna(date_time) and pd.notna(date) and pd.isna(ns):
+        return str(date) + ' 00:00:00.000000000'
+    else:
+        return None
+
+
+### Сравнение скорости формирования фичей
+def features_benchmark(sizes=(10_000, 1_000_000, 10_000_000), reference=True, seed=42):
+    """
+    Функция замеряет время формирования фичей generate_basic_features из pipeline.py и эталонной построчной
+    реализацией, проверяя совпадение сформированных колонок
+
+        Параметры:
+            sizes (tuple): размеры датасетов (в строках), на которых проводятся замеры
+            reference (bool): флаг замера эталонной реализации (на 10 млн строк она работает несколько минут)
+            seed (int): зерно генератора случайных чисел
+        Выходные параметры:
+            results (list): список кортежей (строк, время generate_basic_features в сек., время эталона в сек.)
+
+    """
+    from pipeline import generate_basic_features
+
+    results = []
+    report = Report([('Строк', 14, '{}'), ('Векторная (сек.)', 19, '{:.3f}'), ('Построчная (сек.)', 20, '{:.3f}'),
+                     ('Ускорение', 0, '{:.1f}x')])
+    for n_rows in sizes:
+        df = sample(n_rows)
+        # Время визита в базе данных записано с долями секунды
+        df['visit_time'] = df['visit_time'] + '.000000'
+
+        df_new, time_new = timed(generate_basic_features, df.copy())
+        time_ref = None
+        if reference:
+            df_ref, time_ref = timed(generate_basic_features_reference, df.copy())
+            pd.testing.assert_frame_equal(df_new, df_ref)
+
+        results.append((n_rows, time_new, time_ref))
+        report.row(n_rows, time_new, time_ref, None if time_ref is None else time_ref / time_new)
+    return results
+
+
+### Сравнение скорости упакованного леса и RandomForestClassifier
+def forest_benchmark(model_path='model.pickle', sizes=(1, 64, 4096, 1_000_000), n_threads=1, seed=42):
+    """
+    Функция замеряет время предсказания вероятностей случайным лесом из файла модели
+    и тем же лесом, упакованным в непрерывные массивы (FlatForest), проверяя совпадение результатов
+
+        Параметры:
+            model_path (str): путь к файлу модели, записанному pipeline.py
+            sizes (tuple): размеры пакетов (в записях), на которых проводятся замеры
+            n_threads (int): количество потоков упакованного леса (0 - по числу ядер)
+            seed (int): зерно генератора случайных чисел
+        Выходные параметры:
+            results (list): список кортежей (записей, время леса sklearn в сек., время упакованного леса в сек.)
+
+    """
+    import dill
+    from package.inference_functions import FlatForest
+
+    with open(model_path, 'rb') as file:
+        rf = dill.load(file)['best_model'].steps[-1][1]
+    forest = FlatForest.from_estimator(rf, n_threads=n_threads)
+    rng = np.random.default_rng(seed)
+
+    results = []
+    report = Report([('Записей', 14, '{}'), ('sklearn (сек.)', 19, '{:.4f}'), ('FlatForest (сек.)', 20, '{:.4f}'),
+                     ('Ускорение', 0, '{:.1f}x')])
+    for n_rows in sizes:
+        # Признаки модели стандартизованы, поэтому берём нормальное распределение
+        X = rng.standard_normal((n_rows, rf.n_features_in_)).astype(np.float32)
+        proba_rf, time_rf = timed(rf.predict_proba, X)
+        proba_flat, time_flat = timed(forest.predict_proba, X)
+
+        np.testing.assert_allclose(proba_flat, proba_rf, rtol=0, atol=1e-9)
+        results.append((n_rows, time_rf, time_flat))
+        report.row(n_rows, time_rf, time_flat, time_rf / time_flat)
+    return results
+
+
+def _load_worker(kind, path, barrier, seed, queue):
+    if kind == 'dill':
+        import dill
+
+        def load():
+            with open(path, 'rb') as file:
+                return dill.load(file)['best_model'].steps[-1][1]
+    else:
+        from package.inference_functions import load_bundle
+
+        def load():
+            return load_bundle(path)['best_model'].forest
+    forest, load_time = timed(load)
+
+    # Прогреваем модель, чтобы в память были подняты используемые страницы массивов
+    # (пакет не больше small_batch: спуск по отображённым в память массивам, без копии деревьев для sklearn)
+    from package.inference_functions import FlatForest
+    X = np.random.default_rng(seed).standard_normal((FlatForest.small_batch, 21)).astype(np.float32)
+    forest.predict_proba(X)
+    # Память замеряется, когда все процессы загрузили модель и делят страницы кэша
+    barrier.wait()
+    queue.put((load_time, process_memory()))
+    barrier.wait()
+
+
+### Сравнение времени загрузки и памяти процессов для модели dill и каталога модели
+def bundle_benchmark(pickle_path='model.pickle', bundle_path='model_bundle', n_workers=4, seed=42):
+    """
+    Функция запускает n_workers процессов, загружающих модель из файла dill и из каталога модели
+    (с отображением массивов в память), и выводит время загрузки и память на процесс
+
+        Параметры:
+            pickle_path (str): путь к файлу модели в формате dill
+            bundle_path (str): путь к каталогу модели
+            n_workers (int): количество одновременно работающих процессов
+            seed (int): зерно генератора случайных чисел
+        Выходные параметры:
+            results (dict): для каждого формата - среднее время загрузки (сек.) и средняя память процесса (МБ)
+
+    """
+    results = {}
+    report = Report([('Формат', 11, '{}'), ('Загрузка (сек.)', 18, '{:.3f}'), ('RSS (МБ)', 11, '{:.1f}'),
+                     ('PSS (МБ)', 11, '{:.1f}'), ('Частная (МБ)', 0, '{:.1f}')])
+    for kind, path in (('dill', pickle_path), ('bundle', bundle_path)):
+        measures = _spawn(_load_worker, kind, path, CONTEXT.Barrier(n_workers), seed, n_workers=n_workers)
+        load_time = sum(measure[0] for measure in measures) / n_workers
+        memory = {key: sum(measure[1][key] for measure in measures) / n_workers
+                  for key in ('rss', 'pss', 'private')}
+        results[kind] = {'load_time': load_time, **memory}
+        report.row(kind, load_time, memory['rss'], memory['pss'], memory['private'])
+    return results
+
+
+def _send_requests(port, path, body, n_requests):
+    import http.client
+
+    connection = http.client.HTTPConnection('127.0.0.1', port)
+    latencies = []
+    for _ in range(n_requests):
+        start = time.perf_counter()
+        connection.request('POST', path, body, {'Content-Type': 'application/json'})
+        response = connection.getresponse()
+        response.read()
+        assert response.status == 200, f'Сервис ответил {response.status}'
+        latencies.append(time.perf_counter() - start)
+    connection.close()
+    return latencies
+
+
+### Сравнение пропускной способности сервиса при разном количестве процессов
+def service_benchmark(workers=(1, 2, 4), main_path='main.py', sample_path='data_1.json', n_requests=2000,
+                      concurrency=16, batch_size=1, port=8765, timeout=120):
+    """
+    Функция запускает сервис (python main.py --workers N) с разным количеством процессов,
+    нагружает его параллельными запросами и выводит пропускную способность и память процессов сервиса
+
+        Параметры:
+            workers (tuple): количество процессов сервиса, для которых проводятся замеры
+            main_path (str): путь к main.py (сервис запускается в каталоге этого файла)
+            sample_path (str): JSON-файл с записями визитов для запросов
+            n_requests (int): общее количество запросов
+            concurrency (int): количество одновременно работающих клиентов
+            batch_size (int): записей в запросе (1 - запросы /predict, больше - запросы /predict_batch)
+            port (int): порт сервиса
+            timeout (float): максимальное время ожидания готовности сервиса (сек.)
+        Выходные параметры:
+            results (list): список словарей с замерами для каждого количества процессов
+
+    """
+    import json
+    import subprocess
+    import urllib.request
+    from concurrent.futures import ThreadPoolExecutor
+
+    with open(sample_path, encoding='utf-8') as file:
+        records = json.load(file)
+    if batch_size == 1:
+        path, body = '/predict', json.dumps(records[0])
+    else:
+        path, body = '/predict_batch', json.dumps((records * batch_size)[:batch_size])
+    url = f'http://127.0.0.1:{port}'
+
+    def load():
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            parts = executor.map(_send_requests, [port] * concurrency, [path] * concurrency,
+                                 [body] * concurrency, [n_requests // concurrency] * concurrency)
+            return sorted(latency for part in parts for latency in part)
+
+    results = []
+    report = Report([('Процессов', 12, '{}'), ('Записей/сек.', 15, '{:.1f}'), ('Ускорение', 12, '{:.2f}'),
+                     ('p50 (мс)', 11, '{:.2f}'), ('p99 (мс)', 11, '{:.2f}'), ('RSS (МБ)', 11, '{:.1f}'),
+                     ('Общая (МБ)', 13, '{:.1f}'), ('Частная (МБ)', 0, '{:.1f}')])
+    for n_workers in workers:
+        service = subprocess.Popen([sys.executable, os.path.basename(main_path), '--port', str(port),
+                                    '--workers', str(n_workers)],
+                                   cwd=os.path.dirname(os.path.abspath(main_path)),
+                                   stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        try:
+            deadline = time.monotonic() + timeout
+            while True:
+                try:
+                    with urllib.request.urlopen(f'{url}/ready') as response:
+                        if response.status == 200:
+                            break
+                except OSError:
+                    if service.poll() is not None or time.monotonic() > deadline:
+                        raise RuntimeError('Сервис не запустился')
+                    time.sleep(0.1)
+
+            latencies, seconds = timed(load)
+
+            # Запросы /metrics попадают в случайные процессы - собираем память каждого процесса по pid
+            memory = {}
+            for _ in range(20 * n_workers):
+                with urllib.request.urlopen(f'{url}/metrics') as response:
+                    process = json.load(response)['process']
+                memory[process['pid']] = process['memory']
+                if len(memory) == n_workers:
+                    break
+        finally:
+            service.terminate()
+            service.wait()
+
+        throughput = len(latencies) * batch_size / seconds
+        result = {'workers': n_workers, 'throughput': throughput,
+                  'speedup': throughput / results[0]['throughput'] if results else 1.0,
+                  'p50_ms': latencies[len(latencies) // 2] * 1000,
+                  'p99_ms': latencies[min(int(len(latencies) * 0.99), len(latencies) - 1)] * 1000,
+                  **{key: sum(value[key] for value in memory.values()) / len(memory)
+                     for key in ('rss', 'shared', 'private')}}
+        results.append(result)
+        report.row(*result.values())
+    return results
+
+
+### Сравнение времени чтения датасета из sqlite, CSV и колоночного хранилища
+def store_benchmark(db_path='session.db', table='table_sessions', csv_path=None, path='store', columns=None,
+                    filters=None):
+    """
+    Функция замеряет время чтения колонок таблицы из базы данных sqlite, из файла CSV и из файла Parquet
+    колоночного хранилища и память, занятую прочитанным датасетом
+
+        Параметры:
+            db_path (str): путь к базе данных sqlite
+            table (str): наименование таблицы
+            csv_path (str, None): путь к файлу CSV с той же таблицей (None - файл записывается рядом с базой данных)
+            path (str): каталог колоночного хранилища (таблица переносится в него, если её там нет)
+            columns (list, None): читаемые колонки (по умолчанию - категориальные атрибуты и целевая переменная)
+            filters (list, None): фильтры строк в формате pyarrow для чтения из колоночного хранилища
+        Выходные параметры:
+            results (dict): для каждого источника - время чтения (сек.) и память датасета (МБ)
+
+    """
+    import sqlite3
+    from package.store_functions import dataset_path, dataset_read, sqlite_migrate
+
+    if columns is None:
+        columns = ['utm_source', 'utm_medium', 'utm_campaign', 'utm_adcontent', 'utm_keyword',
+                   'device_category', 'device_os', 'device_brand', 'device_screen_resolution',
+                   'device_browser', 'geo_country', 'geo_city', 'conversion_rate']
+    if csv_path is None:
+        csv_path = os.path.splitext(db_path)[0] + f'_{table}.csv'
+    connection = sqlite3.connect(db_path)
+    if not os.path.exists(csv_path):
+        pd.read_sql(f'SELECT * FROM "{table}"', connection).to_csv(csv_path, index=False)
+    if not os.path.exists(dataset_path(table, path)):
+        sqlite_migrate(db_path, path, tables=[table])
+
+    readers = {
+               'sqlite': lambda: pd.read_sql(f'SELECT {", ".join(columns)} FROM "{table}"', connection),
+               'csv': lambda: pd.read_csv(csv_path, usecols=columns),
+               'parquet': lambda: dataset_read(table, path, columns=columns, filters=filters)
+              }
+    results = {}
+    report = Report([('Источник', 11, '{}'), ('Чтение (сек.)', 16, '{:.3f}'), ('Память (МБ)', 14, '{:.1f}'),
+                     ('Строк', 0, '{}')])
+    for source, reader in readers.items():
+        df, seconds = timed(reader)
+        memory = df.memory_usage(deep=True).sum() / 1024 / 1024
+        results[source] = {'seconds': seconds, 'memory': memory}
+        report.row(source, seconds, memory, len(df))
+    connection.close()
+    return results
+
+
+def _file_load_worker(file_path, mode, chunksize, queue):
+    from package.load_functions import concat_chunks, file_chunks, infer_schema, read_options, compact_numeric
+    from package.profiling_functions import peak_memory
+
+    if mode == 'default':
+        df, seconds = timed(pd.read_csv, file_path, low_memory=False)
+    elif chunksize is None:
+        df, seconds = timed(lambda: compact_numeric(pd.read_csv(file_path, **read_options(infer_schema(file_path)))))
+    else:
+        df, seconds = timed(lambda: concat_chunks(file_chunks(file_path, chunksize)))
+    queue.put((seconds, df.memory_usage(deep=True).sum() / 1024 / 1024, peak_memory()))
+
+
+### Сравнение памяти загрузки файла CSV с типами данных по умолчанию и с компактными типами
+def file_load_benchmark(file_path='ga_hits.csv', chunksize=1_000_000):
+    """
+    Функция загружает файл CSV в отдельных процессах с типами данных pandas по умолчанию, с компактными типами
+    и частями с компактными типами и выводит время загрузки, память датасета и пиковую память процесса
+
+        Параметры:
+            file_path (str): путь к файлу CSV
+            chunksize (int): количество строк в части при загрузке частями
+        Выходные параметры:
+            results (dict): для каждого способа - время (сек.), память датасета и пиковая память процесса (МБ)
+
+    """
+    results = {}
+    report = Report([('Способ', 14, '{}'), ('Загрузка (сек.)', 18, '{:.2f}'), ('Датасет (МБ)', 15, '{:.1f}'),
+                     ('Пик процесса (МБ)', 0, '{}')])
+    for mode, size in (('default', None), ('compact', None), ('chunks', chunksize)):
+        [(seconds, memory, peak)] = _spawn(_file_load_worker, file_path, mode, size)
+        results[mode] = {'seconds': seconds, 'memory': memory, 'peak': peak}
+        report.row(mode, seconds, memory, peak)
+    return results
+
+
+### Сравнение скорости проверки типов данных колонок
+def type_check_benchmark(sizes=(100_000, 1_000_000), processes=4, seed=42):
+    """
+    Функция замеряет время проверки колонок на разные типы данных построчным способом (исходная реализация
+    checking_type_error) и функцией checking_type_error в одном и в нескольких процессах, проверяя совпадение
+    найденных полей
+
+        Параметры:
+            sizes (tuple): размеры датасетов (в строках), на которых проводятся замеры
+            processes (int): количество процессов для параллельной проверки
+            seed (int): зерно генератора случайных чисел
+        Выходные параметры:
+            results (list): список кортежей (строк, построчно сек., один процесс сек., processes процессов сек.)
+
+    """
+    from package.preparation_functions import checking_type_error
+
+    def reference_check(df):
+        reference = {}
+        for col in df.columns:
+            types = df[col].dropna().apply(lambda x: type(x)).value_counts()
+            if len(types) > 1:
+                reference[col] = {value_type.__name__: int(count) for value_type, count in types.items()}
+        return reference
+
+    results = []
+    report = Report([('Строк', 14, '{}'), ('Построчно (сек.)', 19, '{:.3f}'), ('1 процесс (сек.)', 19, '{:.3f}'),
+                     (f'{processes} процесса (сек.)', 0, '{:.3f}')])
+    for n_rows in sizes:
+        # Колонка с числами и строками и колонка строк с пропусками
+        df = sample(n_rows, {**SESSIONS, 'geo_city': 0.1, 'client_id': 0.1}, seed).astype(object)
+
+        reference, time_ref = timed(reference_check, df)
+        check, time_one = timed(checking_type_error, df)
+        check_pool, time_pool = timed(checking_type_error, df, processes=processes)
+
+        assert check == check_pool and {col: item['types'] for col, item in check.items()} == reference
+        results.append((n_rows, time_ref, time_one, time_pool))
+        report.row(n_rows, time_ref, time_one, time_pool)
+    return results
+
+
+### Сравнение скорости преобразования полей даты и времени
+def datetime_benchmark(sizes=(1_860_042,), seed=42):
+    """
+    Функция замеряет время преобразования полей даты и времени визитов построчным strptime (исходная реализация
+    dataset_preparation и agg_changes) и векторным разбором в datetime64/timedelta64 с признаками через .dt,
+    проверяя совпадение признаков и строк, записываемых в базу данных (по умолчанию - размер ga_sessions.csv)
+
+        Параметры:
+            sizes (tuple): размеры датасетов (в строках), на которых проводятся замеры
+            seed (int): зерно генератора случайных чисел
+        Выходные параметры:
+            results (list): список кортежей (строк, построчно сек., векторно сек.)
+
+    """
+    from package.preparation_functions import map_unique, format_dates, storage_format
+
+    def reference_features(df):
+        visit_date = df['visit_date'].apply(lambda x: dt.datetime.strptime(x, '%Y-%m-%d').date())
+        visit_time = df['visit_time'].apply(lambda x: dt.datetime.strptime(x, '%H:%M:%S').time())
+        return pd.DataFrame({'year-month': visit_date.apply(lambda x: dt.datetime.strftime(x, '%Y-%m')),
+                             'dayOFmonth': visit_date.apply(lambda x: dt.datetime.strftime(x, '%d')),
+                             'dayOFweek': visit_date.apply(lambda x: dt.datetime.strftime(x, '%w')),
+                             'hourOFday': visit_time.apply(lambda x: x.hour)})
+
+    def vector_features(df):
+        visit_date = map_unique(df['visit_date'], lambda x: pd.to_datetime(x, format='%Y-%m-%d'))
+        visit_time = map_unique(df['visit_time'], pd.to_timedelta)
+        features = pd.DataFrame({'year-month': format_dates(visit_date, '%Y-%m'),
+                                 'dayOFmonth': format_dates(visit_date, '%d'),
+                                 'dayOFweek': format_dates(visit_date, '%w'),
+                                 'hourOFday': visit_time.dt.seconds // 3600})
+        return features, visit_date, visit_time
+
+    results = []
+    report = Report([('Строк', 14, '{}'), ('Построчно (сек.)', 19, '{:.3f}'), ('Векторно (сек.)', 18, '{:.3f}'),
+                     ('Ускорение', 0, '{:.1f}x')])
+    for n_rows in sizes:
+        df = sample(n_rows, {'visit_date': 0, 'visit_time': 0}, seed)
+
+        reference, time_ref = timed(reference_features, df)
+        (features, visit_date, visit_time), time_new = timed(vector_features, df)
+
+        pd.testing.assert_frame_equal(features.astype(object), reference.astype(object))
+        # Записываемые в базу данных строки совпадают с форматом, в котором pandas записывал date и time
+        stored = storage_format(pd.DataFrame({'visit_date': visit_date, 'visit_time': visit_time}))
+        assert (stored['visit_date'] == df['visit_date']).all()
+        assert (stored['visit_time'] == df['visit_time'] + '.000000').all()
+
+        results.append((n_rows, time_ref, time_new))
+        report.row(n_rows, time_ref, time_new, time_ref / time_new)
+    return results
+
+
+### Сравнение скорости формирования даты и времени событий
+def date_time_benchmark(sizes=(100_000, 1_000_000), seed=42):
+    """
+    Функция замеряет время формирования даты и времени визитов и событий объединённого датасета построчными
+    функциями из prn.py с разбором строк pd.to_datetime (исходная реализация data_marge) и векторными
+    date_time_visit, date_time_ns (совпадение результатов, в том числе для строк с пропусками и времени события
+    от секунды и больше, проверяется в tests/test_date_time.py)
+
+        Параметры:
+            sizes (tuple): размеры датасетов (в строках), на которых проводятся замеры
+            seed (int): зерно генератора случайных чисел
+        Выходные параметры:
+            results (list): список кортежей (строк, построчно сек., векторно сек.)
+
+    """
+    from package.preparation_functions import date_time_visit, date_time_ns
+
+    def reference_date_time(df):
+        date_time = df.apply(lambda x: create_date_time_visit_reference(x.visit_date, x.visit_time), axis=1)
+        reference = pd.Series([create_date_time_ns_reference(*row) for row in
+                               zip(date_time, df['hit_date'], df['hit_time'])], index=df.index)
+        return pd.to_datetime(reference, format='%Y-%m-%d %H:%M:%S.%f').astype('datetime64[ns]')
+
+    results = []
+    report = Report([('Строк', 14, '{}'), ('Построчно (сек.)', 19, '{:.3f}'), ('Векторно (сек.)', 18, '{:.3f}'),
+                     ('Ускорение', 0, '{:.1f}x')])
+    for n_rows in sizes:
+        df = sample(n_rows, HITS, seed)
+        _, time_ref = timed(reference_date_time, df)
+        _, time_new = timed(lambda: date_time_ns(date_time_visit(df['visit_date'], df['visit_time']),
+                                                 df['hit_date'], df['hit_time']))
+        results.append((n_rows, time_ref, time_new))
+        report.row(n_rows, time_ref, time_new, time_ref / time_new)
+    return results
+
+
+def _join_worker(sessions_path, hits_path, mode, path, n_buckets, processes, chunksize, queue):
+    from package.load_functions import concat_chunks, file_chunks
+    from package.preparation_functions import merged_date_time
+    from package.profiling_functions import peak_memory
+    from package.store_functions import bucket_join, dataset_write
+
+    def join():
+        if mode == 'memory':
+            sessions = concat_chunks(file_chunks(sessions_path, chunksize))
+            hits = concat_chunks(file_chunks(hits_path, chunksize))
+            df = merged_date_time(sessions.merge(hits, on='session_id', how='outer'))
+            del sessions, hits
+            dataset_write(df, 'join_memory', path)
+        else:
+            bucket_join(file_chunks(sessions_path, chunksize), file_chunks(hits_path, chunksize), 'session_id',
+                        'join_buckets', path, n_buckets=n_buckets, processes=processes, transform=merged_date_time)
+
+    _, seconds = timed(join)
+    queue.put((seconds, peak_memory()))
+
+
+### Сравнение памяти объединения визитов и событий в памяти и по корзинам на диске
+def join_benchmark(n_sessions=200_000, hits_per_session=10, n_buckets=16, processes=None, chunksize=500_000,
+                   path='join_benchmark', seed=42):
+    """
+    Функция формирует синтетические файлы визитов и событий (с визитами без событий и событиями без визитов),
+    объединяет их в отдельных процессах в памяти (pd.merge) и по корзинам на диске (bucket_join), выводит время
+    и пиковую память процессов и проверяет, что записанные объединённые датасеты совпадают с точностью до порядка строк
+
+        Параметры:
+            n_sessions (int): количество визитов
+            hits_per_session (int): среднее количество событий визита
+            n_buckets (int): количество корзин
+            processes (int, None): количество процессов объединения корзин
+            chunksize (int): количество строк, читаемых из файла за один раз
+            path (str): каталог синтетических файлов и объединённых датасетов
+            seed (int): зерно генератора случайных чисел
+        Выходные параметры:
+            results (dict): для каждого способа - время (сек.) и пиковая память процесса (МБ)
+
+    """
+    from package.preparation_functions import date_time_visit
+    from package.store_functions import dataset_read
+
+    rng = np.random.default_rng(seed)
+    os.makedirs(path, exist_ok=True)
+    sessions = sample(n_sessions, {'visit_date': 0, 'visit_time': 0, 'utm_source': 0, 'geo_city': 0}, seed)
+    sessions.insert(0, 'session_id', [f'{i}.{seed}' for i in range(n_sessions)])
+    sessions['date_time'] = date_time_visit(sessions['visit_date'], sessions['visit_time']) \
+        .dt.strftime('%Y-%m-%d %H:%M:%S')
+    # Часть визитов без событий и часть событий с визитами, которых нет в датасете визитов;
+    # дата события - дата визита
+    n_hits = n_sessions * hits_per_session
+    hit_sessions = rng.integers(0, int(n_sessions * 1.05), n_hits)
+    hits = sample(n_hits, {'hit_time': 0.1, 'event_action': 0}, seed)
+    hits.insert(0, 'session_id', [f'{i}.{seed}' for i in hit_sessions])
+    hits.insert(1, 'hit_date', sessions['visit_date'].to_numpy()[hit_sessions % n_sessions])
+    hits['hit_number'] = np.arange(n_hits)
+    sessions_path, hits_path = os.path.join(path, 'sessions.csv'), os.path.join(path, 'hits.csv')
+    sessions.to_csv(sessions_path, index=False)
+    hits.to_csv(hits_path, index=False)
+    del sessions, hits
+
+    results = {}
+    report = Report([('Способ', 14, '{}'), ('Объединение (сек.)', 21, '{:.2f}'), ('Пик процесса (МБ)', 0, '{}')])
+    for mode in ('memory', 'buckets'):
+        [(seconds, peak)] = _spawn(_join_worker, sessions_path, hits_path, mode, path, n_buckets, processes,
+                                   chunksize)
+        results[mode] = {'seconds': seconds, 'peak': peak}
+        report.row(mode, seconds, peak)
+
+    # Порядок строк по корзинам отличается от порядка pd.merge: датасеты сравниваются после сортировки
+    # (категориальные колонки сравниваются значениями)
+    joined = []
+    for name in ('join_memory', 'join_buckets'):
+        df = dataset_read(name, path, categorical=False).sort_values(['session_id', 'hit_number'])
+        joined.append(df.astype({col: object for col in df.columns
+                                 if isinstance(df[col].dtype, pd.CategoricalDtype)}).reset_index(drop=True))
+    pd.testing.assert_frame_equal(joined[1], joined[0], check_dtype=False)
+    print(f'Объединённые датасеты совпадают: {len(joined[0])} строк')
+    return results
+
+
+BENCHMARKS = {name[:-len('_benchmark')]: func for name, func in list(globals().items())
+              if name.endswith('_benchmark') and callable(func)}
+
+
+if __name__ == '__main__':
+    import ast
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Замеры скорости и памяти функций пакета и сервиса')
+    parser.add_argument('benchmark', choices=BENCHMARKS)
+    parser.add_argument('params', nargs='*', metavar='name=value',
+                        help='параметры функции замера (значения разбираются как литералы Python, иначе - строки)')
+    args = parser.parse_args()
+
+    params = {}
+    for param in args.params:
+        name, value = param.split('=', 1)
+        try:
+            params[name] = ast.literal_eval(value)
+        except (ValueError, SyntaxError):
+            params[name] = value
+    BENCHMARKS[args.benchmark](**params)
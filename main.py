@@ -1,10 +1,20 @@
-import pandas as pd
-import datetime as dt
-import dill
+import os
+import json
+import time
+import asyncio
+import sys
+import hashlib
+import threading
+import collections
+from contextlib import asynccontextmanager
 
-from fastapi import FastAPI
-from pydantic import BaseModel
-from typing import Union, Dict
+from fastapi import FastAPI, HTTPException, Request
+from fastapi.concurrency import run_in_threadpool
+from pydantic import BaseModel, ValidationError
+from typing import Union, Dict, List
+
+# dill, pandas, NumPy и sklearn импортируются при загрузке модели,
+# чтобы сервис отвечал на /status и /version сразу после запуска
 
 
 class Form(BaseModel):
@@ -30,11 +40,684 @@ class Prediction(BaseModel):
     Result: str
 
 
+class BatchPrediction(BaseModel):
+    Client_id: Union[None, str]
+    Result: str
+    Probability: float
+
+
+### Реестр модели сервиса
+class ModelRegistry:
+    """
+    Класс хранит загруженную модель и подменяет её при появлении на диске нового файла модели
+
+        Параметры:
+            path (str): путь к файлу модели (pickle или манифест каталога модели)
+            loader (function): функция загрузки модели по пути и содержимому файла (по умолчанию dill)
+            check_interval (float): период (в секундах) проверки изменения файла модели
+            metadata_path (str): путь к JSON-файлу с метаданными и записями для прогрева модели
+
+    """
+
+    def __init__(self, path, loader=None, check_interval=5.0, metadata_path=None):
+        self.path = path
+        self.loader = loader or load_pickle
+        self.check_interval = check_interval
+        self.metadata_path = metadata_path
+        self.version = 0
+        self.ready = False
+        self._sidecar = None
+        self._model = None
+        self._signature = None
+        self._checksum = None
+        self._checked_at = 0.0
+        self._pending = None
+        self._reloader = None
+        self._lock = threading.Lock()
+
+    def _file_signature(self):
+        stat = os.stat(self.path)
+        return stat.st_mtime_ns, stat.st_size
+
+    def _read(self):
+        # Чтение и загрузка модели; если файл перезаписан без изменения содержимого, модель не загружается (None)
+        signature = self._file_signature()
+        with open(self.path, 'rb') as file:
+            data = file.read()
+        checksum = hashlib.sha256(data).hexdigest()
+        model = self.loader(self.path, data) if checksum != self._checksum else None
+        return model, checksum, signature
+
+    def _swap(self, model, checksum, signature):
+        # Подмена ссылки атомарна: запросы, уже получившие модель, завершатся на старой
+        if model is not None:
+            self._model, self._checksum = model, checksum
+            self.version += 1
+            print(f"Загружена модель {model['metadata'].get('version')} из файла {self.path}")
+        self._signature = signature
+
+    def _reload(self):
+        # Загрузка новой модели в фоновом потоке: цикл событий сервиса и запросы не ожидают загрузку
+        try:
+            loaded = self._read()
+        except Exception as error:
+            # Файл может быть записан не полностью - повторим попытку при следующей проверке
+            print(f'Не удалось загрузить модель из файла {self.path}: {error}')
+            return
+        with self._lock:
+            self._pending = loaded
+
+    def load(self):
+        """
+        Функция загружает модель из файла (при запуске сервиса)
+
+            Выходные параметры (None)
+
+        """
+        with self._lock:
+            self._swap(*self._read())
+        self._checked_at = time.monotonic()
+
+    def get(self):
+        """
+        Функция возвращает текущую модель; при изменении файла модели запускает её загрузку в фоновом потоке
+        и подменяет модель, когда загрузка завершена
+
+            Выходные параметры (dict): словарь модели с ключами 'best_model' и 'metadata'
+
+        """
+        if self._pending is not None:
+            with self._lock:
+                if self._pending is not None:
+                    self._swap(*self._pending)
+                    self._pending = None
+        now = time.monotonic()
+        if now - self._checked_at >= self.check_interval:
+            self._checked_at = now
+            try:
+                changed = self._file_signature() != self._signature
+            except OSError:
+                changed = False
+            # Загрузку выполняет один фоновый поток, запросы продолжают работать на текущей модели
+            with self._lock:
+                if changed and self._pending is None and (self._reloader is None or not self._reloader.is_alive()):
+                    self._reloader = threading.Thread(target=self._reload, daemon=True)
+                    self._reloader.start()
+        return self._model
+
+    def snapshot(self):
+        """
+        Функция возвращает текущую модель вместе с её версией в реестре (версия соответствует именно этой модели)
+
+            Выходные параметры (tuple): словарь модели и версия модели
+
+        """
+        self.get()
+        with self._lock:
+            return self._model, self.version
+
+    def sidecar(self):
+        """
+        Функция возвращает содержимое файла метаданных модели (читается один раз)
+
+            Выходные параметры (dict): словарь с ключами 'metadata' и 'sample'
+
+        """
+        if self._sidecar is None:
+            self._sidecar = {}
+            if self.metadata_path is not None and os.path.exists(self.metadata_path):
+                with open(self.metadata_path, encoding='utf-8') as file:
+                    self._sidecar = json.load(file)
+        return self._sidecar
+
+    def metadata(self):
+        """
+        Функция возвращает метаданные модели: загруженной, а пока модель загружается - из файла метаданных
+
+            Выходные параметры (dict)
+
+        """
+        if self._model is not None:
+            return self.get()['metadata']
+        return self.sidecar().get('metadata')
+
+
+### Функции загрузки модели из pickle и из каталога модели
+def load_pickle(path, data):
+    import dill
+    model = dill.loads(data)
+    # UNKNOWN_CATEGORY переопределяет заданную при обучении обработку неизвестных категорий (шаг CategoryEncoder)
+    unknown = os.getenv('UNKNOWN_CATEGORY')
+    if unknown:
+        pipeline = model['best_model']
+        pipeline.set_params(**{key: unknown for key in pipeline.get_params() if key.endswith('__unknown')})
+    return model
+
+
+def load_compiled(path, data):
+    from package.inference_functions import load_bundle
+    # UNKNOWN_CATEGORY переопределяет заданную при обучении обработку неизвестных категорий,
+    # FOREST_THREADS - количество потоков леса на больших пакетах (0 - по числу ядер)
+    return load_bundle(os.path.dirname(path), unknown=os.getenv('UNKNOWN_CATEGORY') or None,
+                       n_threads=int(os.getenv('FOREST_THREADS', '1')))
+
+
+### Функция пакетного предсказания
+def predict_records(model, records):
+    """
+    Функция делает предсказание сразу для набора записей одним вызовом модели
+
+        Параметры:
+            model (dict): словарь модели с ключами 'best_model' и 'metadata'
+            records (list): список словарей с атрибутами визитов (поля класса Form)
+        Выходные параметры:
+            results (ndarray): предсказанные классы в порядке входных записей
+            probabilities (ndarray): вероятности положительного класса в порядке входных записей
+
+    """
+    from package.inference_functions import CompiledModel
+
+    pipeline = model['best_model']
+    # Компилированная модель считает вероятности по записям напрямую, без pandas
+    if isinstance(pipeline, CompiledModel):
+        proba = pipeline.predict_proba(records)
+        return pipeline.classes_.take(proba.argmax(axis=1)), proba[:, -1]
+
+    import pandas as pd
+    df = pd.DataFrame.from_records(records)
+    # predict у случайного леса - это argmax по predict_proba, поэтому модель вызываем один раз
+    if profiler is not None:
+        from package.profiling_functions import profiled_predict_proba
+        proba = profiled_predict_proba(pipeline, df, profiler)
+    else:
+        proba = pipeline.predict_proba(df)
+    return pipeline.classes_.take(proba.argmax(axis=1)), proba[:, -1]
+
+
+### Ошибка предсказания по записи
+class RecordError(ValueError):
+    """
+    Класс ошибки записи, которую модель не может обработать (сервис отвечает на такую запись кодом 422)
+
+    """
+
+
+### Функция пакетного предсказания с выделением записей, на которых модель выдаёт ошибку
+def predict_isolated(model, records, errors=None, max_calls=None):
+    """
+    Функция делает предсказание для набора записей: записи с некорректными датой или временем визита
+    отклоняются без вызова модели, а если модель выдаёт ошибку на остальных, набор делится пополам,
+    пока ошибочные записи не будут найдены (не более max_calls вызовов модели; записи частей, которые
+    не удалось разделить в пределах этого числа вызовов, получают ошибку своей части)
+
+        Параметры:
+            model (dict): словарь модели с ключами 'best_model' и 'metadata'
+            records (list): список словарей с атрибутами визитов (поля класса Form)
+            errors (list, None): результат visit_field_errors по записям (None - проверить записи)
+            max_calls (int, None): максимальное количество вызовов модели (None - MAX_ISOLATE_CALLS)
+        Выходные параметры (list): по каждой записи кортеж (класс, вероятность) или ошибка RecordError
+
+    """
+    from package.inference_functions import visit_field_errors
+
+    if errors is None:
+        errors = visit_field_errors(records)
+    results = [RecordError(error) if error is not None else None for error in errors]
+    calls = [max_calls or MAX_ISOLATE_CALLS]
+
+    def isolate(indexes, part_error):
+        # Вызовы модели закончились - записи части получают ошибку части, в которую они входили
+        if calls[0] <= 0:
+            for i in indexes:
+                results[i] = part_error
+            return
+        calls[0] -= 1
+        try:
+            y, proba = predict_records(model, [records[i] for i in indexes])
+        except Exception as error:
+            if len(indexes) == 1:
+                results[indexes[0]] = RecordError(str(error))
+                return
+            middle = len(indexes) // 2
+            isolate(indexes[:middle], RecordError(str(error)))
+            isolate(indexes[middle:], RecordError(str(error)))
+            return
+        for j, i in enumerate(indexes):
+            results[i] = (y[j], proba[j])
+
+    valid = [i for i, result in enumerate(results) if result is None]
+    if valid:
+        isolate(valid, None)
+    return results
+
+
+### Функция пакетного предсказания с ошибками по отдельным записям
+def predict_safe(model, version, records):
+    """
+    Функция делает предсказание для набора записей с кэшем, а если в наборе есть записи, которые модель
+    не может обработать, - выделяет их (см. predict_isolated)
+
+        Параметры:
+            model (dict): словарь модели с ключами 'best_model' и 'metadata'
+            version (int): версия модели в реестре
+            records (list): список словарей с атрибутами визитов (поля класса Form)
+        Выходные параметры (list): по каждой записи кортеж (класс, вероятность) или ошибка RecordError
+
+    """
+    from package.inference_functions import visit_field_errors
+
+    errors = visit_field_errors(records)
+    if not any(errors):
+        try:
+            y, proba = predict_cached(model, version, records)
+            return [(y[i], proba[i]) for i in range(len(records))]
+        except Exception:
+            pass
+    return predict_isolated(model, records, errors)
+
+
+### Кэш предсказаний по атрибутам визита, от которых зависит модель
+class PredictionCache:
+    """
+    Класс хранит предсказания модели по ключу из входных атрибутов модели (LRU с ограничением
+    количества записей, памяти и времени жизни); при смене версии модели кэш очищается
+
+        Параметры:
+            max_entries (int): максимальное количество записей
+            max_memory_mb (float): максимальная оценка памяти, занятой записями (МБ)
+            ttl (float): время жизни записи (сек.), 0 - без ограничения
+
+    """
+
+    # Категориальные атрибуты; из даты визита модель использует дату, из времени визита - только час
+    KEY_FIELDS = ('utm_source', 'utm_medium', 'utm_campaign', 'utm_adcontent', 'utm_keyword',
+                  'device_category', 'device_os', 'device_brand', 'device_screen_resolution', 'device_browser',
+                  'geo_country', 'geo_city')
+
+    def __init__(self, max_entries=100000, max_memory_mb=64, ttl=0):
+        self.max_entries = max_entries
+        self.max_memory = max_memory_mb * 1024 * 1024
+        self.ttl = ttl
+        self.version = None
+        self.memory = 0
+        self.counters = collections.Counter()
+        self._entries = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    @classmethod
+    def key(cls, record):
+        """
+        Функция формирует ключ кэша по записи; client_id в ключ не входит, так как не используется моделью
+
+            Параметры:
+                record (dict): атрибуты визита (поля класса Form)
+            Выходные параметры (tuple, None): None, если дата или время визита не в формате модели
+                                              (запись не кэшируется и отклоняется моделью)
+
+        """
+        from package.inference_functions import parse_visit_date, parse_visit_hour
+
+        # Дата и час разбираются по тем же правилам, что и в модели: запись, которую модель отклоняет,
+        # не получает ключ записи в допустимом формате с тем же часом
+        date, hour = parse_visit_date(record['visit_date']), parse_visit_hour(record['visit_time'])
+        if date is None or hour is None:
+            return None
+        return tuple(record[field] for field in cls.KEY_FIELDS) + (date, hour)
+
+    @staticmethod
+    def _size(key, value):
+        return sys.getsizeof(key) + sum(sys.getsizeof(item) for item in key) + sys.getsizeof(value) + 64
 
+    def get_many(self, keys, version):
+        """
+        Функция возвращает сохранённые предсказания по ключам
 
-app = FastAPI()
-with open('model.pickle', 'rb') as file:
-    model = dill.load(file)
+            Параметры:
+                keys (list): ключи записей
+                version (int): версия модели в реестре
+            Выходные параметры (list): предсказания (класс, вероятность) или None для отсутствующих ключей
+
+        """
+        now = time.monotonic()
+        results = []
+        with self._lock:
+            if version != self.version:
+                if self._entries:
+                    self.counters['invalidations'] += 1
+                self._entries.clear()
+                self.memory = 0
+                self.version = version
+            for key in keys:
+                entry = self._entries.get(key) if key is not None else None
+                if entry is not None and self.ttl and entry[1] < now:
+                    self._remove(key)
+                    self.counters['expirations'] += 1
+                    entry = None
+                if entry is None:
+                    self.counters['misses'] += 1
+                    results.append(None)
+                else:
+                    self.counters['hits'] += 1
+                    self._entries.move_to_end(key)
+                    results.append(entry[0])
+        return results
+
+    def put_many(self, items, version, evaluated=0):
+        """
+        Функция сохраняет предсказания и вытесняет давно не использованные записи сверх ограничений
+
+            Параметры:
+                items (list): пары (ключ, предсказание)
+                version (int): версия модели, которой сделаны предсказания
+                evaluated (int): количество записей, посчитанных моделью
+            Выходные параметры (None)
+
+        """
+        expires = time.monotonic() + self.ttl
+        with self._lock:
+            self.counters['evaluated'] += evaluated
+            # Предсказания устаревшей модели не сохраняем
+            if version != self.version:
+                return
+            for key, value in items:
+                if key in self._entries:
+                    self._remove(key)
+                size = self._size(key, value)
+                self._entries[key] = (value, expires, size)
+                self.memory += size
+            while self._entries and (len(self._entries) > self.max_entries or self.memory > self.max_memory):
+                self._remove(next(iter(self._entries)))
+                self.counters['evictions'] += 1
+
+    def _remove(self, key):
+        self.memory -= self._entries.pop(key)[2]
+
+    def metrics(self):
+        """
+        Функция возвращает счётчики попаданий, промахов и вытеснений кэша
+
+            Выходные параметры (dict)
+
+        """
+        with self._lock:
+            lookups = self.counters['hits'] + self.counters['misses']
+            return {
+                    'entries': len(self._entries),
+                    'memory_mb': round(self.memory / 1024 / 1024, 2),
+                    'hits': self.counters['hits'],
+                    'misses': self.counters['misses'],
+                    'hit_rate': round(self.counters['hits'] / lookups, 4) if lookups else None,
+                    # Доля записей, для которых модель не вызывалась (попадания и повторы внутри пакета)
+                    'avoided_rate': round(1 - self.counters['evaluated'] / lookups, 4) if lookups else None,
+                    'evictions': self.counters['evictions'],
+                    'expirations': self.counters['expirations'],
+                    'invalidations': self.counters['invalidations']
+                   }
+
+
+### Функция пакетного предсказания с кэшем
+def predict_cached(model, version, records):
+    """
+    Функция делает предсказание для набора записей, вызывая модель только для записей, которых нет в кэше
+    (повторяющиеся в наборе записи модель считает один раз)
+
+        Параметры:
+            model (dict): словарь модели с ключами 'best_model' и 'metadata'
+            version (int): версия модели в реестре
+            records (list): список словарей с атрибутами визитов (поля класса Form)
+        Выходные параметры:
+            results (list): предсказанные классы в порядке входных записей
+            probabilities (list): вероятности положительного класса в порядке входных записей
+
+    """
+    if cache is None:
+        return predict_records(model, records)
+    keys = [PredictionCache.key(record) for record in records]
+    results = cache.get_many(keys, version)
+    # Для каждого ключа без предсказания модель считает первую запись с этим ключом
+    missing = {}
+    for i, result in enumerate(results):
+        if result is None:
+            missing.setdefault(keys[i] if keys[i] is not None else ('record', i), []).append(i)
+    if missing:
+        y, proba = predict_records(model, [records[indexes[0]] for indexes in missing.values()])
+        items = []
+        for j, (key, indexes) in enumerate(missing.items()):
+            for i in indexes:
+                results[i] = (y[j], proba[j])
+            if keys[indexes[0]] is not None:
+                items.append((key, results[indexes[0]]))
+        cache.put_many(items, version, evaluated=len(missing))
+    return [result[0] for result in results], [result[1] for result in results]
+
+
+### Функция разбора тела запроса пакетного предсказания (JSON-массив или NDJSON)
+def parse_batch(body, content_type):
+    """
+    Функция преобразует тело запроса в список записей класса Form
+
+        Параметры:
+            body (bytes): тело запроса
+            content_type (str): заголовок Content-Type запроса
+        Выходные параметры (list)
+
+    """
+    try:
+        if 'ndjson' in content_type or 'jsonlines' in content_type:
+            items = [json.loads(line) for line in body.splitlines() if line.strip()]
+        else:
+            items = json.loads(body)
+    except ValueError as error:
+        raise HTTPException(status_code=400, detail=f'Некорректный JSON: {error}')
+    if not isinstance(items, list):
+        raise HTTPException(status_code=422, detail='Ожидается список записей')
+    if len(items) > MAX_BATCH_SIZE:
+        raise HTTPException(status_code=413,
+                            detail=f'Размер пакета {len(items)} превышает максимальный {MAX_BATCH_SIZE}')
+    try:
+        return [Form(**item) for item in items]
+    except (TypeError, ValidationError) as error:
+        raise HTTPException(status_code=422, detail=str(error))
+
+
+### Планировщик микропакетов одиночных запросов
+class PredictionBatcher:
+    """
+    Класс собирает одновременные одиночные запросы в пакет и делает по нему одно предсказание
+
+        Параметры:
+            registry (ModelRegistry): реестр, из которого берётся текущая модель
+            window_ms (float): максимальное время ожидания (в миллисекундах) заполнения пакета
+            max_batch_size (int): максимальное количество записей в пакете
+            history (int): количество последних запросов, по которым считаются задержки в очереди
+
+    """
+
+    def __init__(self, registry, window_ms=2.0, max_batch_size=64, history=10000):
+        self.registry = registry
+        self.window = window_ms / 1000
+        self.max_batch_size = max_batch_size
+        self.batch_sizes = collections.Counter()
+        self.queue_delays = collections.deque(maxlen=history)
+        self._queue = None
+        self._worker = None
+
+    async def predict(self, record):
+        """
+        Функция ставит запись в очередь и ожидает результат предсказания по пакету
+
+            Параметры:
+                record (dict): атрибуты визита (поля класса Form)
+            Выходные параметры (tuple): предсказанный класс и вероятность положительного класса
+
+        """
+        loop = asyncio.get_running_loop()
+        # Обработчик очереди перезапускается, если он завершился или работал в другом (закрытом) цикле событий
+        if self._worker is None or self._worker.done() or self._worker.get_loop() is not loop:
+            self._queue = asyncio.Queue()
+            self._worker = loop.create_task(self._run())
+        future = loop.create_future()
+        self._queue.put_nowait((record, future, time.perf_counter()))
+        return await future
+
+    async def _collect(self):
+        loop = asyncio.get_running_loop()
+        batch = [await self._queue.get()]
+        deadline = loop.time() + self.window
+        while len(batch) < self.max_batch_size:
+            if not self._queue.empty():
+                batch.append(self._queue.get_nowait())
+                continue
+            timeout = deadline - loop.time()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+            except asyncio.TimeoutError:
+                break
+        return batch
+
+    async def _run(self):
+        while True:
+            batch = await self._collect()
+            started = time.perf_counter()
+            self.batch_sizes[len(batch)] += 1
+            self.queue_delays.extend(started - queued for _, _, queued in batch)
+            model, version = self.registry.snapshot()
+            records = [record for record, _, _ in batch]
+            # Ошибка в одной записи не должна ронять весь пакет - остальные записи получают предсказания
+            results = await run_in_threadpool(predict_safe, model, version, records)
+            for (_, future, _), result in zip(batch, results):
+                if future.done():
+                    continue
+                if isinstance(result, Exception):
+                    future.set_exception(result)
+                else:
+                    future.set_result(result)
+
+    def metrics(self):
+        """
+        Функция возвращает распределение размеров пакетов и задержек запросов в очереди
+
+            Выходные параметры (dict)
+
+        """
+        delays = sorted(self.queue_delays)
+        percentile = lambda q: round(delays[min(int(q * len(delays)), len(delays) - 1)] * 1000, 3) \
+            if delays else None
+        return {
+                'batches': sum(self.batch_sizes.values()),
+                'requests': sum(size * count for size, count in self.batch_sizes.items()),
+                'batch_size_distribution': dict(sorted(self.batch_sizes.items())),
+                'queue_delay_ms': {
+                                   'mean': round(sum(delays) / len(delays) * 1000, 3) if delays else None,
+                                   'p50': percentile(0.5),
+                                   'p95': percentile(0.95),
+                                   'p99': percentile(0.99),
+                                   'max': round(delays[-1] * 1000, 3) if delays else None
+                                  }
+               }
+
+
+### Прогрев модели предсказанием по записям из файла метаданных
+def warm_up(registry, sample_path='data_1.json'):
+    """
+    Функция делает пробное предсказание, чтобы до первого запроса были выполнены ленивые импорты
+    и подняты в память страницы модели, и отмечает модель готовой к работе
+
+        Параметры:
+            registry (ModelRegistry): реестр с загруженной моделью
+            sample_path (str): JSON-файл с записями визитов, если в файле метаданных их нет
+        Выходные параметры (None)
+
+    """
+    records = registry.sidecar().get('sample')
+    if not records and os.path.exists(sample_path):
+        with open(sample_path, encoding='utf-8') as file:
+            records = json.load(file)
+    if records:
+        start = time.perf_counter()
+        predict_records(registry.get(), [Form(**record).dict() for record in records])
+        print(f'Модель прогрета за {time.perf_counter() - start:.3f} сек.')
+    registry.ready = True
+
+
+def start_model():
+    start = time.perf_counter()
+    try:
+        registry.load()
+        warm_up(registry, WARMUP_SAMPLE)
+    except Exception as error:
+        # Сервис остаётся неготовым (/ready отвечает 503)
+        print(f'Не удалось загрузить модель из файла {registry.path}: {error}')
+        return
+    print(f'Модель готова к работе через {time.perf_counter() - start:.3f} сек.')
+
+
+def require_model():
+    if not registry.ready:
+        raise HTTPException(status_code=503, detail='Модель загружается')
+
+
+@asynccontextmanager
+async def lifespan(app):
+    # В режиме быстрого запуска модель загружается в фоне, а сервис сразу принимает запросы
+    if FAST_START and not registry.ready:
+        app.state.model_loader = asyncio.create_task(run_in_threadpool(start_model))
+    yield
+
+
+MAX_BATCH_SIZE = int(os.getenv('MAX_BATCH_SIZE', '10000'))
+# Максимальное количество вызовов модели при поиске записей, на которых модель выдаёт ошибку
+MAX_ISOLATE_CALLS = int(os.getenv('MAX_ISOLATE_CALLS', '64'))
+# Замеры шагов pipeline включаются переменной окружения PROFILE_PIPELINE=1
+# (шаги с замером памяти параллельных предсказаний pipeline выполняются по очереди, см. PipelineProfiler)
+if os.getenv('PROFILE_PIPELINE') == '1':
+    from package.profiling_functions import PipelineProfiler
+    profiler = PipelineProfiler()
+else:
+    profiler = None
+# Кэш предсказаний: PREDICTION_CACHE_SIZE записей (0 - кэш выключен), не более PREDICTION_CACHE_MB МБ,
+# время жизни записи PREDICTION_CACHE_TTL сек. (0 - без ограничения)
+if int(os.getenv('PREDICTION_CACHE_SIZE', '100000')) > 0:
+    cache = PredictionCache(max_entries=int(os.getenv('PREDICTION_CACHE_SIZE', '100000')),
+                            max_memory_mb=float(os.getenv('PREDICTION_CACHE_MB', '64')),
+                            ttl=float(os.getenv('PREDICTION_CACHE_TTL', '0')))
+else:
+    cache = None
+
+# FAST_START=1 - модель загружается в фоне после запуска (готовность отдаёт /ready),
+# иначе - при импорте модуля, до начала работы сервиса
+FAST_START = os.getenv('FAST_START') == '1'
+WARMUP_SAMPLE = os.getenv('WARMUP_SAMPLE', 'data_1.json')
+
+app = FastAPI(lifespan=lifespan)
+# MODEL_ENGINE=compiled - компилированная модель из каталога MODEL_BUNDLE (NumPy без pandas): категориальные
+# атрибуты кодируются таблицами, записанными при обучении; быстрее на одиночных запросах и микропакетах;
+# пакеты /predict_batch больше FlatForest.small_batch считаются деревьями sklearn, которые восстанавливаются
+# по массивам модели при первом большом пакете (см. FlatForest),
+# MODEL_ENGINE=sklearn - pipeline из файла MODEL_PATH.
+# По умолчанию используется компилированная модель, если pipeline.py записал каталог модели, иначе - pipeline
+MODEL_BUNDLE = os.getenv('MODEL_BUNDLE', 'model_bundle')
+MODEL_ENGINE = os.getenv('MODEL_ENGINE', 'compiled' if os.path.exists(os.path.join(MODEL_BUNDLE, 'manifest.json'))
+                         else 'sklearn')
+if MODEL_ENGINE == 'compiled':
+    # Метаданные и записи для прогрева хранятся в манифесте каталога модели
+    registry = ModelRegistry(os.path.join(MODEL_BUNDLE, 'manifest.json'), loader=load_compiled,
+                             check_interval=float(os.getenv('MODEL_CHECK_INTERVAL', '5')),
+                             metadata_path=os.path.join(MODEL_BUNDLE, 'manifest.json'))
+else:
+    model_path = os.getenv('MODEL_PATH', 'model.pickle')
+    registry = ModelRegistry(model_path,
+                             check_interval=float(os.getenv('MODEL_CHECK_INTERVAL', '5')),
+                             metadata_path=os.getenv('MODEL_METADATA',
+                                                     os.path.splitext(model_path)[0] + '_metadata.json'))
+if not FAST_START:
+    registry.load()
+    warm_up(registry, WARMUP_SAMPLE)
+batcher = PredictionBatcher(registry,
+                            window_ms=float(os.getenv('BATCH_WINDOW_MS', '2')),
+                            max_batch_size=int(os.getenv('BATCH_MAX_SIZE', '64')))
 
 
 @app.get('/status')
@@ -42,17 +725,141 @@ def status():
     return 'Я в порядке'
 
 
+@app.get('/ready')
+def ready():
+    require_model()
+    return {'ready': True, 'engine': MODEL_ENGINE, 'version': registry.version}
+
+
 @app.get('/version')
 def version():
-    return model['metadata']
+    metadata = registry.metadata()
+    if metadata is None:
+        require_model()
+    return metadata
+
+@app.get('/metrics')
+def metrics():
+    from package.profiling_functions import process_memory
+    # Память процесса: shared - страницы, общие с родительским процессом и другими процессами сервиса
+    return {'batcher': batcher.metrics(),
+            'pipeline': profiler.summary() if profiler is not None else None,
+            'cache': cache.metrics() if cache is not None else None,
+            'process': {'pid': os.getpid(), 'memory': process_memory()}}
 
 @app.post('/predict', response_model=Prediction)
-def predict(form: Form):
-    with open('model.pickle', 'rb') as file:
-        model = dill.load(file)
-    df = pd.DataFrame.from_dict([form.dict()])
-    y = model['best_model'].predict(df)
+async def predict(form: Form):
+    require_model()
+    try:
+        y, _ = await batcher.predict(form.dict())
+    except RecordError as error:
+        # Запись, которую модель не может обработать, - ошибка запроса, как в /predict_batch
+        raise HTTPException(status_code=422,
+                            detail=[{'index': 0, 'client_id': form.client_id, 'error': str(error)}])
     return {
             'Client_id': form.client_id,
-            'Result': str(y[0])
-          }
\ No newline at end of file
+            'Result': str(y)
+          }
+
+
+@app.post('/predict_batch', response_model=List[BatchPrediction])
+async def predict_batch(request: Request):
+    require_model()
+    forms = parse_batch(await request.body(), request.headers.get('content-type', ''))
+    if not forms:
+        return []
+    model, version = registry.snapshot()
+    records = [form.dict() for form in forms]
+    results = await run_in_threadpool(predict_safe, model, version, records)
+    # Пакет не рассчитан: возвращаем номера записей, которые модель не может обработать
+    errors = [{'index': i, 'client_id': records[i]['client_id'], 'error': str(result)}
+              for i, result in enumerate(results) if isinstance(result, Exception)]
+    if errors:
+        raise HTTPException(status_code=422, detail=errors)
+    return [{
+             'Client_id': form.client_id,
+             'Result': str(results[i][0]),
+             'Probability': float(results[i][1])
+            } for i, form in enumerate(forms)]
+
+
+### Запуск сервиса в нескольких процессах с общей моделью
+def serve(host='0.0.0.0', port=8000, workers=1):
+    """
+    Функция загружает модель в родительском процессе и запускает процессы uvicorn, которые наследуют
+    модель через fork (страницы памяти остаются общими, пока процесс в них не пишет) и общий сокет
+
+        Параметры:
+            host (str): адрес сервиса
+            port (int): порт сервиса
+            workers (int): количество процессов сервиса
+        Выходные параметры (None)
+
+    """
+    import gc
+    import signal
+    import uvicorn
+
+    if not registry.ready:
+        registry.load()
+        warm_up(registry, WARMUP_SAMPLE)
+    config = uvicorn.Config(app, host=host, port=port)
+    sock = config.bind_socket()
+    if workers == 1:
+        uvicorn.Server(config).run(sockets=[sock])
+        return
+
+    # Объекты модели переносятся в постоянное поколение сборщика мусора: он не обходит их
+    # и не пишет в их заголовки, поэтому страницы модели не копируются в дочерних процессах.
+    # Массивы деревьев лежат в отдельных от заголовков объектов страницах и счётчиками ссылок не затрагиваются
+    gc.collect()
+    gc.freeze()
+
+    def start_worker():
+        pid = os.fork()
+        if pid == 0:
+            signal.signal(signal.SIGTERM, signal.SIG_DFL)
+            signal.signal(signal.SIGINT, signal.SIG_DFL)
+            try:
+                uvicorn.Server(config).run(sockets=[sock])
+            finally:
+                os._exit(0)
+        return pid
+
+    children = {start_worker() for _ in range(workers)}
+    stopping = False
+
+    def stop(signum, frame):
+        nonlocal stopping
+        stopping = True
+        for pid in children:
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+    print(f'Запущено процессов сервиса: {workers}')
+    while children:
+        try:
+            pid, _ = os.wait()
+        except ChildProcessError:
+            break
+        children.discard(pid)
+        # Упавший процесс перезапускается с той же моделью из памяти родительского процесса
+        if not stopping:
+            print(f'Процесс сервиса {pid} завершился, запускаем новый')
+            children.add(start_worker())
+    sock.close()
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Сервис предсказания целевых действий')
+    parser.add_argument('--host', default=os.getenv('HOST', '0.0.0.0'))
+    parser.add_argument('--port', type=int, default=int(os.getenv('PORT', '8000')))
+    parser.add_argument('--workers', type=int, default=int(os.getenv('WORKERS', '1')))
+    args = parser.parse_args()
+    serve(args.host, args.port, args.workers)
@@ -1,3 +1,12 @@
-from . import preparation_functions
-from . import statistic_functions
-from . import load_functions
+import importlib
+
+__all__ = ['preparation_functions', 'statistic_functions', 'load_functions', 'profiling_functions',
+           'inference_functions', 'store_functions', 'audit_functions', 'imputation_functions', 'report_functions']
+
+
+# Модули пакета загружаются при первом обращении, чтобы сервис (main.py)
+# не импортировал библиотеки визуализации, которые нужны только в ноутбуке
+def __getattr__(name):
+    if name in __all__:
+        return importlib.import_module(f'{__name__}.{name}')
+    raise AttributeError(f'module {__name__!r} has no attribute {name!r}')
@@ -0,0 +1,175 @@
+import weakref
+import numpy as np
+import pandas as pd
+
+
+# Кэш аудита колонок: наименование колонки -> (отпечаток данных, статистики колонки).
+# Кэш не держит ссылок на сами колонки: отпечаток хранит слабые ссылки на владельцев буферов данных,
+# и после освобождения колонки её отпечаток уже не совпадёт с отпечатком новой колонки, даже если
+# память буфера будет выделена повторно. Отпечаток не отражает изменения значений в том же буфере:
+# изменение на месте (df.loc[...] = ...) буфер не меняет, а при copy-on-write pandas новая колонка может
+# разделять буфер прошлой (например, результат fillna без пропусков). Поэтому кэш включается явно
+# (dataset_audit(..., cache=True)) только для датасетов, значения которых между проверками не меняются.
+# Для каждого наименования хранится только последняя проверенная версия колонки
+AUDIT_CACHE = {}
+
+
+### Отпечаток данных колонки
+def column_fingerprint(values):
+    """
+    Функция формирует отпечаток колонки по адресам буферов её данных, типу и размеру, не просматривая значения
+
+        Параметры:
+            values (Series): колонка датасета
+        Выходные параметры:
+            fingerprint (tuple, None): отпечаток данных колонки; None, если буферы данных колонки недоступны
+                                       без копирования (такая колонка не кэшируется)
+
+    """
+    fingerprint = _array_fingerprint(values.array)
+    return None if fingerprint is None else (str(values.dtype), len(values), fingerprint)
+
+
+def _array_fingerprint(array):
+    # Буферы категорий, массивов numpy (в т.ч. datetime), масочных массивов (Int64, boolean) и массивов Arrow;
+    # для прочих массивов to_numpy создаёт копию, адрес которой не связан с данными колонки
+    if isinstance(array, pd.Categorical):
+        categories = _array_fingerprint(array.categories.array)
+        return None if categories is None else ('category', _ndarray_fingerprint(array.codes), categories)
+    if isinstance(getattr(array, '_ndarray', None), np.ndarray):
+        return _ndarray_fingerprint(array._ndarray)
+    if isinstance(getattr(array, '_data', None), np.ndarray) and isinstance(getattr(array, '_mask', None), np.ndarray):
+        return 'masked', _ndarray_fingerprint(array._data), _ndarray_fingerprint(array._mask)
+    if isinstance(array, (pd.arrays.ArrowExtensionArray, pd.arrays.ArrowStringArray)):
+        chunked = array.__arrow_array__()
+        chunks = chunked.chunks if hasattr(chunked, 'chunks') else [chunked]
+        return ('arrow', weakref.ref(chunked),
+                tuple((chunk.offset, len(chunk), tuple(buffer.address if buffer is not None else 0
+                                                        for buffer in chunk.buffers()))
+                      for chunk in chunks))
+    return None
+
+
+def _ndarray_fingerprint(data):
+    # Адрес и раскладка данных и слабая ссылка на массив, владеющий памятью (для представлений - на базовый массив)
+    owner = data
+    while isinstance(owner.base, np.ndarray):
+        owner = owner.base
+    return weakref.ref(owner), data.__array_interface__['data'][0], data.shape, data.strides
+
+
+### Аудит колонки датасета
+def column_audit(values, cardinality=False):
+    """
+    Функция вычисляет статистики колонки за один проход по маске пропусков и, при необходимости,
+    за один подсчёт частот значений
+
+        Параметры:
+            values (Series): колонка датасета
+            cardinality (bool): флаг подсчёта количества уникальных значений и самого частого значения
+        Выходные параметры:
+            audit (dict): статистики колонки с ключами 'rows', 'nulls', 'dtype', 'type' (тип первого непустого
+                          значения) и, при cardinality=True, 'unique', 'top', 'freq'
+
+    """
+    missing = values.isna().to_numpy()
+    nulls = int(missing.sum())
+    audit = {'rows': len(values), 'nulls': nulls, 'dtype': str(values.dtype),
+             'type': type(values.iloc[missing.argmin()]) if nulls < len(values) else None}
+    if cardinality:
+        audit.update(_counts_audit(values.value_counts()))
+    return audit
+
+
+def _counts_audit(counts):
+    # Статистики уникальных значений по частотам, упорядоченным по убыванию, как в describe (пропуски
+    # не учитываются, отсутствующие в колонке категории имеют нулевую частоту)
+    counts = counts[counts > 0]
+    if counts.empty:
+        return {'unique': 0, 'top': None, 'freq': 0}
+    return {'unique': len(counts), 'top': counts.index[0], 'freq': int(counts.iloc[0])}
+
+
+### Аудит датасета
+def dataset_audit(data, cardinality=False, cache=False):
+    """
+    Функция вычисляет для всех колонок датасета количество пропусков, тип данных, а при необходимости -
+    количество уникальных значений и самое частое значение. Для датасета в памяти при cache=True статистики
+    колонок с прошлого аудита (с теми же буферами данных) берутся из кэша; датасет может быть передан и частями
+    (например, из file_chunks или pd.read_sql с chunksize), тогда статистики накапливаются по частям (при равных
+    частотах самое частое значение может отличаться от выбранного для датасета в памяти)
+
+        Параметры:
+            data (DataFrame, iterable): датасет или итератор частей датасета
+            cardinality (bool): флаг подсчёта количества уникальных значений и самого частого значения
+            cache (bool): флаг использования кэша аудита колонок (только для датасета в памяти, значения которого
+                          не изменялись на месте после прошлого аудита, см. AUDIT_CACHE)
+        Выходные параметры:
+            report (DataFrame): статистики колонок (строки - колонки датасета, см. column_audit),
+                                доля пропусков в % - в колонке 'share'
+
+    """
+    if isinstance(data, pd.DataFrame):
+        audits = {col: _cached_audit(col, data[col], cardinality, cache) for col in data.columns}
+    else:
+        audits = _chunks_audit(data, cardinality)
+
+    report = pd.DataFrame.from_dict(audits, orient='index')
+    if report.empty:
+        return report
+    report['share'] = (report['nulls'] / report['rows'].where(report['rows'] > 0) * 100).fillna(0).round(2)
+    return report
+
+
+def _cached_audit(col, values, cardinality, cache):
+    if not cache:
+        return column_audit(values, cardinality)
+    fingerprint = column_fingerprint(values)
+    if fingerprint is None:
+        AUDIT_CACHE.pop(col, None)
+        return column_audit(values, cardinality)
+    cached = AUDIT_CACHE.get(col)
+    if cached is not None and cached[0] == fingerprint:
+        audit = cached[1]
+        if cardinality and 'unique' not in audit:
+            audit.update(_counts_audit(values.value_counts()))
+        return audit
+    audit = column_audit(values, cardinality)
+    # Новая версия колонки вытесняет статистики прошлой
+    AUDIT_CACHE[col] = (fingerprint, audit)
+    return audit
+
+
+def _chunks_audit(chunks, cardinality):
+    # Количества строк и пропусков по частям суммируются, частоты значений - объединяются
+    audits, counts = {}, {}
+    for chunk in chunks:
+        for col in chunk.columns:
+            audit = column_audit(chunk[col])
+            if col not in audits:
+                audits[col] = audit
+            else:
+                total = audits[col]
+                total['rows'] += audit['rows']
+                total['nulls'] += audit['nulls']
+                total['type'] = total['type'] or audit['type']
+            if cardinality:
+                chunk_counts = chunk[col].value_counts()
+                # Категории частей могут различаться: частоты объединяются по самим значениям
+                chunk_counts.index = chunk_counts.index.astype(object)
+                counts[col] = chunk_counts if col not in counts else counts[col].add(chunk_counts, fill_value=0)
+    for col, col_counts in counts.items():
+        audits[col].update(_counts_audit(col_counts.sort_values(ascending=False, kind='stable')))
+    return audits
+
+
+### Очистка кэша аудита колонок
+def audit_cache_clear():
+    """
+    Функция очищает кэш аудита колонок
+
+        Параметры: нет
+        Выходные параметры (None)
+
+    """
+    AUDIT_CACHE.clear()
@@ -0,0 +1,153 @@
+import numpy as np
+import pandas as pd
+from sklearn.base import BaseEstimator, TransformerMixin
+
+
+# Строковые обозначения пропусков, которые не используются как значение для заполнения
+NULL_LABELS = ('None', 'nan', 'null', 'Nan', 'NaN')
+
+
+### Заполнение пропусков наиболее часто встречающимися значениями
+class ModeImputer(TransformerMixin, BaseEstimator):
+    """
+    Класс заполняет пропуски в колонках наиболее часто встречающимся значением колонки, а в дочерних колонках -
+    наиболее часто встречающимся значением среди записей с тем же значением родительской колонки.
+    Частоты считаются хешированием (value_counts, groupby().size()) за один проход по колонке,
+    поэтому класс используется и при подготовке датасета, и как шаг pipeline
+
+        Параметры:
+            columns (list, None): колонки, пропуски в которых заполняются самым частым значением колонки
+            pairs (list, None): список кортежей (родительская колонка, дочерняя колонка); пропуски дочерней колонки
+                                заполняются самым частым её значением при том же значении родительской колонки,
+                                а оставшиеся пропуски - самым частым значением колонки, если она есть в columns
+
+    """
+
+    def __init__(self, columns=None, pairs=None):
+        self.columns = columns
+        self.pairs = pairs
+
+    def fit(self, X, y=None):
+        """
+        Функция вычисляет самые частые значения колонок и самые частые значения дочерних колонок
+        по значениям родительских колонок
+
+            Параметры:
+                X (DataFrame): датасет
+                y: не используется (для совместимости с pipeline)
+            Выходные параметры (ModeImputer)
+
+        """
+        # Самое частое значение колонки выбирается как в describe().loc['top']
+        self.modes_ = {}
+        for col in self.columns or []:
+            counts = X[col].value_counts()
+            if len(counts) > 0:
+                self.modes_[col] = counts.index[0]
+
+        self.group_modes_ = {}
+        for parent, child in self.pairs or []:
+            # Частоты пар (родительское значение, дочернее значение) одной группировкой; после сортировки
+            # по убыванию частоты первая пара каждого родительского значения содержит самое частое дочернее
+            counts = X.groupby([parent, child], observed=True, sort=False).size()
+            counts = counts[~counts.index.get_level_values(child).isin(NULL_LABELS)]
+            counts = counts.sort_values(ascending=False, kind='stable')
+            top = counts.index.to_frame(index=False).drop_duplicates(parent)
+            self.group_modes_[child] = pd.Series(top[child].to_numpy(), index=top[parent].to_numpy())
+        return self
+
+    def transform(self, X):
+        """
+        Функция заполняет пропуски в колонках датасета вычисленными при обучении значениями
+
+            Параметры:
+                X (DataFrame): датасет
+            Выходные параметры (DataFrame)
+
+        """
+        X = X.copy(deep=False)
+        for parent, child in self.pairs or []:
+            # Значения для заполнения по всем строкам сразу: самое частое дочернее значение родительского значения
+            X[child] = X[child].fillna(X[parent].map(self.group_modes_[child]))
+        for col, mode in self.modes_.items():
+            X[col] = X[col].fillna(mode)
+        return X
+
+
+### Кодирование категорий с обработкой неизвестных значений
+class CategoryEncoder(TransformerMixin, BaseEstimator):
+    """
+    Класс кодирует категориальные колонки номерами категорий в порядке сортировки (как OrdinalEncoder),
+    а категории, которых не было при обучении, кодирует по выбранному способу: 'error' - ошибка
+    (как в OrdinalEncoder), 'missing' - как пропуск (код значения, которым заполнены пропуски колонки,
+    а если пропусков при обучении не было - код самой частой категории), 'mean' - средний код колонки.
+    Тот же способ применяет компилированная модель (см. inference_functions.CompiledModel)
+
+        Параметры:
+            unknown (str): обработка неизвестных категорий: 'error', 'missing' или 'mean'
+            missing_value (str, None): значение, которым заполнены пропуски в колонках
+
+    """
+
+    unknown_policies = ('error', 'missing', 'mean')
+
+    def __init__(self, unknown='missing', missing_value=None):
+        self.unknown = unknown
+        self.missing_value = missing_value
+
+    def fit(self, X, y=None):
+        """
+        Функция запоминает категории колонок и коды для неизвестных категорий
+
+            Параметры:
+                X (DataFrame): датасет категориальных колонок без пропусков
+                y: не используется (для совместимости с pipeline)
+            Выходные параметры (CategoryEncoder)
+
+        """
+        self.feature_names_in_ = np.asarray(X.columns, dtype=object)
+        self.categories_, self.missing_codes_, self.mean_codes_ = [], [], []
+        for col in X.columns:
+            codes, categories = pd.factorize(X[col], sort=True)
+            self.categories_.append(np.asarray(categories, dtype=object))
+            position = np.flatnonzero(categories == self.missing_value)
+            self.missing_codes_.append(float(position[0]) if len(position)
+                                       else float(np.bincount(codes).argmax()))
+            self.mean_codes_.append(float(codes.mean()))
+        return self
+
+    def unknown_codes(self):
+        """
+        Функция возвращает коды неизвестных категорий по колонкам для текущего способа обработки
+
+            Выходные параметры (list, None): None при unknown='error'
+
+        """
+        if self.unknown not in self.unknown_policies:
+            raise ValueError(f'Неизвестный способ обработки неизвестных категорий: {self.unknown}')
+        if self.unknown == 'error':
+            return None
+        return self.missing_codes_ if self.unknown == 'missing' else self.mean_codes_
+
+    def transform(self, X):
+        """
+        Функция кодирует колонки датасета
+
+            Параметры:
+                X (DataFrame): датасет категориальных колонок
+            Выходные параметры (ndarray)
+
+        """
+        unknown_codes = self.unknown_codes()
+        encoded = np.empty((len(X), len(self.feature_names_in_)), dtype=np.float64)
+        for j, col in enumerate(self.feature_names_in_):
+            # Номер категории при обучении; неизвестные значения получают -1
+            codes = pd.Index(self.categories_[j]).get_indexer(X[col])
+            unknown = codes < 0
+            encoded[:, j] = codes
+            if unknown.any():
+                if unknown_codes is None:
+                    values = pd.unique(np.asarray(X[col], dtype=object)[unknown])
+                    raise ValueError(f'Found unknown categories {list(values)} in column {j} during transform')
+                encoded[unknown, j] = unknown_codes[j]
+        return encoded
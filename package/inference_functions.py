@@ -0,0 +1,571 @@
+import os
+import re
+import json
+import time
+import shutil
+import tempfile
+import threading
+import datetime as dt
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor
+
+
+# Дата и время визита в форматах, которые разбирает pipeline модели ('%Y-%m-%d' и '%H:%M:%S.%f'
+# в generate_basic_features); поля записей проверяются по ним одинаково для обеих реализаций модели
+VISIT_DATE_PATTERN = re.compile(r'([0-9]{4})-([0-9]{1,2})-([0-9]{1,2})')
+VISIT_TIME_PATTERN = re.compile(r'([0-9]{1,2}):([0-9]{1,2}):([0-9]{1,2})\.[0-9]{1,9}')
+
+
+### Разбор даты визита
+def parse_visit_date(value):
+    """
+    Функция разбирает дату визита в формате 'YYYY-MM-DD'
+
+        Параметры:
+            value (str): дата визита
+        Выходные параметры (date, None): None, если значение не является датой в этом формате
+
+    """
+    match = VISIT_DATE_PATTERN.fullmatch(value) if isinstance(value, str) else None
+    if match is None:
+        return None
+    try:
+        return dt.date(*map(int, match.groups()))
+    except ValueError:
+        return None
+
+
+### Разбор часа визита
+def parse_visit_hour(value):
+    """
+    Функция возвращает час из времени визита в формате 'HH:MM:SS.ffffff'
+
+        Параметры:
+            value (str): время визита
+        Выходные параметры (int, None): None, если значение не является временем в этом формате
+
+    """
+    match = VISIT_TIME_PATTERN.fullmatch(value) if isinstance(value, str) else None
+    if match is None:
+        return None
+    hour, minute, second = map(int, match.groups())
+    return hour if hour < 24 and minute < 60 and second < 60 else None
+
+
+### Проверка полей даты и времени визита в записях
+def visit_field_errors(records):
+    """
+    Функция проверяет дату и время визита каждой записи за один проход, без вызова модели
+
+        Параметры:
+            records (list): список словарей с атрибутами визитов
+        Выходные параметры (list): по каждой записи описание ошибки или None
+
+    """
+    errors = []
+    for record in records:
+        visit_date, visit_time = record.get('visit_date'), record.get('visit_time')
+        if parse_visit_date(visit_date) is None:
+            errors.append(f"Поле 'visit_date' должно содержать дату в формате YYYY-MM-DD, получено: {visit_date!r}")
+        elif parse_visit_hour(visit_time) is None:
+            errors.append(f"Поле 'visit_time' должно содержать время в формате HH:MM:SS.ffffff, "
+                          f"получено: {visit_time!r}")
+        else:
+            errors.append(None)
+    return errors
+
+
+### Таблицы кодирования категориальных атрибутов
+def category_tables(categories, offset, scale):
+    """
+    Функция формирует по каждому категориальному атрибуту таблицу {значение: итоговое значение признака},
+    объединяющую код OrdinalEncoder и стандартизацию StandardScaler
+
+        Параметры:
+            categories (list): категории OrdinalEncoder по каждому атрибуту (в порядке кодов)
+            offset (ndarray): сдвиг StandardScaler по каждому атрибуту
+            scale (ndarray): масштаб StandardScaler по каждому атрибуту
+        Выходные параметры (list): список словарей
+
+    """
+    return [dict(zip(list(values), ((np.arange(len(values)) - offset[j]) / scale[j]).tolist()))
+            for j, values in enumerate(categories)]
+
+
+### Компилированная модель для предсказаний без pandas и sklearn
+class CompiledModel:
+    """
+    Класс хранит параметры обученного pipeline в виде словарей и массивов NumPy
+    и выполняет предсказания по сырым записям визитов (способ спуска по лесу выбирается по размеру пакета,
+    см. FlatForest)
+
+        Параметры:
+            cat_features (list): категориальные атрибуты в порядке колонок модели
+            cat_tables (list): таблицы {значение: итоговое значение признака} по каждому категориальному атрибуту
+            cat_mean (ndarray): итоговое значение признака для среднего кода каждого категориального атрибута
+            missing_value (str, list): значение, которым заполняются пропуски категориальных атрибутов
+                                       (или список значений по каждому атрибуту)
+            flags (list): список кортежей (атрибут, множество значений) для признаков is_*
+            other_offset (ndarray): сдвиг StandardScaler признаков is_* и признаков даты и времени
+            other_scale (ndarray): масштаб StandardScaler признаков is_* и признаков даты и времени
+            forest (FlatForest): упакованный в массивы случайный лес
+            classes (ndarray): классы модели
+            unknown (str): обработка неизвестных категорий: 'error' - ошибка (как в OrdinalEncoder),
+                           'missing' - как пропуск, 'mean' - среднее значение признака
+            unknown_values (list, None): значения признаков для неизвестных категорий при unknown='missing'
+                                         (по кодам CategoryEncoder; None - значение для пропуска, а если его
+                                         не было при обучении - среднее значение признака)
+
+    """
+
+    unknown_policies = ('error', 'missing', 'mean')
+
+    def __init__(self, cat_features, cat_tables, cat_mean, missing_value,
+                 flags, other_offset, other_scale, forest, classes, unknown='missing', unknown_values=None):
+        if unknown not in self.unknown_policies:
+            raise ValueError(f'Неизвестный способ обработки неизвестных категорий: {unknown}')
+        self.cat_features = list(cat_features)
+        self.cat_tables = cat_tables
+        self.cat_mean = np.asarray(cat_mean, dtype=np.float64)
+        self.missing_value = missing_value
+        self.flags = [(source, frozenset(values)) for source, values in flags]
+        self.other_offset = np.asarray(other_offset, dtype=np.float64)
+        self.other_scale = np.asarray(other_scale, dtype=np.float64)
+        self.forest = forest
+        self.classes_ = np.asarray(classes)
+        self.unknown = unknown
+        self._missing = (list(missing_value) if isinstance(missing_value, (list, tuple))
+                         else [missing_value] * len(self.cat_features))
+        # Таблицы для поиска: пропуск (None) кодируется как значение для пропусков, если оно было в обучении
+        self._lookup = []
+        for table, missing in zip(cat_tables, self._missing):
+            lookup = dict(table)
+            if missing in table:
+                lookup[None] = table[missing]
+            self._lookup.append(lookup)
+        if unknown_values is None:
+            unknown_values = [table.get(missing, mean)
+                              for table, missing, mean in zip(cat_tables, self._missing, self.cat_mean)]
+        self.unknown_values = np.asarray(unknown_values, dtype=np.float64)
+        self._unknown_values = (self.unknown_values if unknown == 'missing' else self.cat_mean).tolist()
+
+    @staticmethod
+    def _columns(data):
+        # Пакет может быть списком записей или словарём колонок
+        if isinstance(data, dict):
+            return data, len(next(iter(data.values())))
+        columns = {}
+        for record in data:
+            for key, value in record.items():
+                columns.setdefault(key, []).append(value)
+        return columns, len(data)
+
+    def _encode(self, j, values):
+        lookup = self._lookup[j]
+        try:
+            return [lookup[value] for value in values]
+        except (KeyError, TypeError):
+            pass
+        # Медленный путь: пропуски NaN и неизвестные категории
+        missing, default, encoded = self._missing[j], self._unknown_values[j], []
+        for value in values:
+            if value is None or value != value:
+                value = missing
+            if value in lookup:
+                encoded.append(lookup[value])
+            elif self.unknown == 'error':
+                raise ValueError(f'Found unknown categories [{value!r}] in column {j} during transform')
+            else:
+                encoded.append(default)
+        return encoded
+
+    def transform(self, data):
+        """
+        Функция преобразует записи визитов в матрицу признаков модели (аналог шага 'preprocessing')
+
+            Параметры:
+                data (list, dict): список записей визитов или словарь колонок
+            Выходные параметры (ndarray)
+
+        """
+        columns, n_rows = self._columns(data)
+        n_cat = len(self.cat_features)
+        X = np.empty((n_rows, n_cat + len(self.flags) + 5), dtype=np.float64)
+
+        # Категориальные атрибуты: одно обращение к таблице заменяет пропуски, OrdinalEncoder и StandardScaler
+        for j, col in enumerate(self.cat_features):
+            X[:, j] = self._encode(j, columns[col])
+
+        # Признаки is_*
+        for j, (source, values) in enumerate(self.flags):
+            X[:, n_cat + j] = [value in values for value in columns[source]]
+
+        # Признаки даты (год, месяц, день, день недели) и час визита: поля разбираются по форматам pipeline,
+        # значения, которые отклоняет pipeline, отклоняются и здесь (см. visit_field_errors)
+        j = n_cat + len(self.flags)
+        dates = [parse_visit_date(value) for value in columns['visit_date']]
+        hours = [parse_visit_hour(value) for value in columns['visit_time']]
+        if None in dates or None in hours:
+            i = next(i for i in range(n_rows) if dates[i] is None or hours[i] is None)
+            raise ValueError(visit_field_errors([{'visit_date': columns['visit_date'][i],
+                                                  'visit_time': columns['visit_time'][i]}])[0])
+        X[:, j] = [date.year for date in dates]
+        X[:, j + 1] = [date.month for date in dates]
+        X[:, j + 2] = [date.day for date in dates]
+        X[:, j + 3] = [date.weekday() for date in dates]
+        X[:, j + 4] = hours
+        X[:, n_cat:] = (X[:, n_cat:] - self.other_offset) / self.other_scale
+
+        return X
+
+    def predict_proba(self, data):
+        """
+        Функция предсказывает вероятности классов для записей визитов
+
+            Параметры:
+                data (list, dict): список записей визитов или словарь колонок
+            Выходные параметры (ndarray)
+
+        """
+        return self.forest.predict_proba(self.transform(data))
+
+    def predict(self, data):
+        return self.classes_.take(self.predict_proba(data).argmax(axis=1))
+
+
+### Случайный лес, упакованный в непрерывные массивы узлов
+class FlatForest:
+    """
+    Класс хранит узлы всех деревьев леса в общих массивах и спускается по всем деревьям
+    сразу для всего пакета записей, уровень за уровнем.
+    Спуск по уровням быстрее леса sklearn на одиночных запросах и микропакетах (до small_batch записей), но на
+    больших пакетах лес sklearn, спускающийся по каждому дереву в компилированном цикле, быстрее
+    (см. замер forest в benchmarks/run_benchmarks.py: 1 запись - в 12 раз быстрее sklearn, 512 - наравне,
+    4096 и 1 млн - в 2-2.7 раза медленнее).
+    Поэтому пакеты больше small_batch записей считаются деревьями sklearn, восстановленными по массивам леса
+    при первом большом пакете (узлы копируются в память процесса); без sklearn - спуском по уровням частями
+
+        Параметры:
+            feature (ndarray): номер признака в узле
+            threshold (ndarray): порог узла (спуск влево при значении признака <= порога)
+            children (ndarray): глобальные номера потомков узлов парами (левый, правый); лист ссылается сам на себя
+            value (ndarray): нормированные вероятности классов в узле
+            is_leaf (ndarray): признак листа
+            roots (ndarray): номера корней деревьев
+            max_depth (int): максимальная глубина деревьев
+            n_threads (int): количество потоков для больших пакетов (0 - по числу ядер)
+            chunk_size (int, None): количество записей в части пакета при спуске по уровням без sklearn
+                                    (по умолчанию ~1 млн пар дерево-запись)
+
+    """
+
+    # Через сколько уровней спуска из обработки исключаются пары, дошедшие до листа
+    compact_every = 4
+    # Размер пакета, до которого упакованный лес не медленнее леса sklearn
+    small_batch = 512
+
+    def __init__(self, feature, threshold, children, value, is_leaf, roots, max_depth,
+                 n_threads=1, chunk_size=None):
+        self.feature = feature
+        self.threshold = threshold
+        self.children = children
+        self.value = value
+        self.is_leaf = is_leaf
+        self.roots = roots
+        self.max_depth = int(max_depth)
+        self.n_threads = n_threads
+        self.chunk_size = chunk_size or max(1, 1_000_000 // len(roots))
+        self._trees = None
+        self._trees_lock = threading.Lock()
+
+    @classmethod
+    def from_trees(cls, trees, **kwargs):
+        """
+        Функция упаковывает деревья (результат tree_arrays) в общие массивы
+
+            Параметры:
+                trees (list): список словарей массивов деревьев
+            Выходные параметры (FlatForest)
+
+        """
+        sizes = np.array([len(tree['feature']) for tree in trees])
+        roots = np.concatenate([[0], np.cumsum(sizes)[:-1]]).astype(np.int32)
+        children = np.concatenate([np.column_stack([tree['left'], tree['right']]) + root
+                                   for tree, root in zip(trees, roots)]).astype(np.int32).ravel()
+        return cls(feature=np.concatenate([tree['feature'] for tree in trees]),
+                   threshold=np.concatenate([tree['threshold'] for tree in trees]),
+                   children=children,
+                   value=np.concatenate([tree['value'] for tree in trees]),
+                   is_leaf=children[0::2] == np.arange(len(children) // 2),
+                   roots=roots,
+                   max_depth=max(tree['max_depth'] for tree in trees),
+                   **kwargs)
+
+    @classmethod
+    def from_estimator(cls, rf, **kwargs):
+        """
+        Функция упаковывает обученный RandomForestClassifier
+
+            Параметры:
+                rf (RandomForestClassifier): обученный случайный лес
+            Выходные параметры (FlatForest)
+
+        """
+        return cls.from_trees([tree_arrays(estimator.tree_) for estimator in rf.estimators_], **kwargs)
+
+    @classmethod
+    def from_model_file(cls, path='model.pickle', **kwargs):
+        """
+        Функция упаковывает случайный лес из файла модели, записанного pipeline.py
+
+            Параметры:
+                path (str): путь к файлу модели в формате pickle (dill)
+            Выходные параметры (FlatForest)
+
+        """
+        import dill
+        with open(path, 'rb') as file:
+            model = dill.load(file)
+        return cls.from_estimator(model['best_model'].steps[-1][1], **kwargs)
+
+    def _predict_chunk(self, X):
+        n_rows, n_features = X.shape
+        n_trees = len(self.roots)
+        X = X.ravel()
+        # Пары (дерево, запись) разворачиваются в один вектор: дерево за деревом
+        node = np.repeat(self.roots, n_rows)
+        row_offset = np.tile(np.arange(n_rows, dtype=np.int32) * n_features, n_trees)
+        position = np.arange(len(node), dtype=np.int32)
+        leaf_node = np.empty(len(node), dtype=np.int32)
+        for level in range(self.max_depth):
+            go_right = ~(X[row_offset + self.feature[node]] <= self.threshold[node])
+            node = self.children[2 * node + go_right]
+            # Пары, дошедшие до листа, периодически убираем из обработки
+            if level % self.compact_every == self.compact_every - 1:
+                leaf = self.is_leaf[node]
+                leaf_node[position[leaf]] = node[leaf]
+                keep = ~leaf
+                node, row_offset, position = node[keep], row_offset[keep], position[keep]
+                if not node.size:
+                    break
+        leaf_node[position] = node
+        return self.value[leaf_node].reshape(n_trees, n_rows, -1).sum(axis=0) / n_trees
+
+    def sklearn_trees(self, n_features):
+        """
+        Функция восстанавливает по массивам леса деревья sklearn (объекты tree_ обученных деревьев)
+        с теми же порогами и нормированными вероятностями классов в листьях; деревья строятся один раз
+
+            Параметры:
+                n_features (int): количество признаков модели
+            Выходные параметры (list): список деревьев sklearn.tree._tree.Tree
+
+        """
+        with self._trees_lock:
+            if self._trees is None:
+                from sklearn.tree._tree import Tree, NODE_DTYPE
+
+                n_classes = self.value.shape[1]
+                bounds = np.append(self.roots, len(self.feature))
+                trees = []
+                for start, end in zip(bounds[:-1], bounds[1:]):
+                    # Номера потомков - внутри дерева; лист sklearn не имеет потомков и признака (-1 и -2)
+                    leaf = self.is_leaf[start:end]
+                    children = np.asarray(self.children[2 * start:2 * end]).reshape(-1, 2) - start
+                    nodes = np.zeros(end - start, dtype=NODE_DTYPE)
+                    nodes['left_child'] = np.where(leaf, -1, children[:, 0])
+                    nodes['right_child'] = np.where(leaf, -1, children[:, 1])
+                    nodes['feature'] = np.where(leaf, -2, self.feature[start:end])
+                    nodes['threshold'] = np.where(leaf, -2.0, self.threshold[start:end])
+                    tree = Tree(n_features, np.array([n_classes], dtype=np.intp), 1)
+                    tree.__setstate__({'max_depth': self.max_depth, 'node_count': end - start, 'nodes': nodes,
+                                       'values': np.array(self.value[start:end]).reshape(-1, 1, n_classes)})
+                    trees.append(tree)
+                self._trees = trees
+            return self._trees
+
+    def _predict_trees(self, X, trees):
+        proba = np.zeros((len(X), self.value.shape[1]))
+        for tree in trees:
+            proba += tree.predict(X)
+        return proba
+
+    def _predict_large(self, X):
+        # Большой пакет: деревья sklearn, при n_threads > 1 - группами деревьев в потоках
+        try:
+            trees = self.sklearn_trees(X.shape[1])
+        except ImportError:
+            return self._predict_levels(X)
+        n_threads = self.n_threads if self.n_threads > 0 else os.cpu_count()
+        if n_threads == 1:
+            return self._predict_trees(X, trees) / len(trees)
+        groups = [trees[i::n_threads] for i in range(n_threads)]
+        with ThreadPoolExecutor(max_workers=n_threads) as executor:
+            return sum(executor.map(lambda group: self._predict_trees(X, group), groups)) / len(trees)
+
+    def _predict_levels(self, X):
+        # Спуск по уровням частями пакета, при n_threads > 1 - части в потоках
+        chunks = [X[start:start + self.chunk_size] for start in range(0, len(X), self.chunk_size)]
+        if len(chunks) <= 1:
+            return self._predict_chunk(X)
+        n_threads = self.n_threads if self.n_threads > 0 else os.cpu_count()
+        if n_threads == 1:
+            return np.concatenate([self._predict_chunk(chunk) for chunk in chunks])
+        with ThreadPoolExecutor(max_workers=n_threads) as executor:
+            return np.concatenate(list(executor.map(self._predict_chunk, chunks)))
+
+    def predict_proba(self, X):
+        """
+        Функция предсказывает вероятности классов для матрицы признаков: до small_batch записей - спуском
+        по уровням, больше - деревьями sklearn (см. sklearn_trees)
+
+            Параметры:
+                X (ndarray): матрица признаков модели
+            Выходные параметры (ndarray)
+
+        """
+        # Деревья sklearn сравнивают признаки в точности float32
+        X = np.ascontiguousarray(X, dtype=np.float32)
+        if len(X) > self.small_batch:
+            return self._predict_large(X)
+        return self._predict_chunk(X)
+
+
+### Преобразование дерева sklearn в массивы NumPy
+def tree_arrays(tree):
+    """
+    Функция выгружает узлы обученного дерева решений в массивы NumPy (номера узлов - внутри дерева)
+
+        Параметры:
+            tree (Tree): атрибут tree_ обученного DecisionTreeClassifier
+        Выходные параметры (dict)
+
+    """
+    left = tree.children_left.astype(np.int32)
+    right = tree.children_right.astype(np.int32)
+    feature = tree.feature.astype(np.int32)
+    threshold = tree.threshold.astype(np.float64)
+    leaves = np.flatnonzero(left == -1)
+    # Лист зацикливается на себя: спуск по нему не меняет узел
+    left[leaves] = right[leaves] = leaves
+    feature[leaves] = 0
+    threshold[leaves] = 0.0
+    value = tree.value[:, 0, :].astype(np.float64)
+    normalizer = value.sum(axis=1, keepdims=True)
+    normalizer[normalizer == 0.0] = 1.0
+    return {'feature': feature, 'threshold': threshold, 'left': left, 'right': right,
+            'value': value / normalizer, 'max_depth': int(tree.max_depth)}
+
+
+### Параметры StandardScaler в виде сдвига и масштаба
+def scaler_affine(scaler, n_features):
+    """
+    Функция возвращает сдвиг и масштаб обученного StandardScaler (с учётом with_mean и with_std)
+
+        Параметры:
+            scaler (StandardScaler): обученный StandardScaler
+            n_features (int): количество признаков
+        Выходные параметры (tuple)
+
+    """
+    offset = scaler.mean_ if scaler.with_mean else np.zeros(n_features)
+    scale = scaler.scale_ if scaler.with_std else np.ones(n_features)
+    return np.asarray(offset, dtype=np.float64), np.asarray(scale, dtype=np.float64)
+
+
+### Запись компилированной модели в формате, загружаемом через отображение в память
+def save_bundle(model, metadata, path='model_bundle', keep=2, sample=None):
+    """
+    Функция записывает компилированную модель в каталог: манифест (manifest.json) с метаданными
+    и параметрами модели, а также массивы NumPy (.npy) в подкаталоге версии
+
+        Параметры:
+            model (CompiledModel): компилированная модель
+            metadata (dict): метаданные модели
+            path (str): каталог модели
+            keep (int): количество хранимых версий массивов (ранее загруженные сервисом версии остаются доступны)
+            sample (list): записи визитов для прогрева модели при запуске сервиса
+        Выходные параметры:
+            manifest_path (str): путь к манифесту модели
+
+    """
+    forest = model.forest
+    arrays = {'cat_mean': model.cat_mean, 'unknown_values': model.unknown_values,
+              'other_offset': model.other_offset, 'other_scale': model.other_scale,
+              'feature': forest.feature, 'threshold': forest.threshold, 'children': forest.children,
+              'value': forest.value, 'is_leaf': forest.is_leaf, 'roots': forest.roots}
+    for j, table in enumerate(model.cat_tables):
+        # Таблица кодирования записывается двумя массивами: категории и итоговые значения признака
+        arrays[f'categories_{j}'] = np.array(list(table), dtype=str)
+        arrays[f'cat_values_{j}'] = np.array(list(table.values()), dtype=np.float64)
+
+    # Каталог версии создаётся с уникальным именем: записи модели в одну секунду не пересекаются
+    os.makedirs(path, exist_ok=True)
+    version = os.path.basename(tempfile.mkdtemp(prefix=f"arrays-{time.strftime('%Y%m%d%H%M%S')}-", dir=path))
+    os.chmod(os.path.join(path, version), 0o755)
+    for name, array in arrays.items():
+        np.save(os.path.join(path, version, f'{name}.npy'), np.ascontiguousarray(array))
+
+    manifest = {'format_version': 2,
+                'metadata': metadata,
+                'arrays_dir': version,
+                'arrays': sorted(arrays),
+                'cat_features': model.cat_features,
+                'missing_value': model.missing_value,
+                'unknown_category': model.unknown,
+                'flags': [[source, sorted(values)] for source, values in model.flags],
+                'classes': model.classes_.tolist(),
+                'max_depth': forest.max_depth,
+                'sample': sample or []}
+    # Манифест подменяется атомарно и переключает сервис на новую версию массивов
+    manifest_path = os.path.join(path, 'manifest.json')
+    with open(manifest_path + '.tmp', 'w', encoding='utf-8') as file:
+        json.dump(manifest, file, ensure_ascii=False, indent=1)
+    os.replace(manifest_path + '.tmp', manifest_path)
+
+    # Текущая версия сохраняется всегда: порядок имён версий, записанных в одну секунду, не определён
+    versions = sorted(name for name in os.listdir(path) if name.startswith('arrays-') and name != version)
+    for name in versions[:max(len(versions) - keep + 1, 0)]:
+        shutil.rmtree(os.path.join(path, name), ignore_errors=True)
+    return manifest_path
+
+
+### Загрузка компилированной модели с отображением массивов в память
+def load_bundle(path='model_bundle', mmap_mode='r', n_threads=1, unknown=None):
+    """
+    Функция загружает компилированную модель из каталога; массивы отображаются в память,
+    поэтому процессы сервиса используют одну копию модели в кэше страниц
+
+        Параметры:
+            path (str): каталог модели
+            mmap_mode (str, None): режим отображения массивов в память (None - чтение в память процесса)
+            n_threads (int): количество потоков упакованного леса для больших пакетов
+            unknown (str, None): обработка неизвестных категорий (None - как задано при обучении)
+        Выходные параметры (dict): словарь модели с ключами 'best_model' и 'metadata'
+
+    """
+    with open(os.path.join(path, 'manifest.json'), encoding='utf-8') as file:
+        manifest = json.load(file)
+    arrays = {name: np.load(os.path.join(path, manifest['arrays_dir'], f'{name}.npy'), mmap_mode=mmap_mode)
+              for name in manifest['arrays']}
+
+    forest = FlatForest(feature=arrays['feature'], threshold=arrays['threshold'],
+                        children=arrays['children'], value=arrays['value'],
+                        is_leaf=arrays['is_leaf'], roots=arrays['roots'],
+                        max_depth=manifest['max_depth'], n_threads=n_threads)
+    n_cat = len(manifest['cat_features'])
+    categories = [arrays[f'categories_{j}'].tolist() for j in range(n_cat)]
+    cat_tables = [dict(zip(categories[j], arrays[f'cat_values_{j}'].tolist())) for j in range(n_cat)]
+    cat_mean = arrays['cat_mean']
+    # Значения для неизвестных категорий записываются с моделями, обученными с CategoryEncoder
+    unknown_values = arrays['unknown_values'] if 'unknown_values' in arrays else None
+    model = CompiledModel(cat_features=manifest['cat_features'],
+                          cat_tables=cat_tables, cat_mean=cat_mean,
+                          missing_value=manifest['missing_value'],
+                          flags=manifest['flags'],
+                          other_offset=arrays['other_offset'], other_scale=arrays['other_scale'],
+                          forest=forest,
+                          classes=manifest['classes'],
+                          unknown=unknown or manifest.get('unknown_category', 'missing'),
+                          unknown_values=unknown_values)
+    return {'best_model': model, 'metadata': manifest['metadata']}
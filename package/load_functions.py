@@ -6,44 +6,229 @@ import matplotlib.pylab as plt
 from matplotlib.ticker import FormatStrFormatter
 import numpy as np
 from scipy import stats
-import multiprocessing
-from multiprocessing import Pool, Manager
+
+from package.profiling_functions import peak_memory
+from package.report_functions import missing_matrix, plots_enabled, wait_plots
+
+
+# Каталог с файлами источников данных
+DATA_PATH = '../Data/'
+# Строковая колонка загружается как category, если уникальных значений в выборке не больше этой доли строк
+CATEGORY_RATIO = 0.5
+# Действия в датасете событий, считающиеся целевыми
+TARGET_ACTIONS = frozenset(['sub_car_claim_click', 'sub_car_claim_submit_click',
+                            'sub_open_dialog_click', 'sub_custom_question_submit_click',
+                            'sub_call_number_click', 'sub_callback_submit_click',
+                            'sub_submit_success', 'sub_car_request_submit_click'])
 
 
 ### Функция загрузки датасета
-def file_load(file_name):
+def file_load(file_name, schema='infer', usecols=None, chunksize=None, parse_dates=False, data_path=DATA_PATH):
     """
-    Функция загружает Датасет из файла источника
+    Функция загружает Датасет из файла источника с компактными типами данных колонок
 
         Параметры:
             file_name (str): имя файла с данными
+            schema (dict, str, None): схема типов колонок (см. infer_schema), 'infer' - определить по выборке строк,
+                                      None - типы данных pandas по умолчанию
+            usecols (list, None): загружаемые колонки (None - все)
+            chunksize (int, None): количество строк, читаемых за один раз (None - файл читается целиком)
+            parse_dates (bool): флаг разбора колонок дат при чтении (иначе даты остаются строками)
+            data_path (str): каталог с файлами источников данных
         Выходные параметры (DataFrame)
 
     """
-    file_path = '../Data/' + file_name
+    file_path = data_path + file_name
     print('... загружаем файл с данными датасета ...')
-    df = pd.read_csv(file_path)
-    file_info(df, file_path)
-    print('\n... готовим иллюстрацию заполненности датасета значениями ...')
-    msno.matrix(df)  # визуализируем заполнение занчениями датасета
+    if schema == 'infer':
+        schema = infer_schema(file_path, usecols=usecols)
+    if chunksize is None:
+        df = compact_numeric(pd.read_csv(file_path, usecols=usecols, **read_options(schema, parse_dates)))
+    else:
+        df = concat_chunks(file_chunks(file_path, chunksize, schema, usecols, parse_dates))
+    file_info(df, file_path, schema)
+    if plots_enabled():
+        print('\n... готовим иллюстрацию заполненности датасета значениями ...')
+        # визуализируем заполнение занчениями датасета по стратифицированной выборке строк
+        missing_matrix(df, name=os.path.splitext(file_name)[0])
+        # В режиме 'files' дожидаемся записи файла иллюстрации и выводим ошибки отрисовки
+        wait_plots()
 
     return df
 
 
+### Функция определения компактных типов данных колонок по выборке строк файла
+def infer_schema(file_path, sample_rows=100_000, usecols=None, category_ratio=CATEGORY_RATIO):
+    """
+    Функция читает первые строки файла и определяет колонки, которые загружаются как category,
+    и колонки дат (в формате ГГГГ-ММ-ДД)
+
+        Параметры:
+            file_path (str): путь к файлу с данными
+            sample_rows (int): количество строк выборки
+            usecols (list, None): загружаемые колонки (None - все)
+            category_ratio (float): максимальная доля уникальных значений категориальной колонки
+        Выходные параметры:
+            schema (dict): словарь с ключами 'dtype' (типы колонок), 'dates' (колонки дат)
+                           и 'row_bytes' (память строки с типами данных по умолчанию, байт)
+
+    """
+    sample = pd.read_csv(file_path, nrows=sample_rows, usecols=usecols, low_memory=False)
+    schema = {'dtype': {}, 'dates': [],
+              'row_bytes': sample.memory_usage(deep=True, index=False).sum() / max(len(sample), 1)}
+    for col in sample.columns:
+        values = sample[col]
+        if pd.api.types.is_numeric_dtype(values):
+            continue
+        non_null = values.dropna()
+        if len(non_null) and non_null.astype(str).str.fullmatch(r'\d{4}-\d{2}-\d{2}').all():
+            schema['dates'].append(col)
+        if values.nunique() <= category_ratio * len(values):
+            schema['dtype'][col] = 'category'
+        else:
+            # В колонке встречаются числа и строки - читаем все значения как строки (без DtypeWarning)
+            schema['dtype'][col] = 'str'
+    return schema
+
+
+### Параметры pd.read_csv по схеме типов колонок
+def read_options(schema, parse_dates=False):
+    if schema is None:
+        return {'low_memory': False}
+    dtype = dict(schema['dtype'])
+    options = {'dtype': dtype}
+    if parse_dates and schema['dates']:
+        for col in schema['dates']:
+            dtype.pop(col, None)
+        options.update(parse_dates=schema['dates'], date_format='%Y-%m-%d')
+    return options
+
+
+### Функция уменьшения разрядности числовых колонок без потери значений
+def compact_numeric(df):
+    """
+    Функция переводит целочисленные колонки в наименьший подходящий целый тип,
+    а вещественные колонки - в float32, если значения при этом не меняются
+
+        Параметры:
+            df (DataFrame): датасет
+        Выходные параметры (DataFrame)
+
+    """
+    for col in df.columns:
+        values = df[col]
+        if pd.api.types.is_integer_dtype(values) and not pd.api.types.is_bool_dtype(values):
+            df[col] = pd.to_numeric(values, downcast='integer')
+        elif pd.api.types.is_float_dtype(values) and values.dtype != np.float32:
+            compact = values.astype(np.float32)
+            if ((compact == values) | values.isna()).all():
+                df[col] = compact
+    return df
+
+
+### Генератор частей файла с компактными типами данных
+def file_chunks(file_path, chunksize=1_000_000, schema='infer', usecols=None, parse_dates=False):
+    """
+    Функция читает файл частями по chunksize строк и возвращает каждую часть с компактными типами данных
+
+        Параметры:
+            file_path (str): путь к файлу с данными
+            chunksize (int): количество строк в части
+            schema (dict, str, None): схема типов колонок, 'infer' - определить по выборке строк
+            usecols (list, None): загружаемые колонки (None - все)
+            parse_dates (bool): флаг разбора колонок дат при чтении
+        Выходные параметры (generator): части датасета (DataFrame)
+
+    """
+    if schema == 'infer':
+        schema = infer_schema(file_path, usecols=usecols)
+    with pd.read_csv(file_path, usecols=usecols, chunksize=chunksize, **read_options(schema, parse_dates)) as reader:
+        for chunk in reader:
+            yield compact_numeric(chunk)
+
+
+### Функция объединения частей датасета с сохранением категориальных колонок
+def concat_chunks(chunks):
+    """
+    Функция объединяет части датасета; категории колонок category приводятся к общему набору,
+    иначе pd.concat превратил бы такие колонки в строковые
+
+        Параметры:
+            chunks (iterable): части датасета (DataFrame)
+        Выходные параметры (DataFrame)
+
+    """
+    chunks = list(chunks)
+    for col in chunks[0].columns:
+        if isinstance(chunks[0][col].dtype, pd.CategoricalDtype):
+            # В части из одних пропусков набор категорий пустой (типа object) и в объединение не входит
+            parts = [chunk[col] for chunk in chunks if len(chunk[col].cat.categories)]
+            categories = pd.api.types.union_categoricals(parts).categories if parts \
+                else chunks[0][col].cat.categories
+            for chunk in chunks:
+                chunk[col] = chunk[col].cat.set_categories(categories)
+    return pd.concat(chunks, ignore_index=True)
+
+
+### Функция потокового расчёта целевой переменной визитов по файлу событий
+def hits_conversion(file_name, target_actions=TARGET_ACTIONS, chunksize=1_000_000, data_path=DATA_PATH):
+    """
+    Функция читает файл событий частями (только колонки session_id и event_action) и для каждого визита
+    определяет, было ли в нём целевое действие; весь датасет событий в памяти не хранится
+
+        Параметры:
+            file_name (str): имя файла событий (ga_hits.csv)
+            target_actions (set): целевые действия
+            chunksize (int): количество строк, читаемых за один раз
+            data_path (str): каталог с файлами источников данных
+        Выходные параметры:
+            df_conversion (DataFrame): признак целевого действия (conversion_rate) с индексом session_id,
+                                       как после groupby('session_id').agg({'conversion_rate': 'max'})
+
+    """
+    schema = {'dtype': {'session_id': 'str', 'event_action': 'category'}, 'dates': []}
+    target_actions = list(target_actions)
+    # Накапливаются множества визитов и визитов с целевым действием: в них добавляются только уникальные
+    # визиты каждой части (одна запись на визит, а не на событие), накопленные визиты повторно не группируются
+    sessions, flagged = set(), set()
+    for chunk in file_chunks(data_path + file_name, chunksize, schema, usecols=['session_id', 'event_action']):
+        codes, uniques = pd.factorize(chunk['session_id'])
+        # isin по колонке category проверяет только её категории, а не каждое значение
+        target_codes = np.unique(codes[chunk['event_action'].isin(target_actions).to_numpy()])
+        # Пропуск session_id получает код -1 и, как в groupby, не учитывается
+        target_codes = target_codes[target_codes >= 0]
+        del chunk
+        sessions.update(uniques.tolist())
+        flagged.update(uniques.take(target_codes).tolist())
+
+    index = pd.Index(sorted(sessions), name='session_id')
+    del sessions
+    df_conversion = pd.DataFrame({'conversion_rate': index.isin(flagged).astype(np.uint8)}, index=index)
+    print(f'Целевая переменная рассчитана для {len(df_conversion)} визитов, '
+          f'визитов с целевым действием: {int(df_conversion.conversion_rate.sum())}')
+    return df_conversion
+
+
 ### Функция определения характеристик файла источника данных
-def file_info(df, file_path):
+def file_info(df, file_path, schema=None):
     """
-    Функция описывает файл источник для загруженного датасета
+    Функция описывает файл источник для загруженного датасета и память, занятую датасетом
 
         Параметры:
             df (DataFrame): загруженный датасет
             file_path (sgr): отрносительнрый путь к файлу с датасетом
+            schema (dict, None): схема типов колонок (по ней оценивается память с типами данных по умолчанию)
         Выходные параметры (None)
 
     """
-    print(f'Источником данных является файл: {file_path[8:]}'
+    memory = df.memory_usage(deep=True).sum() / 1024 / 1024
+    print(f'Источником данных является файл: {os.path.basename(file_path)}'
           f'\nРазмер файла {os.stat(file_path).st_size} байт'
           f'\nВ файле содержится 1 таблица:'
           f'\n  - количество строк: {df.shape[0]}'
           f'\n  - количество столбцов: {df.shape[1]}')
-
+    if schema is not None:
+        print(f'Память датасета с типами данных по умолчанию (оценка): '
+              f'{schema["row_bytes"] * len(df) / 1024 / 1024:.1f} МБ')
+    print(f'Память загруженного датасета: {memory:.1f} МБ'
+          f'\nПиковая память процесса: {peak_memory()} МБ')
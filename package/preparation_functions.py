@@ -1,11 +1,16 @@
 import os
 import pandas as pd
-import datetime as dt
 import missingno as msno
 import matplotlib.pylab as plt
 from matplotlib.ticker import FormatStrFormatter
 import numpy as np
 from scipy import stats
+from multiprocessing import Pool
+
+from package.audit_functions import dataset_audit
+from package.imputation_functions import ModeImputer
+from package.store_functions import dataset_write
+from package.report_functions import render, plots_enabled, wait_plots
 
 
 ### Функция коррекции данных в датасете
@@ -19,30 +24,26 @@ def dataset_preparation(df):
 
     """
     print('\nЭтап 1. ... запускаем проверку идентичности типов данных в полях датасета ...')
-    noncorrect_columns = checking_type_error(df)
+    type_report = checking_type_error(df)
+    print_type_report(type_report)
     print('... запускаем коррекцию типов данных в полях датасета ...')
-    correct_type(df, noncorrect_columns)
+    correct_type(df, list(type_report))
 
     print('\nЭтап 2. ... запускаем замену некорректного указания типа None ...')
     df = df.replace(['nan'], np.nan)
     print('Все некорректные указания на пустые значения заменены на None.')
 
     print('\nЭтап 3. ... запускаем изменение типов данных в полях даты и времени ...')
-    if 'visit_date' in df.columns:
-        df['visit_date'] = df.visit_date.apply(lambda x:
-                                               dt.datetime.strptime(x, '%Y-%m-%d').date())
-        print("В поле 'visit_date' тип данных изменён на datetime.")
-    if 'visit_time' in df.columns:
-        df['visit_time'] = df.visit_time.apply(lambda x:
-                                               dt.datetime.strptime(x, '%H:%M:%S').time())
-        print("В поле 'visit_time' тип данных изменён на datetime.")
-    if 'hit_date' in df.columns:
-        df['hit_date'] = df.hit_date.apply(lambda x:
-                                           dt.datetime.strptime(x, '%Y-%m-%d').date())
-        print("В поле 'hit_date' тип данных изменён на datetime.")
+    for col in ('visit_date', 'hit_date'):
+        if col in df.columns and not pd.api.types.is_datetime64_dtype(df[col]):
+            df[col] = map_unique(df[col], lambda x: pd.to_datetime(x, format='%Y-%m-%d'))
+            print(f"В поле '{col}' тип данных изменён на datetime64.")
+    if 'visit_time' in df.columns and not pd.api.types.is_timedelta64_dtype(df['visit_time']):
+        df['visit_time'] = map_unique(df['visit_time'], pd.to_timedelta)
+        print("В поле 'visit_time' тип данных изменён на timedelta64.")
 
     print('\nЭтап 4. ... анализируем пропущенные значения в датасете ...')
-    data_set_audit(df)
+    data_set_audit(df, cache=False)
 
     if 'visit_date' in df.columns:
         # Список удаляемых колонок
@@ -75,47 +76,226 @@ def dataset_preparation(df):
         print('Записи с клиентами, имеющими аномально большое количество визитов - удалены.')
         print(f'Размер Датасета после удаления аномалий: {df.shape}')
 
-        # Агрегируем и визуализируем распределение атрибутов датасета
-        agg_changes(df)
+        # Поле клиента в датасете визитов: используется далее в ноутбуке в составе признаков модели (fit_columns)
+        df['client'] = df['client_id']
 
+        # Агрегируем распределение атрибутов датасета в куб визитов и визуализируем его
+        # (при выключенных графиках, set_plot_mode('off') или PLOT_MODE=off, куб только записывается в хранилище)
+        agg_changes(df, cube_name='visits_cube')
 
+    # В режиме 'files' дожидаемся записи файлов графиков подготовки и выводим ошибки отрисовки
+    wait_plots()
 
     return df
 
 
+### Функция преобразования колонки по её уникальным значениям
+def map_unique(values, convert):
+    """
+    Функция преобразует колонку (например, строки даты и времени в datetime64/timedelta64) одним векторным вызовом
+    для уникальных значений колонки, после чего раскладывает результат по строкам по кодам значений
+
+        Параметры:
+            values (Series): преобразуемая колонка
+            convert (function): векторная функция преобразования колонки уникальных значений
+        Выходные параметры (Series)
+
+    """
+    # Значения дат и времени визитов многократно повторяются: разбираются только уникальные значения,
+    # пропуск получает собственный код и преобразуется вместе с остальными значениями
+    codes, uniques = pd.factorize(values, use_na_sentinel=False)
+    converted = pd.Series(convert(pd.Series(np.asarray(uniques, dtype=object))))
+    return pd.Series(converted.to_numpy().take(codes), index=values.index, name=values.name)
+
+
+### Функция форматирования колонки дат строками
+def format_dates(values, date_format):
+    """
+    Функция записывает даты колонки типа datetime64 строками заданного формата (.dt.strftime форматирует
+    каждое значение отдельно, поэтому форматируются только уникальные даты)
+
+        Параметры:
+            values (Series): колонка типа datetime64
+            date_format (str): формат строк в нотации strftime
+        Выходные параметры (Series)
+
+    """
+    return map_unique(values, lambda x: pd.to_datetime(x).dt.strftime(date_format))
+
+
+### Функция приведения полей даты и времени к формату записи в базу данных
+def storage_format(df):
+    """
+    Функция возвращает копию датасета, в которой поля даты записаны строками 'YYYY-MM-DD', а поле времени визита -
+    строками 'HH:MM:SS.ffffff' (в таком виде pandas записывал в sqlite объекты date и time, и так их читает обучение)
+
+        Параметры:
+            df (DataFrame): датасет с полями даты и времени типов datetime64 и timedelta64
+        Выходные параметры (DataFrame)
+
+    """
+    df = df.copy(deep=False)
+    for col in ('visit_date', 'hit_date'):
+        if col in df.columns and pd.api.types.is_datetime64_dtype(df[col]):
+            df[col] = format_dates(df[col], '%Y-%m-%d')
+    if 'visit_time' in df.columns and pd.api.types.is_timedelta64_dtype(df['visit_time']):
+        df['visit_time'] = map_unique(df['visit_time'], lambda x: (pd.Timestamp(0) + pd.to_timedelta(x)).
+                                        dt.strftime('%H:%M:%S.%f'))
+
+    return df
+
+
+def _as_datetime(values):
+    # Колонка даты (даты и времени) типа datetime64[ns]; строки разбираются по уникальным значениям
+    if not pd.api.types.is_datetime64_any_dtype(values):
+        values = map_unique(values, pd.to_datetime)
+    return values.astype('datetime64[ns]')
+
+
+def _as_timedelta(values):
+    # Колонка времени типа timedelta64[ns]; строки разбираются по уникальным значениям
+    if not pd.api.types.is_timedelta64_dtype(values):
+        values = map_unique(values, pd.to_timedelta)
+    return values.astype('timedelta64[ns]')
+
+
+### Функция формирования даты и времени визита
+def date_time_visit(date, time):
+    """
+    Функция складывает дату и время визитов в поле типа datetime64[ns]; при отсутствии времени берётся начало дня,
+    при отсутствии даты - пропуск (NaT)
+
+        Параметры:
+            date (Series): дата визита (строки 'YYYY-MM-DD' или datetime64)
+            time (Series): время визита (строки 'HH:MM:SS' или timedelta64)
+        Выходные параметры (Series)
+
+    """
+    return _as_datetime(date) + _as_timedelta(time).fillna(pd.Timedelta(0))
+
+
+### Функция формирования даты и времени событий
+def date_time_ns(date_time, date, ns):
+    """
+    Функция формирует время событий объединённого датасета в поле типа datetime64[ns] арифметикой над колонками:
+    при наличии времени визита к нему прибавляется дробная часть секунды из времени события, при отсутствии -
+    время события прибавляется к началу дня даты события; пропуски времени события считаются нулём,
+    при отсутствии и времени визита, и даты события - пропуск (NaT)
+
+        Параметры:
+            date_time (Series): дата и время визита (строки или datetime64)
+            date (Series): дата события (строки 'YYYY-MM-DD' или datetime64)
+            ns (Series): время события (в наносекундах)
+        Выходные параметры (Series)
+
+    """
+    ns = pd.to_numeric(ns).to_numpy(dtype=float)
+    ns = np.trunc(np.nan_to_num(ns)).astype(np.int64)
+    has_date_time = date_time.notna().to_numpy()
+
+    # Время визита содержит целые секунды: от времени события берутся только наносекунды внутри секунды
+    visit_part = _as_datetime(date_time) + pd.to_timedelta(ns % 1_000_000_000, unit='ns')
+    hit_part = _as_datetime(date) + pd.to_timedelta(ns, unit='ns')
+    return visit_part.where(has_date_time, hit_part)
+
+
+### Функция формирования даты и времени событий объединённого датасета визитов и событий
+def merged_date_time(df):
+    """
+    Функция записывает в поле 'date_time' объединённого датасета время событий (см. date_time_ns) и удаляет поля
+    даты и времени событий; применяется к датасету в памяти и к корзинам bucket_join
+
+        Параметры:
+            df (DataFrame): объединённый датасет с полями 'date_time', 'hit_date', 'hit_time'
+        Выходные параметры (DataFrame)
+
+    """
+    df['date_time'] = date_time_ns(df['date_time'], df['hit_date'], df['hit_time'])
+    return df.drop(columns=['hit_date', 'hit_time'])
+
+
+# Результаты pd.api.types.infer_dtype, означающие значения разных типов в колонке
+MIXED_TYPES = ('mixed', 'mixed-integer', 'mixed-integer-float')
+
+
+### Функция проверки колонки на единство типа данных
+def column_types(values, sample_size=100_000, seed=42):
+    """
+    Функция проверяет колонку на значения разных типов: сначала по случайной выборке значений,
+    затем, если в выборке разных типов нет, по всей колонке (проверка выполняется без цикла Python)
+
+        Параметры:
+            values (Series): колонка датасета
+            sample_size (int): размер выборки значений
+            seed (int): зерно генератора случайных чисел
+        Выходные параметры:
+            report (dict, None): словарь с ключами 'inferred' (результат infer_dtype), 'types' (количество значений
+                                 каждого типа) и 'missing' (количество пропусков); None, если тип данных един
+
+    """
+    # Колонки числовых типов, строк, категорий и дат хранят значения одного типа
+    if values.dtype != object:
+        return None
+    inferred = None
+    if len(values) > sample_size:
+        inferred = pd.api.types.infer_dtype(values.sample(sample_size, random_state=seed), skipna=True)
+    if inferred not in MIXED_TYPES:
+        inferred = pd.api.types.infer_dtype(values, skipna=True)
+        if inferred not in MIXED_TYPES:
+            return None
+    # Для колонок с разными типами считаем количество значений каждого типа (пропуски - отдельно)
+    types = values.dropna().map(type).value_counts()
+    return {'inferred': inferred,
+            'types': {value_type.__name__: int(count) for value_type, count in types.items()},
+            'missing': int(values.isna().sum())}
+
+
 ### Функция проверки всех колонок датасета на единство типа данных в колонке
-def checking_type_error(df):
+def checking_type_error(df, processes=None, sample_size=100_000):
     """
-    Функция проверяет каждое поле датасета на несовпадение типов данных и выводит поля с указанием количества записей разных типов
+    Функция проверяет каждое поле датасета на несовпадение типов данных; колонки могут проверяться
+    параллельно в нескольких процессах
 
         Параметры:
             df (DataFrame): проверяемый датасет
+            processes (int, None): количество процессов (None - проверка в текущем процессе)
+            sample_size (int): размер выборки значений для предварительной проверки колонки
         Выходные параметры:
-            columns_noncorrect_types (list): список полей датасета, в каждом из которых найдены разные типы данных
-
-    """
-    flagCorrect = True
-    columns_noncorrect_types = []
-    for elem in df.columns:
-        df_type = df[elem].apply(lambda x: type(x)).value_counts().to_frame()
-        if len(df_type) > 1:
-            columns_noncorrect_types.append(elem)
-            if flagCorrect:
-                print('Для одного атрибута обнаружены данные разного типа в следующих полях')
-                print(' ------------------------------------------------------------ ')
-                print('|  НАИМЕНОВАНИЕ ПОЛЯ  |  ТИП ДАННЫХ  |   КОЛИЧЕСТВО ЗАПИСЕЙ  |')
-                print(' ------------------------------------------------------------ ')
-            flagCorrect = False
-
-            for i in range(len(df_type)):
-                print('   ', df_type.columns[0], ' ' * (21 - len(df_type.columns[0])),
-                      str(df_type.index[i])[7:-1], ' ' * (21 - len(str(df_type.index[i])[7:-1])),
-                      str(df_type[df_type.columns[0]].values[i]))
-            print(' ------------------------------------------------------------ ')
-    if flagCorrect:
-        print('Полей с разными типами данных в одном атрибуте не обнаружено!')
+            type_report (dict): описание типов данных (см. column_types) по каждому полю, в котором найдены разные типы
+
+    """
+    # Проверяются только колонки типа object: в остальных значения одного типа
+    columns = [col for col in df.columns if df[col].dtype == object]
+    if processes is not None and processes > 1 and len(columns) > 1:
+        with Pool(processes) as pool:
+            reports = pool.starmap(column_types, [(df[col], sample_size) for col in columns])
+    else:
+        reports = [column_types(df[col], sample_size) for col in columns]
+
+    return {col: report for col, report in zip(columns, reports) if report is not None}
+
+
+### Функция вывода полей с разными типами данных
+def print_type_report(type_report):
+    """
+    Функция выводит поля с указанием количества записей разных типов
+
+        Параметры:
+            type_report (dict): описание типов данных полей (результат checking_type_error)
+        Выходные параметры (None)
 
-    return columns_noncorrect_types
+    """
+    if not type_report:
+        print('Полей с разными типами данных в одном атрибуте не обнаружено!')
+        return
+    print('Для одного атрибута обнаружены данные разного типа в следующих полях')
+    print(' ------------------------------------------------------------ ')
+    print('|  НАИМЕНОВАНИЕ ПОЛЯ  |  ТИП ДАННЫХ  |   КОЛИЧЕСТВО ЗАПИСЕЙ  |')
+    print(' ------------------------------------------------------------ ')
+    for col, report in type_report.items():
+        for type_name, count in report['types'].items():
+            print('   ', col, ' ' * (21 - len(col)), type_name, ' ' * (21 - len(type_name)), count)
+        print(' ------------------------------------------------------------ ')
 
 
 ### Функция изменения типа данных с 'float' на 'str'
@@ -133,43 +313,44 @@ def correct_type(df, noncorrect_columns):
         df[elem] = df[elem].apply(lambda x: str(x))
     print(f'Коррекция типов данных завершена в {len(noncorrect_columns)} полях')
     print('... запущена перепроверка идентичности типов данных ... ')
-    checking_type_error(df)
+    # Перепроверяются только исправленные поля
+    print_type_report(checking_type_error(df[noncorrect_columns]))
 
 
 ### Функция проверки наличия незаполненных значений в колоноках датасета
-def data_set_audit(df):
+def data_set_audit(df, cache=False):
     """
     Функция проверяет пропуски в Датасете и выводит для каждого поля долю пропусков в % от общего количесвтва записей
+    (статистики вычисляет dataset_audit)
 
         Параметры:
-            df (DataFrame): датасет, в котором проверяются пропуски
+            df (DataFrame, iterable): датасет, в котором проверяются пропуски, или итератор частей датасета
+            cache (bool): флаг использования кэша аудита колонок (см. dataset_audit); только для датасета,
+                          значения которого не изменялись на месте после прошлой проверки
         Выходные параметры (None)
 
     """
-    print('Размер анализируемого Датасета:', df.shape)
-    nan_columns = [(elem, df[elem].isna().sum(), type(df.loc[0, elem]))
-                   for elem in df.columns
-                   if df[elem].isnull().describe()[1] > 1 or
-                   df[elem].isnull().describe()[1] == 1 and
-                   df[elem].isnull()[0] == True]
+    report = dataset_audit(df, cache=cache)
+    print('Размер анализируемого Датасета:', (int(report['rows'].max()) if len(report) else 0, len(report)))
+    nan_columns = report.loc[report['nulls'] > 0]
     if len(nan_columns) > 0:
         print('ПРОПУСКИ  В  КОЛОНКАХ  ДАТАСЕТА')
         print('========================================================================')
         print('  Поле                        Пропуски             Тип данных в колонке ')
         print('                           (кол-во,      %)                             ')
         print('------------------------------------------------------------------------')
-        for elem in nan_columns:
-            print(' ', elem[0],
-                  ' ' * (24 - len(elem[0])), elem[1],
-                  ' ' * (9 - len(str(elem[1]))), round((elem[1] / len(df) * 100), 2),
-                  ' ' * 12, str(elem[2])[7:-1])
+        for col, audit in nan_columns.iterrows():
+            print(' ', col,
+                  ' ' * (24 - len(col)), audit['nulls'],
+                  ' ' * (9 - len(str(audit['nulls']))), audit['share'],
+                  ' ' * 12, str(audit['type'])[7:-1])
         print('========================================================================')
     else:
         print('Пропущенных данных в Датасете не обнаружено!')
 
 
 ### Функция отчистки столбцов и строк от нулевых значений
-def clean_columns_rows(df, col_col_df, col_row_df, col_cell_val_top):
+def clean_columns_rows(df, col_col_df, col_row_df, col_cell_val_top, col_cell_val_top_corr=None):
     """
     Функция удаляет заданные столбы. Затем функция удаляет строки, в которых есть пропущеные данные
 
@@ -185,173 +366,295 @@ def clean_columns_rows(df, col_col_df, col_row_df, col_cell_val_top):
     """
 
     print('... удаляем колонки, в которых более 90% пропущенных данных ...')
-    df = df.drop(columns=col_col_df, axis=1)  # Удаление колонки 'hit_time'
+    df = df.drop(columns=col_col_df)  # Удаление колонки 'hit_time'
     print('После удаления заданных колонок - размер датасета:', df.shape)
 
     print('... удаляем строки, для которых в колонках менее 1% пропущенных данных ...')
     df = df.dropna(subset=col_row_df, axis=0, how='any')  # Удаление строк, в которых выявлены пропущенные данные
     print(f'Удаление колонок и строк с нулевыми данными - завершено.')
 
+    # В дочерних колонках пропуски заполняются по значениям родительских колонок,
+    # оставшиеся пропуски и пропуски в колонках col_cell_val_top - наиболее часто встречающимися значениями
+    if col_cell_val_top_corr:
+        print('... в зависимых колонках меняем пропуски на самые частые значения ... ')
     print('... меняем пропущенные данные на наиболее часто встречающиеся ... ')
-    for col in col_cell_val_top:
-        nan_indexes = df[df[col].isnull()].index
-        df.loc[nan_indexes, col] = df[col].describe().loc['top']
+    df = ModeImputer(col_cell_val_top, col_cell_val_top_corr).fit_transform(df)
 
     print('... запущена перепроверка отсутствия нулевых данных ... ')
-    data_set_audit(df)
+    # Колонки с заполненными пропусками могут разделять буферы прошлой проверки (copy-on-write):
+    # статистики вычисляются заново, без кэша аудита
+    data_set_audit(df, cache=False)
 
-    #     print('\n')
-    #     for column_elem in col_cell_val_top_corr:
-    #         parent_column, child_column = column_elem[0], column_elem[1]
-
-    #         # 1. Определяем уникальные значения родительской колонки,
-    #         #    имеющие пустые значения в дочерней колонке
-    #         columns_non_correct = list(df_clear[parent_column].loc[df_clear[child_column].isnull()].unique())
+    return df
 
-    #         # 2. заполняем пустоты названиями, встречающимеся чаще всего среди значений
-    #         #    дочерней колонки для соответвующего значения родительской колонки Датасета
 
-    #         for col_cor in columns_non_correct:
+### Функция подсчёта визитов клиентов
+def client_visits(data, bursts=False, same_time=False):
+    """
+    Функция считает визиты каждого клиента одной хеш-группировкой по клиенту (а для эвристик - по клиенту, дате
+    и времени визита): количество визитов, наибольшее количество визитов за один день и наибольшее количество
+    визитов с одинаковыми датой и временем выводятся из частот групп без повторного просмотра датасета.
+    Датасет может быть передан частями (например, из file_chunks), тогда частоты групп накапливаются по частям
 
-    #             # Массив индексов пустых значений в дочерней колонке Датасета,
-    #             # соответсвующих значению родительской колонки Датасета
-    #             index_nan_values = df_clear[child_column].\
-    #                             loc[df_clear[child_column].isnull()].\
-    #                             loc[df_clear[parent_column] == col_cor].index
+        Параметры:
+            data (DataFrame, iterable): датасет визитов или итератор частей датасета
+            bursts (bool): флаг подсчёта наибольшего количества визитов клиента за один день
+            same_time (bool): флаг подсчёта наибольшего количества визитов клиента с одинаковыми датой и временем
+        Выходные параметры:
+            visits (DataFrame): колонки 'visits', 'day_visits', 'same_time_visits' (две последние - при
+                                соответствующих флагах) по каждому 'client_id'
+            days_count (int): количество дней в периоде фиксации данных
 
-    #             # Самое часто встречающееся значение в дочерней колонке,
-    #             # соответсвущее значению родительской колонки Датасета
-    #             top_value = str(df_clear[child_column].\
-    #                             loc[df_clear[child_column].notnull()].\
-    #                             loc[df_clear[parent_column] == col_cor].\
-    #                             describe().top)
+    """
+    keys = ['client_id'] + (['visit_date'] if bursts or same_time else []) + (['visit_time'] if same_time else [])
+    streamed = not isinstance(data, pd.DataFrame)
+
+    partial, first_date, last_date = [], None, None
+    for chunk in (data if streamed else [data]):
+        partial.append(chunk.groupby(keys, sort=False, observed=True).size())
+        dates = chunk['visit_date']
+        if isinstance(dates.dtype, pd.CategoricalDtype):
+            # Даты из file_chunks - неупорядоченные категории: границы периода берутся по встреченным категориям
+            dates = dates.cat.remove_unused_categories().cat.categories
+        first_date = dates.min() if first_date is None else min(first_date, dates.min())
+        last_date = dates.max() if last_date is None else max(last_date, dates.max())
+
+    sizes = partial[0]
+    if streamed:
+        # Частоты групп частей объединяются одной группировкой (категории частей могут различаться,
+        # поэтому группы сопоставляются по значениям ключей)
+        sizes = pd.concat([part.reset_index(name='size') for part in partial], ignore_index=True). \
+            groupby(keys, sort=False, observed=True)['size'].sum()
+
+    if len(keys) == 1:
+        visits = pd.DataFrame({'visits': sizes})
+    else:
+        # Статистики клиентов сворачиваются по кодам уровней индекса групп (без повторной группировки значений)
+        index, counts = sizes.index.remove_unused_levels(), sizes.to_numpy()
+        clients, n_clients = index.codes[0], len(index.levels[0])
+        visits = pd.DataFrame({'visits': np.bincount(clients, weights=counts, minlength=n_clients).astype(np.int64)},
+                              index=pd.Index(index.levels[0]))
+        if bursts:
+            day_clients, day_counts = clients, counts
+            if same_time:
+                days, inverse = np.unique(clients.astype(np.int64) * len(index.levels[1]) + index.codes[1],
+                                          return_inverse=True)
+                day_clients, day_counts = days // len(index.levels[1]), np.bincount(inverse, weights=counts)
+            visits['day_visits'] = _max_by_code(day_clients, day_counts, n_clients)
+        if same_time:
+            visits['same_time_visits'] = _max_by_code(clients, counts, n_clients)
+    visits.index.name = 'client_id'
+    days_count = (pd.Timestamp(last_date) - pd.Timestamp(first_date)).days
+
+    return visits, days_count
+
+
+def _max_by_code(codes, values, n_codes):
+    # Наибольшее значение по каждому коду
+    result = np.zeros(n_codes, dtype=np.int64)
+    np.maximum.at(result, codes, values.astype(np.int64))
+    return result
+
+
+### Функция выявления клиентов с аномальными визитами
+def robotic_clients(visits, days_count, max_day_visits=None, max_same_time=None):
+    """
+    Функция определяет клиентов, у которых в среднем не меньше одного визита в день за период,
+    а также (при заданных порогах) клиентов с всплесками визитов за один день и с повторяющимися
+    до секунды визитами
 
-    #             if top_value not in [None, 'nan', 'null', 'Nan', 'NaN']:
-    #                 df_clear.loc[index_nan_values, child_column] = top_value
+        Параметры:
+            visits (DataFrame): визиты клиентов (результат client_visits)
+            days_count (int): количество дней в периоде фиксации данных
+            max_day_visits (int, None): наибольшее допустимое количество визитов клиента за один день
+            max_same_time (int, None): наибольшее допустимое количество визитов клиента с одинаковыми датой и временем
+        Выходные параметры:
+            excluded (set): идентификаторы клиентов с аномальными визитами
 
-    #         print('... в зависимых колонках меняем пропуски на самые частые значения ... ')
-    #         print(f'Заменена нулевых данных, для которых выявлены наиболее часто встречающиеся значения - завершена\n')
+    """
+    robotic = visits['visits'].to_numpy() >= days_count
+    if max_day_visits is not None:
+        robotic |= visits['day_visits'].to_numpy() > max_day_visits
+    if max_same_time is not None:
+        robotic |= visits['same_time_visits'].to_numpy() > max_same_time
 
-    return df
+    return set(visits.index[robotic])
 
 
 ### Функция выявления и удаления аномалий в датасете визитов
-def delete_anomalies(df):
+def delete_anomalies(df, max_day_visits=None, max_same_time=None, return_excluded=False):
     """
     Функция определяет количество аномалий в датасете визитов и удаляет их из датасета
 
         Параметры:
             df (DataFrame): датасет визитов
-        Выходные параметры (DataFrame)
+            max_day_visits (int, None): наибольшее допустимое количество визитов клиента за один день (None - не проверять)
+            max_same_time (int, None): наибольшее допустимое количество визитов клиента с одинаковыми датой и временем
+                                       (None - не проверять)
+            return_excluded (bool): флаг возврата множества идентификаторов исключённых клиентов
+        Выходные параметры (DataFrame или tuple(DataFrame, set))
 
     """
-    # Вычисление количесвтва визитов каждого клиента по 'client_id'
-    visit_count = df.groupby('client_id').agg('count')
+    # Вычисление количества визитов каждого клиента по 'client_id' и количества дней в периоде
+    # фиксации данных в датасете (частоты групп считаются один раз и для всех эвристик)
+    visits, days_count = client_visits(df, bursts=max_day_visits is not None, same_time=max_same_time is not None)
+
+    # Определение идентификаторов клиентов, у которых в среднем больше одного визита в день
+    # (и клиентов с аномальными всплесками визитов)
+    excluded = robotic_clients(visits, days_count, max_day_visits, max_same_time)
+
+    # Исключение клиентов с аномальными визитами
+    df = df.loc[~df.client_id.isin(excluded)]
+
+    return (df, excluded) if return_excluded else df
+
+
+# Атрибуты, по которым строится куб визитов: первый визит клиента (min) и значения атрибутов клиента (max)
+CUBE_AGGREGATIONS = {'visit_date': 'min', 'visit_time': 'min',
+                     'geo_country': 'max', 'geo_city': 'max',
+                     'device_category': 'max', 'device_browser': 'max',
+                     'utm_source': 'max', 'utm_medium': 'max'}
+# Измерения структуры клиентов: (измерение куба, заголовок графика, количество выводимых значений)
+CUBE_STRUCTURE = (('geo_country', 'Страны нахождения клиентов', 5),
+                  ('geo_city', 'Города нахождения клиентов', 10),
+                  ('device_category', 'Типы устройств, используемые клиентами', None),
+                  ('device_browser', 'Браузеры, используемые клиентами', 10),
+                  ('utm_source', 'Каналы привлечения клиентов', 10),
+                  ('utm_medium', 'Типы привлечения клиентов', 10))
+# Измерения распределения новых клиентов во времени: (измерение куба, заголовок графика)
+CUBE_TIME = (('year-month', 'по месяцам'), ('dayOFmonth', 'по дням месяца'),
+             ('dayOFweek', 'по дням недели'), ('hourOFday', 'по часам дня'))
+
+
+### Куб визитов клиентов
+def visits_cube(df):
+    """
+    Функция кодирует измерения первых визитов клиентов (месяц, день месяца, день недели, час, страна, город,
+    тип устройства, браузер, канал и тип привлечения) целочисленными кодами и считает количество клиентов
+    по каждому встреченному сочетанию кодов
 
-    # Вычисление количесвта дней в периоде фиксации данных в датасете
-    days_count = (df.visit_date.max() - df.visit_date.min()).days
+        Параметры:
+            df (DataFrame): датасет визитов с полями visit_date (datetime64) и visit_time (timedelta64)
+        Выходные параметры:
+            cube (DataFrame): колонки измерений (category, коды измерений) и количество клиентов 'clients'
 
-    # Определение идентификаторов клиентов, у которых в среднем больше
-    # одного визита в день
-    roboticity_client = list(visit_count. \
-                             loc[visit_count['session_id'] >= days_count].index)
+    """
+    # Категориальные атрибуты кодируются один раз кодами отсортированных значений: наибольший код клиента
+    # соответствует наибольшему значению (пропуск - код -1, он меньше любого значения, как и пропуск в max)
+    categories, columns = {}, {'client_id': df['client_id'],
+                                'visit_date': df['visit_date'], 'visit_time': df['visit_time']}
+    for col, _, _ in CUBE_STRUCTURE:
+        codes, values = pd.factorize(df[col], sort=True)
+        columns[col], categories[col] = codes, list(values)
 
-    # Исключение клиентов, у которых в среднем больше одного визита в день
-    # df = df.query(f'client_id not in {roboticity_client}')
-    df = df.loc[~df.client_id.isin(roboticity_client)]
+    print('... запускаем агрегацию атрибутов (агрегация займёт время)...')
+    df_ag = pd.DataFrame(columns).groupby('client_id', sort=False, observed=True).agg(CUBE_AGGREGATIONS)
+    print('Агрегация завершена.')
 
-    return df
+    # Измерения времени кодируются арифметически по полям datetime64/timedelta64
+    visit_date = df_ag['visit_date'].dt
+    months = (visit_date.year * 12 + visit_date.month - 1).to_numpy()
+    month_codes, month_values = pd.factorize(months, sort=True)
+    dimensions = {'year-month': (month_codes, [f'{value // 12}-{value % 12 + 1:02d}' for value in month_values]),
+                  'dayOFmonth': (visit_date.day.to_numpy() - 1, [f'{day:02d}' for day in range(1, 32)]),
+                  # (нумерация дней недели как у '%w': 0 - воскресенье)
+                  'dayOFweek': ((visit_date.dayofweek.to_numpy() + 1) % 7, [str(day) for day in range(7)]),
+                  'hourOFday': (df_ag['visit_time'].dt.seconds.to_numpy() // 3600, list(range(24)))}
+    for col, _, _ in CUBE_STRUCTURE:
+        dimensions[col] = (df_ag[col].to_numpy(), categories[col])
+
+    # Количество клиентов по сочетаниям кодов измерений
+    codes = pd.DataFrame({name: codes.astype(np.int16 if len(values) < 2 ** 15 else np.int32)
+                          for name, (codes, values) in dimensions.items()})
+    cube = codes.groupby(list(dimensions), sort=False).size().reset_index(name='clients')
+    for name, (_, values) in dimensions.items():
+        cube[name] = pd.Categorical.from_codes(cube[name], categories=values)
+
+    return cube
+
+
+### Маргинальные распределения куба визитов
+def cube_marginals(cube):
+    """
+    Функция считает количество клиентов по каждому значению каждого измерения куба
+    (взвешенный bincount по кодам измерения)
+
+        Параметры:
+            cube (DataFrame): куб визитов (результат visits_cube или прочитанный из хранилища)
+        Выходные параметры:
+            marginals (dict): {измерение: Series с количеством клиентов по встреченным значениям измерения}
+
+    """
+    clients = cube['clients'].to_numpy()
+    marginals = {}
+    for name in cube.columns.drop('clients'):
+        values = cube[name].astype('category')
+        codes = values.cat.codes.to_numpy()
+        counts = np.bincount(codes[codes >= 0], weights=clients[codes >= 0],
+                             minlength=len(values.cat.categories)).astype(np.int64)
+        marginals[name] = pd.Series(counts, index=values.cat.categories, name='client_id')[counts > 0]
+    return marginals
+
+
+### Данные для графиков распределения визитов по кубу визитов
+def cube_charts(cube):
+    """
+    Функция формирует данные для графиков time_plot и structure_plot по маргинальным распределениям куба визитов
+
+        Параметры:
+            cube (DataFrame): куб визитов (результат visits_cube или прочитанный из хранилища)
+        Выходные параметры:
+            dfs (list): список кортежей (данные графика, заголовок графика): сначала графики времени, затем структуры
+
+    """
+    marginals = cube_marginals(cube)
+    dfs = []
+    for name, title in CUBE_TIME:
+        # Значения времени упорядочены, как ключи groupby
+        counts = marginals[name].rename_axis(name).sort_index()
+        dfs.append((counts.to_frame(), title))
+    for name, title, top in CUBE_STRUCTURE:
+        counts = marginals[name].sort_values(ascending=False, kind='stable')[:top]
+        dfs.append(((counts.index.to_list(), counts.to_list()), title))
+    return dfs
 
 
 ### Агрегация атрибутов датасета визитов во времени
-def agg_changes(df):
+def agg_changes(df, cube_name=None, path='store'):
     """
     Функция агрегирует данные датасета для формирования визуализации распределения визитов клиентов по разным атрибутам
 
         Параметры:
             df (DataFrame): агрегируемый датасет
+            cube_name (str, None): наименование, под которым куб визитов записывается в колоночное хранилище
+                                   (графики затем строятся без пересчёта: cube_plots(dataset_read(cube_name)))
+            path (str): каталог хранилища
         Выходные параметры (None)
 
     """
 
-    # Поле для подсчёта уникальных клиентов
     print('\nЭтап 7. ... запускаем подготовку визуализации по п.2.1.4(пп7) ...')
-    df['client'] = df['client_id']
-
-    # Словарь агрегируемых атребутов и функций по атрибутам
-    ag_dict = {'client_id': 'max', 'visit_date': 'min', 'visit_time': 'min',
-               'geo_country': 'max', 'geo_city': 'max',
-               'device_category': 'max', 'device_browser': 'max',
-               'utm_source': 'max', 'utm_medium': 'max'}
-    print('Словарь функций агрегируемых атрибутов - подготовлен.')
-    print('... запускаем агрегацию атрибутов (агрегация займёт время)...')
+    cube = visits_cube(df)
+    if cube_name is not None:
+        print(f'Куб визитов записан в хранилище: {dataset_write(cube, cube_name, path)}')
+    if plots_enabled():
+        cube_plots(cube)
+    else:
+        print('Построение графиков выключено - графики не выводятся.')
 
-    # Датасет сагрегированных атрибутов визитов
-    df_ag = df.groupby('client').agg(ag_dict)
-    print('Агрегация завершена.')
 
-    # Агрегация посещений новыми клиентами по месяцам
-    df_ag['year-month'] = df_ag['visit_date'].apply(lambda x: dt.datetime.strftime(x, "%Y-%m"))
-    ag_ym = df_ag.groupby('year-month').agg({'client_id': 'count'})
-
-    # Агрегация посещений новыми клиентами по дням месяца
-    df_ag['dayOFmonth'] = df_ag['visit_date'].apply(lambda x: dt.datetime.strftime(x, "%d"))
-    ag_dm = df_ag.groupby('dayOFmonth').agg({'client_id': 'count'})
-
-    # Агрегация посещений новыми клиентами по дням недели
-    df_ag['dayOFweek'] = df_ag['visit_date'].apply(lambda x: dt.datetime.strftime(x, "%w"))
-    ag_dw = df_ag.groupby('dayOFweek').agg({'client_id': 'count'})
-
-    # Агрегация посещений новыми клиентами по часам суток
-    df_ag['hourOFday'] = df_ag['visit_time'].apply(lambda x: x.hour)
-    ag_hd = df_ag.groupby('hourOFday').agg({'client_id': 'count'})
-
-    # Агрегация структуры стран нахождения клиентов
-    ag_country = df_ag.groupby('geo_country'). \
-        agg({'client_id': 'count'}).sort_values('client_id', ascending=False)
-    country_count = (ag_country.index.to_list()[:5],
-                     ag_country.client_id.to_list()[:5])
-
-    # Агрегация структуры городов нахождения клиентов
-    ag_city = df_ag.groupby('geo_city'). \
-        agg({'client_id': 'count'}).sort_values('client_id', ascending=False)
-    city_count = (ag_city.index.to_list()[:10],
-                  ag_city.client_id.to_list()[:10])
-
-    # Агрегация структуры типов дивайсов, которые используют клиенты
-    ag_device = df_ag.groupby('device_category'). \
-        agg({'client_id': 'count'}).sort_values('client_id', ascending=False)
-    divice_count = (ag_device.index.to_list(),
-                    ag_device.client_id.to_list())
-
-    # Агрегация структуры браузеров, которые используют клиенты
-    ag_browser = df_ag.groupby('device_browser'). \
-        agg({'client_id': 'count'}).sort_values('client_id', ascending=False)
-    browser_count = (ag_browser.index.to_list()[:10],
-                     ag_browser.client_id.to_list()[:10])
-
-    # Агрегация структуры каналов привлечения клиентов
-    ag_source = df_ag.groupby('utm_source'). \
-        agg({'client_id': 'count'}).sort_values('client_id', ascending=False)
-    source_count = (ag_source.index.to_list()[:10],
-                    ag_source.client_id.to_list()[:10])
-
-    # Агрегация структуры типов привлечения клиентов
-    ag_medium = df_ag.groupby('utm_medium'). \
-        agg({'client_id': 'count'}).sort_values('client_id', ascending=False)
-    medium_count = (ag_medium.index.to_list()[:10],
-                    ag_medium.client_id.to_list()[:10])
+### Графики распределения визитов по кубу визитов
+def cube_plots(cube):
+    """
+    Функция выводит графики распределения визитов клиентов во времени и по структуре по кубу визитов
 
-    print('Данные для вывода графиков готовы.')
+        Параметры:
+            cube (DataFrame): куб визитов (результат visits_cube или прочитанный из хранилища)
+        Выходные параметры (None)
 
-    dfs = [(ag_ym, 'по месяцам'), (ag_dm, 'по дням месяца'),
-           (ag_dw, 'по дням недели'), (ag_hd, 'по часам дня'),
-           (country_count, 'Страны нахождения клиентов'),
-           (city_count, 'Города нахождения клиентов'),
-           (divice_count, 'Типы устройств, используемые клиентами'),
-           (browser_count, 'Браузеры, используемые клиентами'),
-           (source_count, 'Каналы привлечения клиентов'),
-           (medium_count, 'Типы привлечения клиентов')]
+    """
+    dfs = cube_charts(cube)
+    print('Данные для вывода графиков готовы.')
 
     time_plot(dfs[:4])
     structure_plot(dfs[4:])
@@ -369,6 +672,10 @@ def time_plot(dfs):
     """
 
     print('\nИЗМЕНЕНИЕ ПО ПЕРИОДАМ ВРЕМЕНИ КОЛИЧЕСТВА ВИЗИТОВ КЛИЕНТОВ НА САЙТ')
+    render(_draw_time_plot, dfs, name='time_plot')
+
+
+def _draw_time_plot(dfs):
     fig, ax = plt.subplots(figsize=(15, 3))
     ax.set_title(f'Визиты {dfs[0][1]}')
     ax.plot(dfs[0][0].index, dfs[0][0]['client_id'], color='green')
@@ -383,8 +690,6 @@ def time_plot(dfs):
     axs[1].set_title(f'Визиты {dfs[3][1]}')
     axs[1].plot(dfs[3][0].index, dfs[3][0]['client_id'], color='green')
 
-    plt.show();
-
 
 ### Формирование полотна структуры посещений сайта
 def structure_plot(dfs):
@@ -398,6 +703,10 @@ def structure_plot(dfs):
     """
 
     print('\nРАСПРЕДЕЛЕНИЕ КЛИЕНТОВ ПО ГЕОГРАФИИ, ДЕВАЙСАМ И КАНАЛАМ ПРИВЛЕЧЕНИЯ')
+    render(_draw_structure_plot, dfs, name='structure_plot')
+
+
+def _draw_structure_plot(dfs):
     for i in range(len(dfs)):
         fig, ax = plt.subplots(figsize=(15, 3))
 
@@ -410,5 +719,3 @@ def structure_plot(dfs):
         ax.invert_yaxis()
         ax.set_title(dfs[i][1])
         ax.xaxis.set_major_formatter(FormatStrFormatter('%.0f'))
-
-        plt.show()
\ No newline at end of file
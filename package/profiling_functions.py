@@ -0,0 +1,227 @@
+import os
+import sys
+import time
+import threading
+import tracemalloc
+import numpy as np
+
+
+### Накопитель замеров шагов pipeline
+class PipelineProfiler:
+    """
+    Класс накапливает по каждому шагу pipeline время выполнения, количество строк на входе и выходе
+    и изменение памяти (по данным tracemalloc)
+
+        Параметры:
+            trace_memory (bool): флаг замера памяти; включает tracemalloc, что замедляет выделение памяти.
+                                 Счётчики tracemalloc общие для процесса, поэтому шаги с замером памяти
+                                 из разных потоков выполняются по очереди (см. _measure); в замер попадают
+                                 и выделения памяти кода без замеров, выполняемого в это время в других потоках
+
+    """
+
+    def __init__(self, trace_memory=True):
+        self.trace_memory = trace_memory
+        self.stats = {}
+        self._lock = threading.Lock()
+        if trace_memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+
+    def record(self, step, seconds, rows_in, rows_out, memory_delta, memory_peak):
+        """
+        Функция добавляет замер одного вызова шага pipeline
+
+            Параметры:
+                step (str): наименование шага
+                seconds (float): время выполнения шага (сек.)
+                rows_in (int): количество строк на входе шага
+                rows_out (int): количество строк на выходе шага
+                memory_delta (int, None): изменение занятой памяти после шага (байт)
+                memory_peak (int, None): пиковый прирост памяти во время шага (байт)
+            Выходные параметры (None)
+
+        """
+        with self._lock:
+            stat = self.stats.setdefault(step, {'calls': 0, 'seconds': 0.0, 'rows_in': 0, 'rows_out': 0,
+                                                'memory_delta': 0, 'memory_peak': 0})
+            stat['calls'] += 1
+            stat['seconds'] += seconds
+            stat['rows_in'] += rows_in
+            stat['rows_out'] += rows_out
+            if memory_delta is not None:
+                stat['memory_delta'] += memory_delta
+                stat['memory_peak'] = max(stat['memory_peak'], memory_peak)
+
+    def summary(self):
+        """
+        Функция возвращает сводку замеров по шагам pipeline в порядке их первого вызова
+
+            Выходные параметры (list): список словарей со сводкой по каждому шагу
+
+        """
+        with self._lock:
+            return [{'step': step,
+                     'calls': stat['calls'],
+                     'total_ms': round(stat['seconds'] * 1000, 3),
+                     'mean_ms': round(stat['seconds'] * 1000 / stat['calls'], 3),
+                     'rows_in': stat['rows_in'],
+                     'rows_out': stat['rows_out'],
+                     'memory_delta_kb': round(stat['memory_delta'] / 1024, 1) if self.trace_memory else None,
+                     'memory_peak_kb': round(stat['memory_peak'] / 1024, 1) if self.trace_memory else None}
+                    for step, stat in self.stats.items()]
+
+    def reset(self):
+        with self._lock:
+            self.stats = {}
+
+
+### Наименование шага pipeline для отчёта
+def step_label(name, step):
+    func = getattr(step, 'func', None)
+    if func is not None:
+        return f'{name} ({func.__name__})'
+    return f'{name} ({type(step).__name__})'
+
+
+def _rows(data):
+    shape = getattr(data, 'shape', None)
+    return shape[0] if shape is not None else len(data)
+
+
+# Блокировка шагов с замером памяти: reset_peak и get_traced_memory работают с общими счётчиками процесса,
+# и параллельный шаг сбросил бы пик или добавил свои выделения памяти в замер другого шага
+_MEMORY_LOCK = threading.Lock()
+
+
+def _measure(profiler, label, rows_in, call):
+    if not (profiler.trace_memory and tracemalloc.is_tracing()):
+        start = time.perf_counter()
+        result = call()
+        profiler.record(label, time.perf_counter() - start, rows_in, _rows(result), None, None)
+        return result
+    with _MEMORY_LOCK:
+        tracemalloc.reset_peak()
+        memory_before = tracemalloc.get_traced_memory()[0]
+        start = time.perf_counter()
+        result = call()
+        seconds = time.perf_counter() - start
+        memory_after, peak = tracemalloc.get_traced_memory()
+    profiler.record(label, seconds, rows_in, _rows(result), memory_after - memory_before, peak - memory_before)
+    return result
+
+
+### Преобразование данных шагом pipeline с замером каждого вложенного шага
+def profiled_transform(step, X, profiler, name='step'):
+    """
+    Функция повторяет transform шага pipeline (в т.ч. вложенных Pipeline и FeatureUnion), замеряя каждый конечный шаг
+
+        Параметры:
+            step (object): шаг pipeline (Pipeline, FeatureUnion или преобразователь)
+            X (DataFrame, ndarray): входные данные шага
+            profiler (PipelineProfiler): накопитель замеров
+            name (str): наименование шага в pipeline
+        Выходные параметры (DataFrame, ndarray)
+
+    """
+    if hasattr(step, 'steps'):
+        for sub_name, sub_step in step.steps:
+            if sub_step not in (None, 'passthrough'):
+                X = profiled_transform(sub_step, X, profiler, sub_name)
+        return X
+    if hasattr(step, 'transformer_list'):
+        weights = step.transformer_weights or {}
+        Xs = []
+        for sub_name, sub_step in step.transformer_list:
+            if sub_step == 'drop':
+                continue
+            Xt = profiled_transform(sub_step, X, profiler, sub_name)
+            Xs.append(Xt * weights[sub_name] if sub_name in weights else Xt)
+        return np.hstack(Xs)
+    return _measure(profiler, step_label(name, step), _rows(X), lambda: step.transform(X))
+
+
+### Предсказание вероятностей pipeline с замером каждого шага
+def profiled_predict_proba(pipeline, X, profiler):
+    """
+    Функция выполняет predict_proba обученного pipeline, замеряя каждый шаг, включая итоговую модель
+
+        Параметры:
+            pipeline (Pipeline): обученный pipeline модели
+            X (DataFrame): данные для предсказания
+            profiler (PipelineProfiler): накопитель замеров
+        Выходные параметры (ndarray)
+
+    """
+    Xt = X
+    for name, step in pipeline.steps[:-1]:
+        Xt = profiled_transform(step, Xt, profiler, name)
+    name, estimator = pipeline.steps[-1]
+    return _measure(profiler, step_label(name, estimator), _rows(Xt), lambda: estimator.predict_proba(Xt))
+
+
+### Вывод сводной таблицы замеров
+def print_profile(profiler):
+    """
+    Функция выводит сводную таблицу замеров шагов pipeline
+
+        Параметры:
+            profiler (PipelineProfiler): накопитель замеров
+        Выходные параметры (None)
+
+    """
+    print('ЗАМЕРЫ  ШАГОВ  PIPELINE')
+    print('=' * 120)
+    print('  Шаг                                                Вызовы   Время (мс)   Строк вход/выход       Память +/пик (КБ)')
+    print('-' * 120)
+    for stat in profiler.summary():
+        memory = '-' if stat['memory_delta_kb'] is None else \
+            f"{stat['memory_delta_kb']}/{stat['memory_peak_kb']}"
+        print(f"  {stat['step']:<50} {stat['calls']:<8} {stat['total_ms']:<12} "
+              f"{str(stat['rows_in']) + '/' + str(stat['rows_out']):<22} {memory}")
+    print('=' * 120)
+
+
+### Память процесса по данным /proc (Linux)
+def process_memory():
+    """
+    Функция возвращает память текущего процесса: RSS, PSS (с долями страниц, общих с другими процессами),
+    частную память процесса и память, общую с другими процессами (в МБ)
+
+        Выходные параметры (dict, None): None, если /proc недоступен (не Linux)
+
+    """
+    if not os.path.exists('/proc/self/smaps_rollup'):
+        return None
+    memory = {}
+    with open('/proc/self/smaps_rollup') as file:
+        for line in file:
+            key, _, value = line.partition(':')
+            if key in ('Rss', 'Pss', 'Private_Clean', 'Private_Dirty'):
+                memory[key] = int(value.split()[0]) / 1024
+    private = memory['Private_Clean'] + memory['Private_Dirty']
+    return {'rss': round(memory['Rss'], 1), 'pss': round(memory['Pss'], 1),
+            'private': round(private, 1), 'shared': round(memory['Rss'] - private, 1)}
+
+
+### Пиковая память процесса (RSS) с момента его запуска
+def peak_memory():
+    """
+    Функция возвращает максимальный размер резидентной памяти процесса (в МБ)
+
+        Выходные параметры (float, None): None, если модуль resource недоступен (Windows)
+
+    """
+    # В Linux ru_maxrss сохраняется при exec, и процесс, запущенный через spawn, получает пик родителя;
+    # VmHWM считается для памяти самого процесса
+    if os.path.exists('/proc/self/status'):
+        with open('/proc/self/status') as file:
+            for line in file:
+                if line.startswith('VmHWM:'):
+                    return round(int(line.split()[1]) / 1024, 1)
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # В macOS ru_maxrss указывается в байтах, в Linux - в килобайтах
+    return round(peak / 1024 / 1024 if sys.platform == 'darwin' else peak / 1024, 1)
@@ -0,0 +1,175 @@
+import os
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+
+
+# Режимы вывода графиков: 'show' - вывод в ноутбук (plt.show), 'files' - запись файлов PNG в фоновых процессах
+# на backend Agg, 'off' - графики не строятся (подготовка данных на серверах без дисплея)
+PLOT_MODES = ('show', 'files', 'off')
+# Текущие настройки вывода графиков (меняются функцией set_plot_mode)
+REPORT_SETTINGS = {'mode': os.getenv('PLOT_MODE', 'show'),
+                   'path': os.getenv('REPORT_PATH', 'reports'),
+                   'workers': int(os.getenv('PLOT_WORKERS', '2'))}
+# Размер выборки строк для матрицы заполненности датасета
+MATRIX_SAMPLE = int(os.getenv('MATRIX_SAMPLE', '10000'))
+
+# Пул фоновых процессов отрисовки и ещё не завершённые задачи отрисовки
+_executor = {'pool': None, 'futures': []}
+
+
+### Установка режима вывода графиков
+def set_plot_mode(mode, path=None, workers=None):
+    """
+    Функция задаёт режим вывода графиков функций подготовки и загрузки данных
+
+        Параметры:
+            mode (str): 'show', 'files' или 'off' (см. PLOT_MODES)
+            path (str, None): каталог файлов графиков в режиме 'files' (None - без изменений)
+            workers (int, None): количество процессов отрисовки в режиме 'files' (None - без изменений)
+        Выходные параметры (None)
+
+    """
+    if mode not in PLOT_MODES:
+        raise ValueError(f'Неизвестный режим вывода графиков: {mode}')
+    REPORT_SETTINGS['mode'] = mode
+    if path is not None:
+        REPORT_SETTINGS['path'] = path
+    if workers is not None and workers != REPORT_SETTINGS['workers']:
+        REPORT_SETTINGS['workers'] = workers
+        # Пул пересоздаётся с новым количеством процессов при следующей отрисовке
+        wait_plots()
+        if _executor['pool'] is not None:
+            _executor['pool'].shutdown()
+            _executor['pool'] = None
+
+
+### Проверка, строятся ли графики
+def plots_enabled():
+    return REPORT_SETTINGS['mode'] != 'off'
+
+
+### Вывод графиков в выбранном режиме
+def render(draw, *args, name='plot'):
+    """
+    Функция строит графики функцией draw: в режиме 'show' - в текущем процессе с выводом plt.show(),
+    в режиме 'files' - в фоновом процессе с записью каждого построенного полотна в файл PNG
+
+        Параметры:
+            draw (function): функция модуля пакета, строящая полотна matplotlib (без plt.show)
+            args: аргументы функции draw (в режиме 'files' передаются в процесс отрисовки)
+            name (str): имя файлов графиков (name.png или name_<номер>.png)
+        Выходные параметры:
+            future (Future, None): задача отрисовки в режиме 'files' (результат - список файлов)
+
+    """
+    mode = REPORT_SETTINGS['mode']
+    if mode == 'off':
+        return None
+    if mode == 'show':
+        import matplotlib.pyplot as plt
+        draw(*args)
+        plt.show()
+        return None
+
+    if _executor['pool'] is None:
+        _executor['pool'] = ProcessPoolExecutor(max_workers=REPORT_SETTINGS['workers'])
+    future = _executor['pool'].submit(_render_files, draw, args, REPORT_SETTINGS['path'], name)
+    _executor['futures'].append((name, future))
+    return future
+
+
+def _render_files(draw, args, path, name):
+    # Отрисовка в фоновом процессе: backend Agg не требует дисплея и не блокирует основной процесс
+    import matplotlib
+    matplotlib.use('Agg', force=True)
+    import matplotlib.pyplot as plt
+
+    plt.close('all')
+    draw(*args)
+    os.makedirs(path, exist_ok=True)
+    numbers = plt.get_fignums()
+    files = []
+    for i, number in enumerate(numbers, start=1):
+        file_path = os.path.join(path, f'{name}.png' if len(numbers) == 1 else f'{name}_{i}.png')
+        plt.figure(number).savefig(file_path, bbox_inches='tight')
+        files.append(file_path)
+    plt.close('all')
+    return files
+
+
+### Ожидание записи файлов графиков
+def wait_plots():
+    """
+    Функция дожидается завершения фоновой отрисовки графиков (режим 'files') и выводит ошибки отрисовки
+    по каждому графику
+
+        Параметры: нет
+        Выходные параметры:
+            files (list): записанные файлы графиков
+
+    """
+    futures, _executor['futures'] = _executor['futures'], []
+    files = []
+    for name, future in futures:
+        try:
+            files.extend(future.result())
+        except Exception as error:
+            # Ошибка отрисовки одного графика не прерывает ожидание остальных графиков
+            print(f"Ошибка построения графика '{name}': {type(error).__name__}: {error}")
+    if files:
+        print(f'Графики записаны в файлы ({len(files)}): {os.path.dirname(files[0])}')
+    return files
+
+
+### Стратифицированная выборка строк датасета по составу пропусков
+def stratified_sample(df, sample_size=MATRIX_SAMPLE, seed=42):
+    """
+    Функция отбирает строки датасета пропорционально группам строк с одинаковым набором пропущенных колонок
+    (из каждой встреченной группы - не меньше одной строки); порядок строк сохраняется
+
+        Параметры:
+            df (DataFrame): датасет
+            sample_size (int): размер выборки
+            seed (int): зерно генератора случайных чисел
+        Выходные параметры (DataFrame)
+
+    """
+    n_rows = len(df)
+    if n_rows <= sample_size:
+        return df
+    # Ключ группы - полиномиальный хеш набора пропущенных колонок
+    pattern = np.zeros(n_rows, dtype=np.uint64)
+    for col in df.columns:
+        pattern = pattern * np.uint64(31) + df[col].isna().to_numpy(dtype=np.uint64)
+    groups, sizes = np.unique(pattern, return_inverse=True, return_counts=True)[1:]
+    quota = np.maximum(1, np.round(sizes * sample_size / n_rows)).astype(np.int64)
+
+    # Строки упорядочиваются по группе и случайному ключу, из каждой группы берутся первые quota строк
+    order = np.lexsort((np.random.default_rng(seed).random(n_rows), groups))
+    starts = np.concatenate([[0], np.cumsum(sizes)[:-1]])
+    rank = np.arange(n_rows) - starts[groups[order]]
+    positions = np.sort(order[rank < quota[groups[order]]])
+    return df.iloc[positions]
+
+
+### Матрица заполненности датасета значениями
+def missing_matrix(df, name='missing_matrix', sample_size=MATRIX_SAMPLE):
+    """
+    Функция выводит матрицу заполненности датасета (missingno.matrix) по стратифицированной выборке строк
+
+        Параметры:
+            df (DataFrame): датасет
+            name (str): имя файла графика в режиме 'files'
+            sample_size (int): размер выборки строк
+        Выходные параметры:
+            future (Future, None): задача отрисовки в режиме 'files'
+
+    """
+    if not plots_enabled():
+        return None
+    return render(_draw_missing_matrix, stratified_sample(df, sample_size), name=name)
+
+
+def _draw_missing_matrix(df):
+    import missingno as msno
+    msno.matrix(df)
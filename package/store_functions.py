@@ -0,0 +1,264 @@
+import os
+import json
+import shutil
+import sqlite3
+import numpy as np
+import pandas as pd
+from multiprocessing import Pool
+
+
+# pyarrow импортируется в функциях: хранилище нужно ноутбуку и обучению, но не сервису
+
+# Типы колонок таблиц sqlite и соответствующие им типы arrow
+SQLITE_TYPES = {'INTEGER': 'int64', 'REAL': 'float64', 'TEXT': 'string', 'TIMESTAMP': 'string'}
+# Строковая колонка считается категориальной, если уникальных значений не больше этой доли строк
+CATEGORY_RATIO = 0.5
+# Количество корзин, на которые делятся датасеты при объединении по ключу (см. bucket_join)
+BUCKETS = 32
+
+
+### Определение категориальных колонок датасета по доле уникальных значений
+def categorical_columns(df, ratio=CATEGORY_RATIO):
+    return [col for col in df.columns
+            if (pd.api.types.is_object_dtype(df[col]) or pd.api.types.is_string_dtype(df[col])
+                or isinstance(df[col].dtype, pd.CategoricalDtype))
+            and df[col].nunique() <= ratio * len(df)]
+
+
+def _with_categories(schema, categories):
+    # Список категориальных колонок хранится в метаданных схемы файла и используется при чтении
+    return schema.with_metadata({**(schema.metadata or {}), b'categorical': json.dumps(categories).encode()})
+
+
+### Путь к файлу датасета в колоночном хранилище
+def dataset_path(name, path='store'):
+    return os.path.join(path, f'{name}.parquet')
+
+
+### Функция записи датасета в колоночное хранилище
+def dataset_write(df, name, path='store', row_group_size=1_000_000):
+    """
+    Функция записывает датасет в файл Parquet; строковые колонки записываются со словарным кодированием,
+    а статистики групп строк позволяют пропускать их при чтении с фильтрами
+
+        Параметры:
+            df (DataFrame): датасет
+            name (str): наименование датасета в хранилище
+            path (str): каталог хранилища
+            row_group_size (int): количество строк в группе строк файла
+        Выходные параметры:
+            file_path (str): путь к файлу датасета
+
+    """
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    os.makedirs(path, exist_ok=True)
+    file_path = dataset_path(name, path)
+    table = pa.Table.from_pandas(df, preserve_index=False)
+    table = table.replace_schema_metadata(_with_categories(table.schema, categorical_columns(df)).metadata)
+    # Запись через временный файл, чтобы читатели не получили частично записанный датасет
+    pq.write_table(table, file_path + '.tmp', row_group_size=row_group_size, use_dictionary=True)
+    os.replace(file_path + '.tmp', file_path)
+    return file_path
+
+
+### Функция чтения датасета из колоночного хранилища
+def dataset_read(name, path='store', columns=None, filters=None, categorical=True):
+    """
+    Функция читает из файла Parquet только нужные колонки и строки, подходящие под фильтры
+
+        Параметры:
+            name (str): наименование датасета в хранилище
+            path (str): каталог хранилища
+            columns (list, None): читаемые колонки (None - все)
+            filters (list, None): фильтры строк в формате pyarrow, например [('conversion_rate', '==', 1)]
+            categorical (bool): флаг чтения категориальных колонок как category (без раскодирования словаря)
+        Выходные параметры (DataFrame)
+
+    """
+    import pyarrow.parquet as pq
+
+    file_path = dataset_path(name, path)
+    read_dictionary = None
+    if categorical:
+        metadata = pq.read_schema(file_path).metadata or {}
+        read_dictionary = json.loads(metadata.get(b'categorical', b'[]'))
+    table = pq.read_table(file_path, columns=columns, filters=filters, read_dictionary=read_dictionary)
+    return table.to_pandas()
+
+
+### Функция переноса таблиц базы данных sqlite в колоночное хранилище
+def sqlite_migrate(db_path='session.db', path='store', tables=None, chunksize=500_000):
+    """
+    Функция переносит таблицы базы данных sqlite в файлы Parquet, читая каждую таблицу частями,
+    поэтому память не зависит от размера таблицы (категориальные колонки определяются по первой части)
+
+        Параметры:
+            db_path (str): путь к базе данных sqlite
+            path (str): каталог хранилища
+            tables (list, None): переносимые таблицы (None - все таблицы базы данных)
+            chunksize (int): количество строк, читаемых из таблицы за один раз
+        Выходные параметры:
+            migrated (dict): количество перенесённых строк по каждой таблице
+
+    """
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    os.makedirs(path, exist_ok=True)
+    connection = sqlite3.connect(db_path)
+    if tables is None:
+        tables = [row[0] for row in connection.execute("SELECT name FROM sqlite_master WHERE type = 'table'")]
+
+    migrated = {}
+    for table in tables:
+        # Схема берётся из объявленных типов колонок: в отдельной части колонка может быть вся из пропусков
+        columns = connection.execute(f'PRAGMA table_info("{table}")').fetchall()
+        schema = pa.schema([(column[1], SQLITE_TYPES.get(column[2].upper(), 'string')) for column in columns])
+        file_path = dataset_path(table, path)
+        n_rows, writer = 0, None
+        for chunk in pd.read_sql(f'SELECT * FROM "{table}"', connection, chunksize=chunksize):
+            if writer is None:
+                schema = _with_categories(schema, categorical_columns(chunk))
+                writer = pq.ParquetWriter(file_path + '.tmp', schema, use_dictionary=True)
+            writer.write_table(pa.Table.from_pandas(chunk, schema=schema, preserve_index=False))
+            n_rows += len(chunk)
+        if writer is None:
+            writer = pq.ParquetWriter(file_path + '.tmp', _with_categories(schema, []))
+        writer.close()
+        os.replace(file_path + '.tmp', file_path)
+        migrated[table] = n_rows
+        print(f'Таблица {table} перенесена в файл {file_path}: {n_rows} строк')
+    connection.close()
+
+    return migrated
+
+
+### Генератор частей датасета из колоночного хранилища
+def dataset_chunks(name, path='store', columns=None, chunksize=1_000_000):
+    """
+    Функция читает файл Parquet частями по chunksize строк (например, для аудита датасета, не помещающегося в память)
+
+        Параметры:
+            name (str): наименование датасета в хранилище
+            path (str): каталог хранилища
+            columns (list, None): читаемые колонки (None - все)
+            chunksize (int): количество строк в части
+        Выходные параметры (generator): части датасета (DataFrame)
+
+    """
+    import pyarrow.parquet as pq
+
+    for batch in pq.ParquetFile(dataset_path(name, path)).iter_batches(batch_size=chunksize, columns=columns):
+        yield batch.to_pandas()
+
+
+### Функция объединения датасетов по ключу через корзины на диске
+def bucket_join(left, right, key, name, path='store', how='outer', n_buckets=BUCKETS, processes=None,
+                transform=None, row_group_size=1_000_000):
+    """
+    Функция объединяет датасеты по ключу, не держа их целиком в памяти: строки обоих датасетов раскладываются
+    по корзинам на диске по хешу ключа, затем корзины объединяются (pd.merge) по одной, при необходимости -
+    в нескольких процессах, а результат потоково записывается в файл Parquet колоночного хранилища.
+    Строки с одинаковым ключом попадают в одну корзину, поэтому результат совпадает с объединением датасетов
+    в памяти с точностью до порядка строк; память ограничена размером корзины (и количеством процессов)
+
+        Параметры:
+            left (DataFrame, iterable): левый датасет или итератор его частей (например, file_chunks)
+            right (DataFrame, iterable): правый датасет или итератор его частей
+            key (str): ключ объединения
+            name (str): наименование объединённого датасета в хранилище
+            path (str): каталог хранилища
+            how (str): тип объединения (как в pd.merge)
+            n_buckets (int): количество корзин
+            processes (int, None): количество процессов объединения корзин (None - в текущем процессе)
+            transform (function, None): функция модуля пакета, применяемая к каждой объединённой корзине
+                                        (DataFrame -> DataFrame), например preparation_functions.merged_date_time
+            row_group_size (int): наибольшее количество строк в группе строк файла
+        Выходные параметры:
+            file_path (str): путь к файлу объединённого датасета
+
+    """
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    buckets_path = os.path.join(path, f'{name}.buckets')
+    shutil.rmtree(buckets_path, ignore_errors=True)
+    categories = set()
+    for side, data in (('left', left), ('right', right)):
+        categories.update(_partition([data] if isinstance(data, pd.DataFrame) else data,
+                                     key, os.path.join(buckets_path, side), n_buckets))
+
+    tasks = [(buckets_path, bucket, key, how, transform) for bucket in range(n_buckets)]
+    if processes is not None and processes > 1:
+        with Pool(processes) as pool:
+            parts = pool.starmap(_join_bucket, tasks)
+    else:
+        parts = [_join_bucket(*task) for task in tasks]
+
+    # Типы колонок корзин могут различаться (целые с пропусками становятся float, колонка из одних пропусков -
+    # null): файл записывается в общей для всех корзин схеме
+    schema = pa.unify_schemas([pq.read_schema(part) for part in parts], promote_options='permissive')
+    schema = _with_categories(schema.remove_metadata(), [col for col in schema.names if col in categories])
+    file_path = dataset_path(name, path)
+    n_rows = 0
+    with pq.ParquetWriter(file_path + '.tmp', schema, use_dictionary=True) as writer:
+        for part in parts:
+            for batch in pq.ParquetFile(part).iter_batches(batch_size=row_group_size):
+                writer.write_table(pa.Table.from_batches([batch]).cast(schema), row_group_size=row_group_size)
+                n_rows += batch.num_rows
+    os.replace(file_path + '.tmp', file_path)
+    shutil.rmtree(buckets_path)
+    print(f'Датасеты объединены по ключу {key} в файл {file_path}: {n_rows} строк')
+    return file_path
+
+
+def _partition(chunks, key, side_path, n_buckets):
+    # Каждая часть датасета раскладывается по корзинам: файл <корзина>/<номер части>.parquet (в том числе пустой,
+    # чтобы у каждой корзины были колонки датасета); категории записываются значениями, так как словари частей
+    # различаются. Возвращаются категориальные колонки датасета (по первой части)
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    categories = None
+    for number, chunk in enumerate(chunks):
+        if categories is None:
+            categories = categorical_columns(chunk)
+        # Хеш значения ключа не зависит от типа колонки (str, object, category)
+        buckets = pd.util.hash_pandas_object(chunk[key], index=False).to_numpy() % np.uint64(n_buckets)
+        order = np.argsort(buckets, kind='stable')
+        bounds = np.searchsorted(buckets[order], np.arange(n_buckets + 1))
+        table = pa.Table.from_pandas(chunk, preserve_index=False).replace_schema_metadata(None)
+        table = table.cast(pa.schema([field.with_type(field.type.value_type) if pa.types.is_dictionary(field.type)
+                                      else field for field in table.schema]))
+        table = table.take(order)
+        del chunk
+        for bucket in range(n_buckets):
+            bucket_path = os.path.join(side_path, str(bucket))
+            os.makedirs(bucket_path, exist_ok=True)
+            pq.write_table(table.slice(bounds[bucket], bounds[bucket + 1] - bounds[bucket]),
+                           os.path.join(bucket_path, f'{number}.parquet'))
+    return categories or []
+
+
+def _join_bucket(buckets_path, bucket, key, how, transform):
+    # Объединение одной корзины; результат записывается в файл корзины, в родительский процесс передаётся путь
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    sides = []
+    for side in ('left', 'right'):
+        bucket_path = os.path.join(buckets_path, side, str(bucket))
+        # Части корзины читаются в порядке номеров частей исходного датасета
+        file_names = sorted(os.listdir(bucket_path), key=lambda x: int(x.split('.')[0]))
+        tables = [pq.read_table(os.path.join(bucket_path, file_name)) for file_name in file_names]
+        sides.append(pa.concat_tables(tables, promote_options='permissive').to_pandas())
+    df = sides[0].merge(sides[1], on=key, how=how)
+    del sides
+    if transform is not None:
+        df = transform(df)
+
+    part = os.path.join(buckets_path, f'{bucket}.parquet')
+    pq.write_table(pa.Table.from_pandas(df, preserve_index=False), part)
+    return part
@@ -1,6 +1,9 @@
+import os
+import json
 import sqlite3 as bd
 
 import dill
+import numpy as np
 import pandas as pd
 import datetime as dt
 
@@ -9,92 +12,118 @@ from sklearn.ensemble import RandomForestClassifier
 from sklearn.metrics import roc_auc_score
 from sklearn.model_selection import train_test_split
 from sklearn.pipeline import Pipeline, FeatureUnion
-from sklearn.preprocessing import StandardScaler, OrdinalEncoder, FunctionTransformer
+from sklearn.preprocessing import StandardScaler, FunctionTransformer
+
+from package.profiling_functions import PipelineProfiler, profiled_predict_proba, print_profile
+from package.inference_functions import CompiledModel, FlatForest, category_tables, scaler_affine, save_bundle
+from package.imputation_functions import ModeImputer, CategoryEncoder
+
+
+# Значения атрибутов, по которым формируются признаки is_*
+ORGANIC_MEDIUMS = frozenset(['organic', 'referral', '(none)'])
+MOBILE_CATEGORIES = frozenset(['mobile'])
+REPRESENTED_CITIES = frozenset(['Moscow', 'Saint Petersburg', 'Balashikha',
+                                'Khimki', 'Odintsovo', 'Vidnoye', 'Mytishchi',
+                                'Zheleznodorozhny', 'Domodedovo', 'Korolyov'])
+SOCIAL_SOURCES = frozenset(['QxAxdyPLuQMEcrdZWdWb', 'MvfHsxITijuriZxsqZqt',
+                            'ISrKoXQCxqqYvAZICvjs', 'IZEXUFLARCUMynmHNBGo',
+                            'PlbkrSYoHuZBWfYjYnfw', 'gVRrcxiDQubJiljoTbGm'])
+# Признаки is_*: (наименование признака, исходный атрибут, значения атрибута)
+FLAG_FEATURES = (('is_organic', 'utm_medium', ORGANIC_MEDIUMS),
+                 ('is_mobile', 'device_category', MOBILE_CATEGORIES),
+                 ('is_represented', 'geo_city', REPRESENTED_CITIES),
+                 ('is_social', 'utm_source', SOCIAL_SOURCES))
+# Атрибуты визита, которые получает модель (поля запроса сервиса), и целевая переменная
+SESSION_COLUMNS = ['client_id', 'visit_date', 'visit_time', 'utm_source', 'utm_medium', 'utm_campaign',
+                   'utm_adcontent', 'utm_keyword', 'device_category', 'device_os', 'device_brand',
+                   'device_screen_resolution', 'device_browser', 'geo_country', 'geo_city']
+TARGET = 'conversion_rate'
+# Атрибуты, пропуски в которых заполняются самым частым значением (как при подготовке датасета)
+MODE_COLUMNS = ['utm_campaign', 'utm_adcontent', 'device_brand']
+# Значение, которым заполняются пропуски остальных категориальных атрибутов
+MISSING_VALUE = 'нет данных'
+# Обработка категорий, которых не было при обучении: 'missing' - как пропуск, 'mean' - средний код, 'error' - ошибка
+UNKNOWN_CATEGORY = os.getenv('UNKNOWN_CATEGORY', 'missing')
+
+
+# Функция потокового чтения сбалансированного датасета из хранилища:
+# таблица читается частями по chunksize строк и только нужными колонками, записи положительного класса
+# сохраняются все, а из записей отрицательного класса по ходу чтения отбирается столько же (bottom-k:
+# каждой записи присваивается случайный ключ и остаются записи с наименьшими ключами).
+# Из каждой части в отбор добавляются только записи с ключом меньше наибольшего отобранного ключа
+# (не более n_positive наименьших); отобранные записи хранятся частями и объединяются, когда вытесненных записей
+# становится больше отобранных. Память ограничена удвоенным размером сбалансированного датасета и одной частью
+# таблицы, а результат при том же seed не зависит от chunksize
+def load_balanced_sessions(db_path='session.db', table='table_sessions', chunksize=100_000, seed=None):
+    connection = bd.connect(db_path)
+    n_positive = connection.execute(f"SELECT COUNT(*) FROM {table} WHERE {TARGET} = 1").fetchone()[0]
+    rng = np.random.default_rng(seed)
+
+    # pieces - части с отобранными записями в порядке чтения, n_rows - строк в частях,
+    # keys и rows - ключи отобранных записей и номера их строк в объединении частей
+    positives, pieces, n_rows = [], [], 0
+    keys, rows = np.empty(0), np.empty(0, dtype=np.int64)
+    query = f"SELECT {', '.join(SESSION_COLUMNS + [TARGET])} FROM {table} ORDER BY rowid"
+    for chunk in pd.read_sql(query, connection, chunksize=chunksize):
+        is_positive = (chunk[TARGET] == 1).to_numpy()
+        positives.append(chunk[is_positive])
+        chunk_keys = rng.random(int((~is_positive).sum()))
+        if n_positive == 0:
+            continue
+        threshold = keys.max() if len(keys) == n_positive else np.inf
+        candidates = np.flatnonzero(chunk_keys < threshold)
+        if len(candidates) > n_positive:
+            candidates = np.sort(candidates[np.argpartition(chunk_keys[candidates], n_positive)[:n_positive]])
+        if len(candidates) == 0:
+            continue
+        pieces.append(chunk[~is_positive].iloc[candidates])
+        keys = np.concatenate([keys, chunk_keys[candidates]])
+        rows = np.concatenate([rows, np.arange(n_rows, n_rows + len(candidates))])
+        n_rows += len(candidates)
+        if len(keys) > n_positive:
+            keep = np.argpartition(keys, n_positive)[:n_positive]
+            keys, rows = keys[keep], rows[keep]
+        if n_rows > 2 * n_positive:
+            order = np.argsort(rows)
+            pieces, keys = [pd.concat(pieces).iloc[rows[order]]], keys[order]
+            rows, n_rows = np.arange(len(keys)), len(keys)
+    connection.close()
+
+    # Пустая таблица: частей нет, возвращается пустой датасет с колонками запроса
+    if not positives:
+        return pd.DataFrame(columns=SESSION_COLUMNS + [TARGET])
+    negatives = pd.concat(pieces).iloc[np.sort(rows)] if pieces else None
+    return pd.concat([*positives, negatives], axis=0, ignore_index=True)
 
 
 # Функция формирования фичей для обучения модели
 def generate_basic_features(df):
     # create is_* features if missing
-    if 'is_organic' not in df.columns:
-        df['is_organic'] = [*map(lambda x: True if x in ['organic', 'referral', '(none)'] else False,
-                                 df['utm_medium'].values)]
-    else:
-        pass
-
-    if 'is_mobile' not in df.columns:
-        df['is_mobile'] = [*map(lambda x: True if x in ['mobile'] else False,
-                                df['device_category'].values)]
-    else:
-        pass
-
-    if 'is_represented' not in df.columns:
-        df['is_represented'] = [*map(lambda x: True if x in ['Moscow', 'Saint Petersburg', 'Balashikha',
-                                                             'Khimki', 'Odintsovo', 'Vidnoye', 'Mytishchi',
-                                                             'Zheleznodorozhny', 'Domodedovo', 'Korolyov'] else False,
-                                     df['geo_city'].values)]
-    else:
-        pass
-
-    if 'is_social' not in df.columns:
-        df['is_social'] = [*map(lambda x: True if x in ['QxAxdyPLuQMEcrdZWdWb', 'MvfHsxITijuriZxsqZqt',
-                                                        'ISrKoXQCxqqYvAZICvjs', 'IZEXUFLARCUMynmHNBGo',
-                                                        'PlbkrSYoHuZBWfYjYnfw', 'gVRrcxiDQubJiljoTbGm'] else False,
-                                df['utm_source'].values)]
-    else:
-        pass
+    for col, source, values in FLAG_FEATURES:
+        if col not in df.columns:
+            df[col] = df[source].isin(values)
 
     # replace is_* with 0\1
     for col in ['is_organic', 'is_mobile', 'is_represented', 'is_social']:
         df[col] = df[col].astype(int)
 
-    # time features
-    df['visit_year'] = df['visit_date'].apply(lambda x: dt.datetime.strptime(x, '%Y-%m-%d').year)
-    df['visit_month'] = df['visit_date'].apply(lambda x: dt.datetime.strptime(x, '%Y-%m-%d').month)
-    df['visit_day'] = df['visit_date'].apply(lambda x: dt.datetime.strptime(x, '%Y-%m-%d').day)
-    df['visit_weekday'] = df['visit_date'].apply(lambda x: dt.datetime.strptime(x, '%Y-%m-%d').weekday())
-    df['visit_hour'] = df['visit_time'].apply(lambda x: dt.datetime.strptime(x, '%H:%M:%S.%f').hour)
-    print(df.info())
+    # time features (каждое поле разбирается один раз по фиксированному формату)
+    visit_date = pd.to_datetime(df['visit_date'], format='%Y-%m-%d').dt
+    df['visit_year'] = visit_date.year.astype(int)
+    df['visit_month'] = visit_date.month.astype(int)
+    df['visit_day'] = visit_date.day.astype(int)
+    df['visit_weekday'] = visit_date.weekday.astype(int)
+    df['visit_hour'] = pd.to_datetime(df['visit_time'], format='%H:%M:%S.%f').dt.hour.astype(int)
 
     return df
 
 
-# Прочитаем из хранилища датасет sessions
-connection = bd.connect('session.db')
-df = pd.read_sql("SELECT * FROM table_sessions", connection)
-connection.close()
-
-# Сбалансируем датасет уменьшением количества негативного класса
-# Выбирем все записи положительного класса в таргете
-df_1 = df[df.conversion_rate == 1]
-# Выберем записи отрицательного класса количесвтом, равным количеству записей положительного класса
-df_0 = df[df.conversion_rate == 0].sample(int(len(df_1)))
-# Объединим полученные записи положительного и отрицательного класса в сблансированный датасет
-df_balance = pd.concat([df_1, df_0], axis=0, ignore_index='ignor')
-
-# Приготовим данные для обучения
-X = df_balance.drop(['session_id', 'visit_number', 'client', 'conversion_rate'], axis=1)
-y = df_balance['conversion_rate']
-
-# Подготовим json файлы для тестов работы модели через FastAPI
-sample = X.sample(1)
-for i in range(1 ,3):
-    json_file = sample.to_json(orient='records')
-    with open(f'data_{i}.json', 'w') as outfile:
-        outfile.write(json_file)
-
-# Объявим экземпляры классов для преобразования числовых и категориальных переменных, а также для обучения
-scaler1 = StandardScaler()
-scaler2 = StandardScaler()
-oe = OrdinalEncoder()
-rf = RandomForestClassifier(max_features='sqrt', min_samples_leaf=13, n_estimators=700, random_state=42)
-
-# Сделаем pipeline для кодирования и стандартизации категориальных переменных датасета
-
+# Функции pipeline для кодирования и стандартизации категориальных переменных датасета
 def func1(df):
     cat_features = ['utm_source', 'utm_medium', 'utm_campaign', 'utm_adcontent', 'utm_keyword',
                 'device_category', 'device_os', 'device_brand', 'device_screen_resolution', 'device_browser',
                 'geo_country', 'geo_city']
-    return df[cat_features].fillna('нет данных')
+    return df[cat_features].fillna(MISSING_VALUE)
 
 def func2(data):
     cat_features = ['utm_source', 'utm_medium', 'utm_campaign', 'utm_adcontent', 'utm_keyword',
@@ -102,18 +131,8 @@ def func2(data):
                 'geo_country', 'geo_city']
     return pd.DataFrame(data, columns=cat_features)
 
-cat_features_selector = FunctionTransformer(func=func1, validate=False)
-df_cat =  FunctionTransformer(func=func2)
-cat_features_preprocessor = Pipeline([("cat_features_selector", cat_features_selector),
-                                      ("oe", oe), ('scaler1', scaler1), ('df_cat', df_cat)])
 
-
-# Сделаем pipeline для обогощения датасета фичами
-new_features_selector = FunctionTransformer(func=generate_basic_features, validate=False)
-new_features_preprocessor = Pipeline([("new_features_selector", new_features_selector)])
-
-
-# Сделаем pipeline для стандартизации новых фичей
+# Функции pipeline для стандартизации новых фичей
 def func3(df):
     other_features = ['is_organic', 'is_mobile', 'is_represented', 'is_social',
                    'visit_year', 'visit_month', 'visit_day', 'visit_weekday', 'visit_hour']
@@ -126,53 +145,151 @@ def func4(data):
     return pd.DataFrame(data, columns=other_features)
 
 
-other_features_selector = FunctionTransformer(func=func3)
-df_other =  FunctionTransformer(func=func4)
-other_features_preprocessor = Pipeline([("new_features_preprocessor", new_features_preprocessor),
-                                        ("other_features_selector", other_features_selector),
-                                        ('scaler2', scaler2), ('df_other', df_other)])
-
-
-# Установим диаграмное отображение объектов sklearn
-sklearn.set_config(display='diagram')
-# Объединим созданные выше pipeline в один с помощью функции FeatureUnion
-# и затем записываем итоговый pipeline для модели "Случайный лес деревьев"
-feature_union = FeatureUnion([("cat_features_preprocessor", cat_features_preprocessor),
-("other_features_preprocessor", other_features_preprocessor)])
-pipeline = Pipeline([("preprocessing", feature_union), ('rf', rf)])
-
-
-# Из-за возможной, связанной при разряженности данных
-# обучим модель на всех данных и проверим её качество
-pipeline.fit(X, y)
-
-# Проверим качество модели
-score = round(roc_auc_score(y, pipeline.predict(X))*100, 2)
-print(f'Метрика ROC AUC: {score}%')
-
-# Упакуем модель в словарь
-model = {
-         'best_model': pipeline,
-         'metadata':   {
-                        'name': 'Модель предсказания целевых действий',
-                        'author':  'Argentov Sergey',
-                        'date':     dt.datetime.strftime(dt.datetime.now(), '%Y-%m-%d'),
-                        'version': 'v.1.98',
-                        'type': type(pipeline.named_steps['rf']).__name__,
-                        'score': f'{score}%'
-                       },
-        }
-
-
-# Записываем модель в формат pickle
-with open('model.pickle', 'wb') as file:
-    dill.dump(model, file, recurse=True)
-
-# Считываем модель для проверки предсказания по json-файлу
-with open('model.pickle', 'rb') as file:
-    model = dill.load(file)
-df_sample = pd.read_json('./data_1.json', orient='records')
-# Исключим некорректное преобразование времени из json в датафрейм
-df_sample['visit_time'] = df_sample['visit_time'].apply(lambda x: dt.datetime.strftime(x, '%H:%M:%S.%f'))
-
-print(model['metadata'])
+# Функция экспорта обученного pipeline в компилированную модель для сервиса
+# (unknown - обработка неизвестных категорий: 'error', 'missing' или 'mean'; None - как в шаге 'oe' pipeline)
+def compile_pipeline(pipeline, unknown=None):
+    cat_preprocessor, other_preprocessor = [step for _, step in
+                                            pipeline.named_steps['preprocessing'].transformer_list]
+    # Пропуски атрибутов из шага 'imputer' заполняются самым частым значением, остальных - MISSING_VALUE
+    imputer = cat_preprocessor.named_steps.get('imputer')
+    if imputer is not None and imputer.pairs:
+        raise ValueError('Компилированная модель не поддерживает заполнение пропусков по родительским колонкам')
+    modes = imputer.modes_ if imputer is not None else {}
+    oe = cat_preprocessor.named_steps['oe']
+    scaler1 = cat_preprocessor.named_steps['scaler1']
+    cat_offset, cat_scale = scaler_affine(scaler1, len(oe.categories_))
+    # Код категории и стандартизация сводятся в таблицу {категория: итоговое значение признака}
+    cat_tables = category_tables(oe.categories_, cat_offset, cat_scale)
+    cat_mean = (getattr(scaler1, 'mean_', np.zeros(len(oe.categories_))) - cat_offset) / cat_scale
+    # Неизвестные категории кодируются так же, как в шаге 'oe' (OrdinalEncoder ранних моделей - ошибка)
+    unknown = unknown or getattr(oe, 'unknown', 'error')
+    unknown_values = None
+    if hasattr(oe, 'missing_codes_'):
+        unknown_values = (np.asarray(oe.missing_codes_) - cat_offset) / cat_scale
+    other_offset, other_scale = scaler_affine(other_preprocessor.named_steps['scaler2'],
+                                              len(FLAG_FEATURES) + 5)
+    rf = pipeline.named_steps['rf']
+    return CompiledModel(cat_features=oe.feature_names_in_,
+                         cat_tables=cat_tables, cat_mean=cat_mean,
+                         missing_value=[modes.get(col, MISSING_VALUE) for col in oe.feature_names_in_],
+                         flags=[(source, values) for _, source, values in FLAG_FEATURES],
+                         other_offset=other_offset, other_scale=other_scale,
+                         forest=FlatForest.from_estimator(rf),
+                         classes=rf.classes_,
+                         unknown=unknown,
+                         unknown_values=unknown_values)
+
+
+if __name__ == '__main__':
+    # Прочитаем из хранилища сбалансированный датасет sessions: все записи положительного класса
+    # и столько же случайно отобранных записей отрицательного класса
+    df_balance = load_balanced_sessions('session.db', chunksize=int(os.getenv('CHUNK_SIZE', '100000')),
+                                        seed=int(os.getenv('SEED', '42')))
+
+    # Приготовим данные для обучения
+    X = df_balance.drop([TARGET], axis=1)
+    y = df_balance[TARGET]
+
+    # Подготовим json файлы для тестов работы модели через FastAPI
+    sample = X.sample(1)
+    for i in range(1 ,3):
+        json_file = sample.to_json(orient='records')
+        with open(f'data_{i}.json', 'w') as outfile:
+            outfile.write(json_file)
+
+    # Объявим экземпляры классов для преобразования числовых и категориальных переменных, а также для обучения
+    scaler1 = StandardScaler()
+    scaler2 = StandardScaler()
+    oe = CategoryEncoder(unknown=UNKNOWN_CATEGORY, missing_value=MISSING_VALUE)
+    rf = RandomForestClassifier(max_features='sqrt', min_samples_leaf=13, n_estimators=700, random_state=42)
+
+    # Сделаем pipeline для кодирования и стандартизации категориальных переменных датасета
+    # (пропуски в MODE_COLUMNS заполняются самыми частыми значениями обучающего датасета)
+    imputer = ModeImputer(columns=MODE_COLUMNS)
+    cat_features_selector = FunctionTransformer(func=func1, validate=False)
+    df_cat =  FunctionTransformer(func=func2)
+    cat_features_preprocessor = Pipeline([("imputer", imputer), ("cat_features_selector", cat_features_selector),
+                                          ("oe", oe), ('scaler1', scaler1), ('df_cat', df_cat)])
+
+
+    # Сделаем pipeline для обогощения датасета фичами
+    new_features_selector = FunctionTransformer(func=generate_basic_features, validate=False)
+    new_features_preprocessor = Pipeline([("new_features_selector", new_features_selector)])
+
+
+    # Сделаем pipeline для стандартизации новых фичей
+    other_features_selector = FunctionTransformer(func=func3)
+    df_other =  FunctionTransformer(func=func4)
+    other_features_preprocessor = Pipeline([("new_features_preprocessor", new_features_preprocessor),
+                                            ("other_features_selector", other_features_selector),
+                                            ('scaler2', scaler2), ('df_other', df_other)])
+
+
+    # Установим диаграмное отображение объектов sklearn
+    sklearn.set_config(display='diagram')
+    # Объединим созданные выше pipeline в один с помощью функции FeatureUnion
+    # и затем записываем итоговый pipeline для модели "Случайный лес деревьев"
+    feature_union = FeatureUnion([("cat_features_preprocessor", cat_features_preprocessor),
+    ("other_features_preprocessor", other_features_preprocessor)])
+    pipeline = Pipeline([("preprocessing", feature_union), ('rf', rf)])
+
+
+    # Из-за возможной, связанной при разряженности данных
+    # обучим модель на всех данных и проверим её качество
+    pipeline.fit(X, y)
+
+    # Проверим качество модели
+    # (при PROFILE_PIPELINE=1 предсказание выполняется с замером каждого шага pipeline)
+    if os.getenv('PROFILE_PIPELINE') == '1':
+        profiler = PipelineProfiler()
+        proba = profiled_predict_proba(pipeline, X, profiler)
+        print_profile(profiler)
+    else:
+        proba = pipeline.predict_proba(X)
+    score = round(roc_auc_score(y, pipeline.classes_.take(proba.argmax(axis=1)))*100, 2)
+    print(f'Метрика ROC AUC: {score}%')
+
+    # Упакуем модель в словарь
+    model = {
+             'best_model': pipeline,
+             'metadata':   {
+                            'name': 'Модель предсказания целевых действий',
+                            'author':  'Argentov Sergey',
+                            'date':     dt.datetime.strftime(dt.datetime.now(), '%Y-%m-%d'),
+                            'version': 'v.1.98',
+                            'type': type(pipeline.named_steps['rf']).__name__,
+                            'score': f'{score}%'
+                           },
+            }
+
+
+    # Записываем модель в формат pickle
+    # (через временный файл, чтобы сервис не прочитал частично записанную модель)
+    with open('model.pickle.tmp', 'wb') as file:
+        dill.dump(model, file, recurse=True)
+    os.replace('model.pickle.tmp', 'model.pickle')
+    # Рядом с моделью записываем метаданные и запись для прогрева модели:
+    # сервис отдаёт /version и прогревает модель, не загружая pickle и sklearn
+    warmup_sample = json.loads(sample.to_json(orient='records'))
+    with open('model_metadata.json', 'w', encoding='utf-8') as file:
+        json.dump({'metadata': model['metadata'], 'sample': warmup_sample}, file, ensure_ascii=False, indent=1)
+
+    # Экспортируем pipeline в компилированную модель (NumPy без pandas и sklearn)
+    # и проверяем совпадение её предсказаний с pipeline
+    compiled = compile_pipeline(pipeline)
+    compiled_proba = compiled.predict_proba({col: X[col].to_numpy(dtype=object) for col in X.columns})
+    compiled_error = np.abs(compiled_proba - proba).max()
+    print(f'Максимальное отклонение вероятностей компилированной модели: {compiled_error:.2e}')
+    assert compiled_error < 1e-9, 'Предсказания компилированной модели не совпадают с pipeline'
+    # Записываем компилированную модель в каталог: манифест и массивы .npy,
+    # которые процессы сервиса отображают в память и используют совместно
+    save_bundle(compiled, model['metadata'], 'model_bundle', sample=warmup_sample)
+
+    # Считываем модель для проверки предсказания по json-файлу
+    with open('model.pickle', 'rb') as file:
+        model = dill.load(file)
+    df_sample = pd.read_json('./data_1.json', orient='records')
+    # Исключим некорректное преобразование времени из json в датафрейм
+    df_sample['visit_time'] = df_sample['visit_time'].apply(lambda x: dt.datetime.strftime(x, '%H:%M:%S.%f'))
+
+    print(model['metadata'])
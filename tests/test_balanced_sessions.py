@@ -0,0 +1,71 @@
+import os
+import sys
+import sqlite3
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from pipeline import SESSION_COLUMNS, TARGET, load_balanced_sessions
+
+
+def make_db(path, n_rows, positive_rate=0.1, seed=0):
+    # Таблица визитов: номер визита в client_id, целевая переменная с долей положительного класса positive_rate
+    rng = np.random.default_rng(seed)
+    df = pd.DataFrame({col: rng.choice(['a', 'b', None], n_rows) for col in SESSION_COLUMNS})
+    df['client_id'] = [str(i) for i in range(n_rows)]
+    df[TARGET] = (rng.random(n_rows) < positive_rate).astype(int)
+    with sqlite3.connect(path) as connection:
+        df.to_sql('table_sessions', connection, index=False)
+    return df
+
+
+@pytest.fixture
+def db(tmp_path):
+    path = str(tmp_path / 'session.db')
+    return path, make_db(path, 5000)
+
+
+def test_balanced(db):
+    path, df = db
+    sample = load_balanced_sessions(path, chunksize=700, seed=1)
+    n_positive = int(df[TARGET].sum())
+    assert list(sample.columns) == SESSION_COLUMNS + [TARGET]
+    assert (sample[TARGET] == 0).sum() == (sample[TARGET] == 1).sum() == n_positive
+    # Все записи положительного класса сохраняются; записи отрицательного класса не повторяются
+    assert set(sample.loc[sample[TARGET] == 1, 'client_id']) == set(df.loc[df[TARGET] == 1, 'client_id'])
+    negatives = sample.loc[sample[TARGET] == 0, 'client_id']
+    assert negatives.is_unique and set(negatives) <= set(df.loc[df[TARGET] == 0, 'client_id'])
+    # Записи каждого класса идут в порядке чтения таблицы
+    assert negatives.astype(int).is_monotonic_increasing
+
+
+@pytest.mark.parametrize('chunksize', [13, 97, 1000, 100_000])
+def test_reproducible_across_chunksize(db, chunksize):
+    path, _ = db
+    expected = load_balanced_sessions(path, chunksize=5000, seed=7)
+    sample = load_balanced_sessions(path, chunksize=chunksize, seed=7)
+    # Части из одних пропусков читаются колонками object с None вместо NaN: сравниваются значения
+    pd.testing.assert_frame_equal(sample.astype(object).fillna('-'), expected.astype(object).fillna('-'))
+
+
+def test_seed_changes_sample(db):
+    path, _ = db
+    first = load_balanced_sessions(path, chunksize=700, seed=1)
+    second = load_balanced_sessions(path, chunksize=700, seed=2)
+    assert set(first['client_id']) != set(second['client_id'])
+
+
+def test_empty_table(tmp_path):
+    path = str(tmp_path / 'session.db')
+    make_db(path, 0)
+    sample = load_balanced_sessions(path, seed=0)
+    assert sample.empty and list(sample.columns) == SESSION_COLUMNS + [TARGET]
+
+
+def test_no_positives(tmp_path):
+    path = str(tmp_path / 'session.db')
+    make_db(path, 500, positive_rate=0)
+    assert load_balanced_sessions(path, chunksize=100, seed=0).empty
@@ -0,0 +1,66 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from package.store_functions import bucket_join, dataset_read
+
+
+def canonical(df):
+    # Результат сравнивается без учёта порядка строк и колонок: типы корзин приводятся к общей схеме
+    # (целые с пропусками - float), пропуски разных типов записываются одинаково
+    df = df[sorted(df.columns)].copy()
+    for col in df.columns:
+        if pd.api.types.is_numeric_dtype(df[col]) and not pd.api.types.is_bool_dtype(df[col]):
+            df[col] = df[col].astype(float)
+    df = df.astype(object).where(df.notna(), None).astype(str)
+    return df.sort_values(list(df.columns)).reset_index(drop=True)
+
+
+@pytest.fixture
+def sessions():
+    rng = np.random.default_rng(0)
+    n_rows = 600
+    return pd.DataFrame({'session_id': [f'{i}.1637' for i in range(n_rows)],
+                         'client_id': rng.integers(0, 300, n_rows).astype(str),
+                         'utm_source': pd.Categorical(rng.choice(['ZpY', 'MvF', 'fDL'], n_rows)),
+                         'visit_number': rng.integers(1, 5, n_rows)})
+
+
+@pytest.fixture
+def hits():
+    # События визитов: у части визитов событий нет, часть событий относится к визитам, которых нет в sessions
+    rng = np.random.default_rng(1)
+    n_rows = 3000
+    return pd.DataFrame({'session_id': [f'{i}.1637' for i in rng.integers(0, 700, n_rows)],
+                         'hit_number': rng.integers(1, 100, n_rows),
+                         'event_action': rng.choice(['view_card', 'sub_submit_success', None], n_rows)})
+
+
+def chunks(df, size):
+    return (df.iloc[i:i + size] for i in range(0, len(df), size))
+
+
+@pytest.mark.parametrize('how', ['outer', 'inner', 'left'])
+def test_matches_merge(tmp_path, sessions, hits, how):
+    bucket_join(sessions, hits, 'session_id', 'merged', path=str(tmp_path), how=how, n_buckets=7)
+    result = dataset_read('merged', path=str(tmp_path), categorical=False)
+    expected = sessions.merge(hits, on='session_id', how=how)
+    assert len(result) == len(expected)
+    pd.testing.assert_frame_equal(canonical(result), canonical(expected))
+
+
+def test_chunks_and_processes(tmp_path, sessions, hits):
+    # Части датасетов и объединение корзин в нескольких процессах дают тот же результат
+    bucket_join(chunks(sessions, 250), chunks(hits, 700), 'session_id', 'merged', path=str(tmp_path),
+                n_buckets=5, processes=2)
+    result = dataset_read('merged', path=str(tmp_path))
+    expected = sessions.merge(hits, on='session_id', how='outer')
+    pd.testing.assert_frame_equal(canonical(result), canonical(expected))
+    # Категориальные колонки читаются как category, корзины на диске удаляются
+    assert isinstance(result['utm_source'].dtype, pd.CategoricalDtype)
+    assert sorted(os.listdir(tmp_path)) == ['merged.parquet']
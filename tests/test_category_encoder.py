@@ -0,0 +1,66 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+import pandas as pd
+import pytest
+from sklearn.preprocessing import OrdinalEncoder
+
+from package.imputation_functions import CategoryEncoder
+
+
+MISSING_VALUE = 'нет данных'
+
+
+@pytest.fixture
+def train():
+    rng = np.random.default_rng(0)
+    n_rows = 2000
+    return pd.DataFrame({'utm_source': rng.choice(['fDL', 'ZpY', 'MvF', MISSING_VALUE], n_rows,
+                                                  p=[0.4, 0.3, 0.2, 0.1]),
+                         'device_os': rng.choice(['Android', 'iOS', 'Windows'], n_rows, p=[0.5, 0.3, 0.2])},
+                        dtype=object)
+
+
+@pytest.fixture
+def test(train):
+    # Неизвестные категории в обеих колонках
+    test = train.iloc[:10].copy()
+    test.iloc[3, 0] = 'unseen'
+    test.iloc[5, 1] = 'Tizen'
+    return test
+
+
+def test_matches_ordinal_encoder(train):
+    encoded = CategoryEncoder(missing_value=MISSING_VALUE).fit(train).transform(train)
+    np.testing.assert_array_equal(encoded, OrdinalEncoder().fit(train).transform(train))
+
+
+def test_unknown_error(train, test):
+    encoder = CategoryEncoder(unknown='error', missing_value=MISSING_VALUE).fit(train)
+    with pytest.raises(ValueError, match='unseen'):
+        encoder.transform(test)
+    # Как OrdinalEncoder с handle_unknown='error'
+    with pytest.raises(ValueError):
+        OrdinalEncoder().fit(train).transform(test)
+
+
+@pytest.mark.parametrize('unknown', ['missing', 'mean'])
+def test_unknown_codes(train, test, unknown):
+    encoder = CategoryEncoder(unknown=unknown, missing_value=MISSING_VALUE).fit(train)
+    encoded = encoder.transform(test)
+    # Известные категории кодируются как в OrdinalEncoder, неизвестные - кодом выбранного способа
+    expected = OrdinalEncoder(handle_unknown='use_encoded_value', unknown_value=-1).fit(train).transform(test)
+    codes = np.asarray(encoder.unknown_codes())
+    expected = np.where(expected == -1, codes, expected)
+    np.testing.assert_array_equal(encoded, expected)
+    ordinal = OrdinalEncoder().fit(train)
+    if unknown == 'missing':
+        # utm_source: код значения пропуска; device_os (без пропусков при обучении): код самой частой категории
+        assert encoded[3, 0] == ordinal.transform(pd.DataFrame({'utm_source': [MISSING_VALUE],
+                                                                'device_os': ['iOS']}))[0, 0]
+        assert encoded[5, 1] == list(ordinal.categories_[1]).index('Android')
+    else:
+        np.testing.assert_allclose(codes, ordinal.transform(train).mean(axis=0))
@@ -0,0 +1,82 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from package.audit_functions import audit_cache_clear, dataset_audit
+
+
+@pytest.fixture
+def df():
+    audit_cache_clear()
+    rng = np.random.default_rng(0)
+    n_rows = 1000
+    df = pd.DataFrame({'utm_source': rng.choice(['a', 'b', 'c', None], n_rows, p=[0.5, 0.3, 0.15, 0.05]),
+                       'device_brand': pd.Categorical(rng.choice(['Apple', 'Samsung', None], n_rows,
+                                                                 p=[0.6, 0.3, 0.1])),
+                       'visit_number': rng.integers(1, 5, n_rows),
+                       'hit_time': np.where(rng.random(n_rows) < 0.2, np.nan, rng.random(n_rows)),
+                       'visit_date': pd.to_datetime('2021-11-01') + pd.to_timedelta(rng.integers(0, 9, n_rows), 'D'),
+                       'client_id': pd.array(rng.choice([1, 2, 3], n_rows), dtype='Int64')})
+    df.loc[rng.random(n_rows) < 0.1, 'client_id'] = pd.NA
+    yield df
+    audit_cache_clear()
+
+
+def assert_matches_pandas(report, df):
+    # Исходные статистики: isnull().sum() и describe() (количество уникальных значений и частота самого частого)
+    for col in df.columns:
+        values = df[col]
+        assert report.loc[col, 'rows'] == len(values)
+        assert report.loc[col, 'nulls'] == values.isnull().sum()
+        assert report.loc[col, 'share'] == round(values.isnull().sum() / len(values) * 100, 2)
+        if 'unique' in report.columns:
+            counts = values.value_counts()
+            assert report.loc[col, 'unique'] == values.nunique()
+            assert report.loc[col, 'top'] == counts.index[0] and report.loc[col, 'freq'] == counts.iloc[0]
+
+
+def test_matches_pandas(df):
+    assert_matches_pandas(dataset_audit(df, cardinality=True), df)
+
+
+@pytest.mark.parametrize('cardinality', [False, True])
+def test_in_place_edits(df, cardinality):
+    dataset_audit(df, cardinality=cardinality)
+    # Изменения на месте не меняют буферы колонок: повторный аудит должен учитывать новые значения
+    df.loc[:99, 'utm_source'] = None
+    df.loc[:99, 'hit_time'] = np.nan
+    df.loc[df['device_brand'].isna(), 'device_brand'] = 'Apple'
+    df.iloc[:10, df.columns.get_loc('visit_number')] = 4
+    assert_matches_pandas(dataset_audit(df, cardinality=cardinality), df)
+
+
+def test_fillna_copy_on_write(df):
+    # Колонка без пропусков после fillna при copy-on-write разделяет буфер исходной колонки
+    dataset_audit(df)
+    df['visit_number'] = df['visit_number'].fillna(0)
+    df['utm_source'] = df['utm_source'].fillna('b')
+    report = dataset_audit(df, cardinality=True)
+    assert report.loc['utm_source', 'nulls'] == 0
+    assert_matches_pandas(report, df)
+
+
+def test_chunks_match_frame(df):
+    report = dataset_audit(df, cardinality=True)
+    chunks = dataset_audit((df.iloc[i:i + 300] for i in range(0, len(df), 300)), cardinality=True)
+    pd.testing.assert_frame_equal(chunks[['rows', 'nulls', 'share', 'unique', 'freq']],
+                                  report[['rows', 'nulls', 'share', 'unique', 'freq']], check_dtype=False)
+
+
+def test_cache_opt_in(df):
+    first = dataset_audit(df, cache=True)
+    # Неизменённый датасет получает статистики из кэша; новая колонка считается заново
+    assert dataset_audit(df, cache=True).equals(first)
+    df['hit_time'] = df['hit_time'].fillna(0.5)
+    report = dataset_audit(df, cache=True)
+    assert report.loc['hit_time', 'nulls'] == 0
+    assert_matches_pandas(report, df)
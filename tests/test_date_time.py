@@ -0,0 +1,70 @@
+import itertools
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from benchmarks.run_benchmarks import HITS, create_date_time_ns_reference, create_date_time_visit_reference, sample
+from package.preparation_functions import date_time_ns, date_time_visit
+
+
+def reference_date_time(df):
+    # Построчные функции из prn.py с разбором строк pd.to_datetime (исходная реализация data_marge)
+    date_time = pd.Series([create_date_time_visit_reference(*row) for row in zip(df['visit_date'], df['visit_time'])],
+                          index=df.index, dtype=object)
+    reference = pd.Series([create_date_time_ns_reference(*row) for row in
+                           zip(date_time, df['hit_date'], df['hit_time'])], index=df.index, dtype=object)
+    return date_time, pd.to_datetime(reference, format='%Y-%m-%d %H:%M:%S.%f').astype('datetime64[ns]')
+
+
+def assert_matches_reference(df):
+    date_time, reference = reference_date_time(df)
+    result = date_time_ns(date_time_visit(df['visit_date'], df['visit_time']), df['hit_date'], df['hit_time'])
+    pd.testing.assert_series_equal(result, reference, check_names=False)
+    # Строковое поле даты и времени визита (как в объединённом датасете) даёт тот же результат
+    pd.testing.assert_series_equal(date_time_ns(date_time, df['hit_date'], df['hit_time']), reference,
+                                   check_names=False)
+
+
+def test_hits_sample():
+    assert_matches_reference(sample(10_000, HITS))
+
+
+def test_large_hit_time():
+    # Время события от секунды и больше: построчная реализация разбирает значения меньше 10 секунд
+    rng = np.random.default_rng(0)
+    df = sample(10_000, HITS, seed=1)
+    hit_time = rng.integers(1_000_000_000, 9_999_999_999, len(df)) + rng.random(len(df))
+    hit_time[rng.random(len(df)) < 0.1] = np.nan
+    hit_time[:4] = [999_999_999.5, 1_000_000_000, 1_000_000_000.5, 9_999_999_999]
+    df['hit_time'] = hit_time
+    assert_matches_reference(df)
+
+
+def test_missing_combinations():
+    # Все сочетания пропусков даты и времени визита, даты и времени события
+    values = {'visit_date': '2021-11-01', 'visit_time': '10:20:30',
+              'hit_date': '2021-11-02', 'hit_time': 1_234_567_890.7}
+    rows = [{col: value if present else None for (col, value), present in zip(values.items(), mask)}
+            for mask in itertools.product([True, False], repeat=len(values))]
+    df = pd.DataFrame(rows).astype({'hit_time': float})
+    assert_matches_reference(df)
+    result = date_time_ns(date_time_visit(df['visit_date'], df['visit_time']), df['hit_date'], df['hit_time'])
+    assert result.isna().sum() == 4
+
+
+@pytest.mark.parametrize('hit_time', [10_000_000_000, 86_399_999_999_999, 10 ** 15 + 0.5])
+def test_hit_time_beyond_reference(hit_time):
+    # Для времени события от 10 секунд строки построчной реализации не разбираются: результат сверяется
+    # с арифметикой над pd.Timestamp
+    df = pd.DataFrame({'date_time': ['2021-11-01 10:20:30', None], 'hit_date': ['2021-11-02', '2021-11-02'],
+                       'hit_time': [hit_time, hit_time]})
+    ns = int(hit_time)
+    expected = pd.Series([pd.Timestamp('2021-11-01 10:20:30') + pd.Timedelta(ns % 1_000_000_000, unit='ns'),
+                          pd.Timestamp('2021-11-02') + pd.Timedelta(ns, unit='ns')], dtype='datetime64[ns]')
+    pd.testing.assert_series_equal(date_time_ns(df['date_time'], df['hit_date'], df['hit_time']), expected,
+                                   check_names=False)
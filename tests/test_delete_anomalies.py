@@ -0,0 +1,61 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from package.preparation_functions import client_visits, delete_anomalies
+
+
+def reference_delete_anomalies(df):
+    # Исходная реализация: количество заполненных значений каждой колонки по клиенту и визиты не реже раза в день
+    visit_count = df.groupby('client_id').agg('count')
+    days_count = (df.visit_date.max() - df.visit_date.min()).days
+    roboticity_client = list(visit_count.loc[visit_count['session_id'] >= days_count].index)
+    return df.loc[~df.client_id.isin(roboticity_client)]
+
+
+@pytest.fixture
+def df():
+    # Визиты за 30 дней: обычные клиенты, клиенты с визитом каждый день и клиенты со всплесками визитов
+    rng = np.random.default_rng(0)
+    n_rows = 5000
+    clients = rng.integers(0, 2000, n_rows).astype(str)
+    clients[:120] = np.repeat(['robot_1', 'robot_2', 'robot_3', 'robot_4'], 30)
+    clients[120:140] = 'burst'
+    clients[140:150] = 'same_time'
+    df = pd.DataFrame({'session_id': [f'{i}.1637' for i in range(n_rows)],
+                       'client_id': clients,
+                       'visit_date': pd.to_datetime('2021-11-01') + pd.to_timedelta(rng.integers(0, 31, n_rows), 'D'),
+                       'visit_time': pd.to_timedelta(rng.integers(0, 24 * 3600, n_rows), 's')})
+    df.loc[120:139, 'visit_date'] = pd.Timestamp('2021-11-05')
+    df.loc[140:149, ['visit_date', 'visit_time']] = (pd.Timestamp('2021-11-06'), pd.Timedelta(hours=10))
+    return df
+
+
+def test_matches_reference(df):
+    result = delete_anomalies(df)
+    pd.testing.assert_frame_equal(result, reference_delete_anomalies(df))
+    assert not result['client_id'].isin(['robot_1', 'robot_4']).any()
+
+
+def test_heuristics(df):
+    result, excluded = delete_anomalies(df, max_day_visits=8, max_same_time=3, return_excluded=True)
+    # Пороги сверяются с частотами групп по клиенту и дате и по клиенту, дате и времени визита
+    day_visits = df.groupby(['client_id', 'visit_date']).size().groupby('client_id').max()
+    same_time = df.groupby(['client_id', 'visit_date', 'visit_time']).size().groupby('client_id').max()
+    robotic = set(df['client_id']) - set(reference_delete_anomalies(df)['client_id'])
+    assert excluded == robotic | set(day_visits.index[day_visits > 8]) | set(same_time.index[same_time > 3])
+    assert {'burst', 'same_time', 'robot_2'} <= excluded
+    pd.testing.assert_frame_equal(result, df.loc[~df['client_id'].isin(excluded)])
+
+
+def test_chunks_match_frame(df):
+    visits, days_count = client_visits(df, bursts=True, same_time=True)
+    chunked, chunked_days = client_visits((df.iloc[i:i + 700] for i in range(0, len(df), 700)),
+                                          bursts=True, same_time=True)
+    assert chunked_days == days_count == 30
+    pd.testing.assert_frame_equal(chunked.sort_index(), visits.sort_index())
@@ -0,0 +1,64 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from package.load_functions import file_load
+from package.report_functions import REPORT_SETTINGS
+
+
+@pytest.fixture
+def source(tmp_path, monkeypatch):
+    # Графики в тестах не строятся
+    monkeypatch.setitem(REPORT_SETTINGS, 'mode', 'off')
+    rng = np.random.default_rng(0)
+    n_rows = 1000
+    df = pd.DataFrame({'session_id': [f'{i}.{i * 7}' for i in range(n_rows)],
+                       'utm_source': rng.choice(['ZpYIoDJMcFzVoPFsHGJL', 'MvfHsxITijuriZxsqZqt', None], n_rows),
+                       'visit_date': rng.choice(['2021-11-01', '2021-12-24', None], n_rows),
+                       'visit_number': rng.integers(1, 100, n_rows),
+                       'hit_number': rng.integers(1, 40_000, n_rows),
+                       # Значения представимы в float32 без потерь, кроме колонки hit_share
+                       'hit_time': np.where(rng.random(n_rows) < 0.1, np.nan, rng.integers(0, 10 ** 6, n_rows) / 4),
+                       'hit_share': rng.random(n_rows)})
+    # Последняя часть при chunksize=333 - одна строка с пропуском категориальной колонки
+    df.loc[n_rows - 1, 'utm_source'] = None
+    df.to_csv(tmp_path / 'ga_sessions.csv', index=False)
+    return str(tmp_path) + os.sep
+
+
+def test_compact_dtypes(source):
+    df = file_load('ga_sessions.csv', data_path=source)
+    assert isinstance(df['utm_source'].dtype, pd.CategoricalDtype)
+    assert df['visit_number'].dtype == np.int8
+    assert df['hit_number'].dtype == np.int32
+    assert df['hit_time'].dtype == np.float32
+    assert df['hit_share'].dtype == np.float64
+
+
+def test_values_match_default_read(source):
+    # Компактные типы не меняют значения колонок относительно pd.read_csv с типами по умолчанию
+    df = file_load('ga_sessions.csv', data_path=source)
+    reference = pd.read_csv(source + 'ga_sessions.csv')
+    assert list(df.columns) == list(reference.columns)
+    for col in reference.columns:
+        pd.testing.assert_series_equal(df[col].astype(reference[col].dtype), reference[col])
+
+
+def test_parse_dates(source):
+    df = file_load('ga_sessions.csv', parse_dates=True, data_path=source)
+    reference = pd.to_datetime(pd.read_csv(source + 'ga_sessions.csv')['visit_date'], format='%Y-%m-%d')
+    pd.testing.assert_series_equal(df['visit_date'], reference, check_dtype=False)
+
+
+@pytest.mark.parametrize('chunksize', [7, 333])
+def test_chunked_matches_whole(source, chunksize):
+    whole = file_load('ga_sessions.csv', data_path=source)
+    chunked = file_load('ga_sessions.csv', chunksize=chunksize, data_path=source)
+    # Категории частей объединяются: колонки category остаются категориальными с теми же значениями
+    assert isinstance(chunked['utm_source'].dtype, pd.CategoricalDtype)
+    pd.testing.assert_frame_equal(chunked, whole, check_dtype=False, check_categorical=False)
@@ -0,0 +1,40 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from package.load_functions import TARGET_ACTIONS, hits_conversion
+
+
+@pytest.fixture
+def hits_path(tmp_path):
+    # События визитов: целевые и прочие действия, пропуски session_id и event_action
+    rng = np.random.default_rng(0)
+    n_rows = 5000
+    actions = sorted(TARGET_ACTIONS)[:3] + ['view_card', 'go_to_car_card', 'quiz_show']
+    df = pd.DataFrame({'session_id': rng.choice([f'{i}.1637{i % 7}.1637{i % 5}' for i in range(800)], n_rows),
+                       'hit_date': '2021-11-01',
+                       'event_action': rng.choice(actions, n_rows, p=[0.02, 0.02, 0.02, 0.34, 0.3, 0.3])})
+    df.loc[rng.random(n_rows) < 0.02, 'session_id'] = None
+    df.loc[rng.random(n_rows) < 0.02, 'event_action'] = None
+    df.to_csv(tmp_path / 'ga_hits.csv', index=False)
+    return str(tmp_path) + os.sep
+
+
+def groupby_conversion(path):
+    # Исходный расчёт: признак целевого действия каждого события и максимум по визиту
+    df_hits = pd.read_csv(path + 'ga_hits.csv', dtype={'session_id': str})
+    df_hits['conversion_rate'] = df_hits['event_action'].isin(TARGET_ACTIONS).astype(int)
+    return df_hits.groupby('session_id').agg({'conversion_rate': 'max'})
+
+
+@pytest.mark.parametrize('chunksize', [7, 333, 1_000_000])
+def test_matches_groupby(hits_path, chunksize):
+    result = hits_conversion('ga_hits.csv', chunksize=chunksize, data_path=hits_path)
+    expected = groupby_conversion(hits_path)
+    assert 0 < expected['conversion_rate'].sum() < len(expected)
+    pd.testing.assert_frame_equal(result, expected, check_dtype=False, check_index_type=False)
@@ -0,0 +1,61 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+import pandas as pd
+import pytest
+from sklearn.impute import SimpleImputer
+
+from package.imputation_functions import ModeImputer
+
+
+@pytest.fixture
+def df():
+    # Частоты значений различаются: самое частое значение определено однозначно
+    rng = np.random.default_rng(0)
+    n_rows = 3000
+    df = pd.DataFrame({'utm_campaign': rng.choice(['LTu', 'gec', 'LEo', None], n_rows, p=[0.5, 0.25, 0.15, 0.1]),
+                       'utm_adcontent': rng.choice(['JNH', 'vCI', None], n_rows, p=[0.6, 0.3, 0.1]),
+                       'device_category': rng.choice(['mobile', 'desktop', 'tablet'], n_rows, p=[0.6, 0.3, 0.1]),
+                       'device_brand': rng.choice(['Apple', 'Samsung', 'Xiaomi', 'nan', None], n_rows,
+                                                  p=[0.3, 0.3, 0.2, 0.1, 0.1])}, dtype=object)
+    # Для планшетов самый частый бренд - Xiaomi (отличается от самого частого бренда колонки)
+    tablet = df['device_category'] == 'tablet'
+    df.loc[tablet & df['device_brand'].notna(), 'device_brand'] = 'Xiaomi'
+    return df
+
+
+def test_matches_simple_imputer(df):
+    columns = ['utm_campaign', 'utm_adcontent']
+    result = ModeImputer(columns=columns).fit_transform(df)
+    expected = SimpleImputer(strategy='most_frequent', missing_values=None).fit_transform(df[columns])
+    np.testing.assert_array_equal(result[columns].to_numpy(dtype=object), expected)
+    # Остальные колонки не меняются, исходный датасет не изменяется
+    pd.testing.assert_frame_equal(result.drop(columns=columns), df.drop(columns=columns))
+    assert df['utm_campaign'].isna().any()
+
+
+def test_matches_describe_top(df):
+    # Исходное заполнение в clean_columns_rows: fillna(describe().top)
+    result = ModeImputer(columns=['utm_campaign']).fit_transform(df)
+    pd.testing.assert_series_equal(result['utm_campaign'], df['utm_campaign'].fillna(df['utm_campaign'].describe().top))
+
+
+def test_group_modes(df):
+    imputer = ModeImputer(columns=['device_brand'], pairs=[('device_category', 'device_brand')]).fit(df)
+    result = imputer.transform(df)
+    # Самое частое дочернее значение по группам родительской колонки без строковых обозначений пропусков
+    known = df[df['device_brand'].notna() & (df['device_brand'] != 'nan')]
+    group_modes = known.groupby('device_category')['device_brand'].agg(lambda x: x.value_counts().index[0])
+    expected = df['device_brand'].fillna(df['device_category'].map(group_modes))
+    pd.testing.assert_series_equal(result['device_brand'], expected)
+    assert (result.loc[df['device_category'] == 'tablet', 'device_brand'] == 'Xiaomi').all()
+
+
+def test_unseen_parent_uses_column_mode(df):
+    imputer = ModeImputer(columns=['device_brand'], pairs=[('device_category', 'device_brand')]).fit(df)
+    new = pd.DataFrame({'device_category': ['smart_tv', 'tablet'], 'device_brand': [None, None]}, dtype=object)
+    # Для родительского значения, которого не было при обучении, используется самое частое значение колонки
+    assert imputer.transform(new)['device_brand'].tolist() == [imputer.modes_['device_brand'], 'Xiaomi']
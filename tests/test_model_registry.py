@@ -0,0 +1,106 @@
+import os
+import sys
+import threading
+
+# Сервис импортируется без загрузки модели: тесты создают собственные реестры моделей
+os.environ['FAST_START'] = '1'
+os.environ['MODEL_ENGINE'] = 'compiled'
+os.environ['MODEL_BUNDLE'] = os.path.join(os.path.dirname(__file__), 'missing_bundle')
+os.environ['MODEL_CHECK_INTERVAL'] = '3600'
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pytest
+
+from main import ModelRegistry
+
+
+def text_loader(path, data):
+    # Модель теста - текст файла; файл с текстом 'corrupt' не загружается (как частично записанный pickle)
+    text = data.decode()
+    if text == 'corrupt':
+        raise ValueError('файл модели повреждён')
+    return {'best_model': text, 'metadata': {'version': text}}
+
+
+def write(path, text):
+    # Файл подменяется атомарно, как при записи модели pipeline.py: после неудачной загрузки реестр повторяет
+    # её в фоне и не должен прочитать частично записанный файл. Время изменения сдвигается явно:
+    # перезапись в тот же момент не меняла бы сигнатуру файла
+    stat = os.stat(path) if os.path.exists(path) else None
+    with open(path + '.tmp', 'w') as file:
+        file.write(text)
+    if stat is not None:
+        os.utime(path + '.tmp', ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000))
+    os.replace(path + '.tmp', path)
+
+
+def wait(registry):
+    if registry._reloader is not None:
+        registry._reloader.join(timeout=10)
+
+
+def reload(registry):
+    # Запрос обнаруживает изменение файла, фоновая загрузка завершается, следующий запрос получает модель
+    # (повторная загрузка, начатая после неудачной загрузки, завершается до проверки)
+    wait(registry)
+    registry.get()
+    wait(registry)
+    return registry.get()
+
+
+@pytest.fixture
+def registry(tmp_path):
+    path = str(tmp_path / 'model.txt')
+    write(path, 'v1')
+    registry = ModelRegistry(path, loader=text_loader, check_interval=0)
+    registry.load()
+    return registry
+
+
+def test_hot_swap(registry):
+    assert registry.get()['best_model'] == 'v1' and registry.version == 1
+    write(registry.path, 'v2')
+    assert reload(registry)['best_model'] == 'v2'
+    assert registry.snapshot() == (registry.get(), 2)
+
+
+def test_same_checksum_not_reloaded(registry):
+    # Файл перезаписан тем же содержимым: сигнатура изменилась, контрольная сумма - нет
+    model = registry.get()
+    write(registry.path, 'v1')
+    assert reload(registry) is model
+    assert registry.version == 1
+
+
+def test_corrupt_file_rejected(registry):
+    model = registry.get()
+    write(registry.path, 'corrupt')
+    assert reload(registry) is model
+    assert registry.version == 1
+    # Записанная затем корректная модель загружается при следующей проверке
+    write(registry.path, 'v2')
+    assert reload(registry)['best_model'] == 'v2'
+    assert registry.version == 2
+
+
+def test_get_does_not_wait_for_reload(tmp_path):
+    loading, release = threading.Event(), threading.Event()
+
+    def slow_loader(path, data):
+        if data == b'v2':
+            loading.set()
+            release.wait(timeout=10)
+        return text_loader(path, data)
+
+    path = str(tmp_path / 'model.txt')
+    write(path, 'v1')
+    registry = ModelRegistry(path, loader=slow_loader, check_interval=0)
+    registry.load()
+    write(path, 'v2')
+    assert registry.get()['best_model'] == 'v1'
+    assert loading.wait(timeout=10)
+    # Пока модель загружается, запросы получают текущую модель
+    assert registry.get()['best_model'] == 'v1'
+    release.set()
+    registry._reloader.join(timeout=10)
+    assert registry.get()['best_model'] == 'v2'
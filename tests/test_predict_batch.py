@@ -0,0 +1,101 @@
+import os
+import sys
+
+# Сервис импортируется без загрузки модели: модель теста подставляется в реестр
+os.environ['FAST_START'] = '1'
+os.environ['MODEL_ENGINE'] = 'compiled'
+os.environ['MODEL_BUNDLE'] = os.path.join(os.path.dirname(__file__), 'missing_bundle')
+os.environ['MODEL_CHECK_INTERVAL'] = '3600'
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+import pytest
+from fastapi.testclient import TestClient
+
+import main
+from package.inference_functions import CompiledModel, FlatForest
+
+
+CAT_FEATURES = ['utm_source', 'utm_medium', 'utm_campaign', 'utm_adcontent', 'utm_keyword',
+                'device_category', 'device_os', 'device_brand', 'device_screen_resolution', 'device_browser',
+                'geo_country', 'geo_city']
+
+
+def make_record(client_id, **fields):
+    record = {'client_id': client_id, 'visit_date': '2021-11-01', 'visit_time': '10:00:00.000000'}
+    record.update({col: 'known' for col in CAT_FEATURES})
+    record.update(fields)
+    return record
+
+
+def make_model():
+    # Лес из одного дерева-листа: вероятность положительного класса 0.75 для любой записи
+    forest = FlatForest.from_trees([{'feature': np.array([0], dtype=np.int32), 'threshold': np.array([0.0]),
+                                     'left': np.array([0], dtype=np.int32), 'right': np.array([0], dtype=np.int32),
+                                     'value': np.array([[0.25, 0.75]]), 'max_depth': 0}])
+    model = CompiledModel(cat_features=CAT_FEATURES,
+                          cat_tables=[{'known': 0.5, 'нет данных': 0.0} for _ in CAT_FEATURES],
+                          cat_mean=np.zeros(len(CAT_FEATURES)), missing_value='нет данных',
+                          flags=[], other_offset=np.zeros(5), other_scale=np.ones(5),
+                          forest=forest, classes=[0, 1], unknown='error')
+    return model
+
+
+@pytest.fixture
+def client():
+    main.registry._model = {'best_model': make_model(), 'metadata': {'version': 'test'}}
+    main.registry.version += 1
+    main.registry.ready = True
+    # Один цикл событий на весь тест: планировщик микропакетов работает в цикле событий клиента
+    with TestClient(main.app) as test_client:
+        yield test_client
+    main.registry.ready = False
+
+
+def test_predict_batch(client):
+    response = client.post('/predict_batch', json=[make_record('a'), make_record('b')])
+    assert response.status_code == 200
+    assert [item['Probability'] for item in response.json()] == [0.75, 0.75]
+
+
+@pytest.mark.parametrize('fields', [{'utm_source': 'unseen'}, {'visit_time': None}])
+def test_predict_batch_bad_record(client, fields):
+    records = [make_record('a'), make_record('b', **fields), make_record('c')]
+    response = client.post('/predict_batch', json=records)
+    assert response.status_code == 422
+    errors = response.json()['detail']
+    assert [(error['index'], error['client_id']) for error in errors] == [(1, 'b')]
+
+
+def test_predict(client):
+    response = client.post('/predict', json=make_record('a'))
+    assert response.status_code == 200
+    assert response.json() == {'Client_id': 'a', 'Result': '1'}
+
+
+@pytest.mark.parametrize('fields', [{'utm_source': 'unseen'}, {'visit_date': None}, {'visit_time': '10:00:00'}])
+def test_predict_bad_record(client, fields):
+    response = client.post('/predict', json=make_record('b', **fields))
+    assert response.status_code == 422
+    assert [(error['index'], error['client_id']) for error in response.json()['detail']] == [(0, 'b')]
+
+
+def test_cached_record_keeps_validation(client):
+    # Запись в допустимом формате кэшируется; та же запись со временем без долей секунды
+    # отклоняется моделью и не должна получать предсказание из кэша
+    assert client.post('/predict_batch', json=[make_record('a')]).status_code == 200
+    response = client.post('/predict_batch', json=[make_record('b', visit_time='10:00:00')])
+    assert response.status_code == 422
+
+
+@pytest.mark.parametrize('fields', [{'visit_time': '10:00:00'}, {'visit_time': '24:00:00.0'}, {'visit_time': ''},
+                                    {'visit_date': '2021-02-30'}, {'visit_date': '01.11.2021'}])
+def test_compiled_model_rejects_pipeline_formats(fields):
+    # Компилированная модель отклоняет те же значения даты и времени, что и разбор pipeline
+    with pytest.raises(ValueError):
+        make_model().predict_proba([make_record('a', **fields)])
+
+
+@pytest.mark.parametrize('fields', [{}, {'visit_time': '9:5:3.1'}, {'visit_date': '2021-1-5'}])
+def test_compiled_model_accepts_pipeline_formats(fields):
+    assert make_model().predict_proba([make_record('a', **fields)])[0, 1] == 0.75
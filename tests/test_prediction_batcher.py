@@ -0,0 +1,99 @@
+import os
+import sys
+import asyncio
+
+# Сервис импортируется без загрузки модели: планировщик получает модель теста из собственного реестра
+os.environ['FAST_START'] = '1'
+os.environ['MODEL_ENGINE'] = 'compiled'
+os.environ['MODEL_BUNDLE'] = os.path.join(os.path.dirname(__file__), 'missing_bundle')
+os.environ['MODEL_CHECK_INTERVAL'] = '3600'
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import main
+
+
+class HourModel:
+    # Модель теста: вероятность положительного класса - час визита / 100;
+    # запись с utm_source 'bad' вызывает ошибку модели (как неизвестная категория)
+    classes_ = np.array([0, 1])
+
+    def __init__(self):
+        self.calls = []
+
+    def predict_proba(self, df):
+        self.calls.append(len(df))
+        if (df['utm_source'] == 'bad').any():
+            raise ValueError("Found unknown categories ['bad'] in column 0")
+        proba = df['visit_time'].str[:2].astype(int).to_numpy() / 100
+        return np.column_stack([1 - proba, proba])
+
+
+class StaticRegistry:
+    def __init__(self, model):
+        self.model = {'best_model': model, 'metadata': {'version': 'test'}}
+
+    def snapshot(self):
+        return self.model, 1
+
+
+def make_record(hour, utm_source='known'):
+    return {'client_id': str(hour), 'visit_date': '2021-11-01', 'visit_time': f'{hour:02d}:00:00.000000',
+            'utm_source': utm_source}
+
+
+def predict_all(batcher, records):
+    # Все записи ставятся в очередь одновременно, как одиночные запросы /predict
+    async def gather():
+        return await asyncio.gather(*(batcher.predict(record) for record in records), return_exceptions=True)
+    return asyncio.run(gather())
+
+
+@pytest.fixture(autouse=True)
+def no_cache(monkeypatch):
+    # Кэш предсказаний сервиса выключен: каждый пакет доходит до модели
+    monkeypatch.setattr(main, 'cache', None)
+
+
+def test_concurrent_requests_coalesced():
+    model = HourModel()
+    batcher = main.PredictionBatcher(StaticRegistry(model), window_ms=50, max_batch_size=64)
+    results = predict_all(batcher, [make_record(hour) for hour in range(10)])
+    assert model.calls == [10]
+    assert dict(batcher.batch_sizes) == {10: 1}
+    # Каждый запрос получает предсказание по своей записи
+    assert [proba for _, proba in results] == pytest.approx([hour / 100 for hour in range(10)])
+
+
+def test_batch_size_limit():
+    model = HourModel()
+    batcher = main.PredictionBatcher(StaticRegistry(model), window_ms=50, max_batch_size=4)
+    results = predict_all(batcher, [make_record(hour) for hour in range(10)])
+    assert model.calls == [4, 4, 2]
+    assert [proba for _, proba in results] == pytest.approx([hour / 100 for hour in range(10)])
+
+
+def test_record_error_propagated():
+    # Ошибка модели на одной записи передаётся только её запросу, остальные запросы пакета получают предсказания
+    batcher = main.PredictionBatcher(StaticRegistry(HourModel()), window_ms=50, max_batch_size=64)
+    records = [make_record(hour) for hour in range(5)]
+    records[2] = make_record(2, utm_source='bad')
+    results = predict_all(batcher, records)
+    assert isinstance(results[2], main.RecordError)
+    assert 'bad' in str(results[2])
+    assert [results[i][1] for i in (0, 1, 3, 4)] == pytest.approx([0.0, 0.01, 0.03, 0.04])
+
+
+def test_invalid_visit_time_propagated():
+    model = HourModel()
+    batcher = main.PredictionBatcher(StaticRegistry(model), window_ms=50, max_batch_size=64)
+    records = [make_record(hour) for hour in range(3)]
+    records[1]['visit_time'] = '01:00:00'
+    results = predict_all(batcher, records)
+    assert isinstance(results[1], main.RecordError)
+    # Запись с некорректным временем отклоняется до вызова модели
+    assert model.calls == [2]
+    assert [results[i][1] for i in (0, 2)] == pytest.approx([0.0, 0.02])
@@ -0,0 +1,117 @@
+import os
+import sys
+
+# Сервис импортируется без загрузки модели: тесты создают собственные кэши предсказаний
+os.environ['FAST_START'] = '1'
+os.environ['MODEL_ENGINE'] = 'compiled'
+os.environ['MODEL_BUNDLE'] = os.path.join(os.path.dirname(__file__), 'missing_bundle')
+os.environ['MODEL_CHECK_INTERVAL'] = '3600'
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+import pytest
+
+import main
+from main import PredictionCache
+
+
+class Clock:
+    # Часы теста вместо модуля time в main: время кэша сдвигается вручную
+    now = 1000.0
+
+    @classmethod
+    def monotonic(cls):
+        return cls.now
+
+    @classmethod
+    def perf_counter(cls):
+        return cls.now
+
+
+class CountingModel:
+    # Модель теста считает записи, для которых вызывалась; вероятность - 0.75 для любой записи
+    classes_ = np.array([0, 1])
+
+    def __init__(self):
+        self.records = 0
+
+    def predict_proba(self, df):
+        self.records += len(df)
+        return np.tile([0.25, 0.75], (len(df), 1))
+
+
+def make_record(client_id='a', **fields):
+    record = {field: 'known' for field in PredictionCache.KEY_FIELDS}
+    record.update({'client_id': client_id, 'visit_date': '2021-11-01', 'visit_time': '10:00:00.000000'})
+    record.update(fields)
+    return record
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    monkeypatch.setattr(Clock, 'now', 1000.0)
+    monkeypatch.setattr(main, 'time', Clock)
+    return Clock
+
+
+def test_key_normalization():
+    key = PredictionCache.key(make_record())
+    # client_id в ключ не входит, дата и время в разной записи дают один ключ, минуты и секунды не учитываются
+    assert PredictionCache.key(make_record('b')) == key
+    assert PredictionCache.key(make_record(visit_date='2021-11-1', visit_time='10:5:3.1')) == key
+    assert PredictionCache.key(make_record(visit_time='11:00:00.000000')) != key
+    assert PredictionCache.key(make_record(visit_time='10:00:00')) is None
+    assert PredictionCache.key(make_record(visit_date=None)) is None
+
+
+def test_ttl(clock):
+    cache = PredictionCache(ttl=10)
+    key = PredictionCache.key(make_record())
+    assert cache.get_many([key], 1) == [None]
+    cache.put_many([(key, (1, 0.75))], 1)
+    clock.now += 5
+    assert cache.get_many([key], 1) == [(1, 0.75)]
+    clock.now += 6
+    assert cache.get_many([key], 1) == [None]
+    assert cache.metrics()['expirations'] == 1
+    assert cache.metrics()['entries'] == 0
+
+
+def test_invalidation_on_model_swap():
+    cache = PredictionCache()
+    key = PredictionCache.key(make_record())
+    cache.get_many([key], 1)
+    cache.put_many([(key, (1, 0.75))], 1)
+    assert cache.get_many([key], 1) == [(1, 0.75)]
+    # Новая версия модели очищает кэш; предсказание, посчитанное старой моделью после смены версии, не сохраняется
+    assert cache.get_many([key], 2) == [None]
+    cache.put_many([(key, (1, 0.75))], 1)
+    assert cache.get_many([key], 2) == [None]
+    assert cache.metrics()['invalidations'] == 1
+
+
+def test_lru_eviction():
+    cache = PredictionCache(max_entries=2)
+    keys = [PredictionCache.key(make_record(utm_source=source)) for source in 'abc']
+    cache.get_many(keys, 1)
+    cache.put_many([(keys[0], (1, 0.1)), (keys[1], (1, 0.2))], 1)
+    # Обращение к первой записи делает вытесняемой вторую
+    cache.get_many([keys[0]], 1)
+    cache.put_many([(keys[2], (1, 0.3))], 1)
+    assert cache.get_many(keys, 1) == [(1, 0.1), None, (1, 0.3)]
+    assert cache.metrics()['evictions'] == 1
+
+
+def test_predict_cached(monkeypatch):
+    monkeypatch.setattr(main, 'cache', PredictionCache())
+    model = CountingModel()
+    registry_model = {'best_model': model, 'metadata': {'version': 'test'}}
+    records = [make_record('a'), make_record('b'), make_record('c', utm_source='other')]
+    # Повторяющиеся в пакете записи модель считает один раз, повторный пакет берётся из кэша
+    y, proba = main.predict_cached(registry_model, 1, records)
+    assert list(proba) == [0.75, 0.75, 0.75] and model.records == 2
+    main.predict_cached(registry_model, 1, records)
+    assert model.records == 2
+    # После смены версии модели записи считаются заново
+    main.predict_cached(registry_model, 2, records)
+    assert model.records == 4
@@ -0,0 +1,57 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from package.preparation_functions import checking_type_error
+
+
+def reference_types(df):
+    # Исходная проверка: тип каждого заполненного значения, поле с несколькими типами считается ошибочным
+    reference = {}
+    for col in df.columns:
+        types = df[col].dropna().apply(lambda x: type(x)).value_counts()
+        if len(types) > 1:
+            reference[col] = {value_type.__name__: int(count) for value_type, count in types.items()}
+    return reference
+
+
+@pytest.fixture
+def df():
+    # Колонки object, как при чтении CSV со смешанными значениями (строки pandas иначе получают тип str)
+    rng = np.random.default_rng(0)
+    n_rows = 2000
+    strings = rng.choice(['a', 'b', 'c'], n_rows).tolist()
+    numbers = rng.random(n_rows).tolist()
+    integers = rng.integers(0, 100, n_rows).tolist()
+    df = pd.DataFrame({
+        # Числа и строки, как client_id в ga_sessions.csv
+        'str_float': [x * 1e9 if x < 0.5 else s for x, s in zip(numbers, strings)],
+        'str_int': [i if x < 0.3 else s for x, i, s in zip(numbers, integers, strings)],
+        'int_float': [i if x < 0.5 else x for x, i in zip(numbers, integers)],
+        'str_only': strings,
+        # Одно число в колонке строк находится, даже если не попало в выборку значений (проверка всей колонки)
+        'rare_int': strings[:-1] + [7]}, dtype=object)
+    df['numbers'] = numbers
+    df['category'] = pd.Categorical(strings)
+    missing = rng.random(n_rows) < 0.1
+    df.loc[missing, 'str_float'] = np.nan
+    df.loc[missing, 'str_only'] = np.nan
+    return df
+
+
+def test_matches_row_types(df):
+    report = checking_type_error(df, sample_size=100)
+    assert {col: item['types'] for col, item in report.items()} == reference_types(df)
+    assert set(report) == {'str_float', 'str_int', 'int_float', 'rare_int'}
+    # Пропуски считаются отдельно и не делают колонку строк колонкой разных типов
+    assert report['str_float']['missing'] == df['str_float'].isna().sum()
+    assert report['rare_int']['types'] == {'str': len(df) - 1, 'int': 1}
+
+
+def test_processes(df):
+    assert checking_type_error(df, processes=2, sample_size=100) == checking_type_error(df, sample_size=100)
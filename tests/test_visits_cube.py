@@ -0,0 +1,65 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from package.preparation_functions import CUBE_STRUCTURE, CUBE_TIME, cube_charts, cube_marginals, visits_cube
+
+
+def reference_aggregation(df):
+    # Исходная агрегация agg_changes: первый визит и значения атрибутов клиента, затем отдельная группировка
+    # по каждому измерению
+    ag_dict = {'client_id': 'max', 'visit_date': 'min', 'visit_time': 'min',
+               'geo_country': 'max', 'geo_city': 'max',
+               'device_category': 'max', 'device_browser': 'max',
+               'utm_source': 'max', 'utm_medium': 'max'}
+    df_ag = df.assign(client=df['client_id']).groupby('client').agg(ag_dict)
+    df_ag['year-month'] = df_ag['visit_date'].dt.strftime('%Y-%m')
+    df_ag['dayOFmonth'] = df_ag['visit_date'].dt.strftime('%d')
+    df_ag['dayOFweek'] = df_ag['visit_date'].dt.strftime('%w')
+    df_ag['hourOFday'] = df_ag['visit_time'].dt.seconds // 3600
+    return {name: df_ag.groupby(name).agg({'client_id': 'count'})['client_id']
+            for name in [name for name, _ in CUBE_TIME] + [name for name, _, _ in CUBE_STRUCTURE]}
+
+
+@pytest.fixture
+def df():
+    # Визиты клиентов за два месяца; у части клиентов несколько визитов, в атрибутах есть пропуски
+    rng = np.random.default_rng(0)
+    n_rows = 6000
+    df = pd.DataFrame({'client_id': rng.integers(0, 2500, n_rows).astype(str),
+                       'visit_date': pd.to_datetime('2021-11-20') + pd.to_timedelta(rng.integers(0, 40, n_rows), 'D'),
+                       'visit_time': pd.to_timedelta(rng.integers(0, 24 * 3600, n_rows), 's')})
+    values = {'geo_country': ['Russia', 'Belarus', 'Ukraine'], 'geo_city': ['Moscow', 'Saint Petersburg', 'Kazan'],
+              'device_category': ['mobile', 'desktop', 'tablet'], 'device_browser': ['Chrome', 'Safari', 'Opera'],
+              'utm_source': ['ZpYIoDJMcFzVoPFsHGJL', 'MvfHsxITijuriZxsqZqt'], 'utm_medium': ['banner', 'cpc', 'cpm']}
+    for col, options in values.items():
+        df[col] = rng.choice(options + [None], n_rows, p=[0.9 / len(options)] * len(options) + [0.1])
+    return df
+
+
+def test_marginals_match_reference(df):
+    cube = visits_cube(df)
+    assert cube['clients'].sum() == df['client_id'].nunique()
+    marginals = cube_marginals(cube)
+    for name, expected in reference_aggregation(df).items():
+        assert marginals[name].to_dict() == expected.to_dict(), name
+
+
+def test_charts_match_reference(df):
+    reference = reference_aggregation(df)
+    charts = cube_charts(visits_cube(df))
+    # Графики времени - таблицы количества клиентов в порядке значений измерения
+    for (frame, title), (name, expected_title) in zip(charts, CUBE_TIME):
+        assert title == expected_title
+        assert frame.index.tolist() == reference[name].index.tolist()
+        assert frame['client_id'].tolist() == reference[name].tolist()
+    # Графики структуры - значения с наибольшим количеством клиентов
+    for ((labels, counts), title), (name, expected_title, top) in zip(charts[len(CUBE_TIME):], CUBE_STRUCTURE):
+        expected = reference[name].sort_values(ascending=False)[:top]
+        assert title == expected_title
+        assert dict(zip(labels, counts)) == expected.to_dict()